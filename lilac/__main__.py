@@ -1,8 +1,8 @@
 import os
 import argparse
 
-from lilac.utils import print_error
-from lilac.inferWorker import AzureInferWorker
+from lilac.utils import Config, print_error
+from lilac.inferWorker import AzureInferWorker, list_resource_groups
 from lilac.ruleExtractor import AzureRuleExtractor
 
 if __name__ == "__main__":
@@ -32,6 +32,11 @@ if __name__ == "__main__":
         action="store_true",
         help="Lift the infrastructure based on extracted rules",
     )
+    mode.add_argument(
+        "--compile-rules",
+        action="store_true",
+        help="Compile extracted rules into a snapshot for fast lifting startup",
+    )
 
     parser.add_argument(
         "-t",
@@ -57,16 +62,93 @@ if __name__ == "__main__":
     parser.add_argument(
         "-g",
         "--resource-group",
-        help="Name of Azure resource group to be lifted",
+        nargs="+",
+        help="Names of Azure resource groups to be lifted, or `all` for the whole subscription",
     )
 
     parser.add_argument(
         "-s",
         "--save-path",
-        help="Path to save the lifted Terraform file of the resource group",
+        help="Path to save the lifted Terraform file of the resource group, "
+        "a directory of <group>.tf files when lifting several groups",
+    )
+
+    parser.add_argument(
+        "--only-types",
+        nargs="+",
+        help="Only lift these Terraform types, skipping API calls they do not need",
+    )
+
+    parser.add_argument(
+        "--plan-only",
+        action="store_true",
+        help="With --lift, only print the planned API calls and their estimated cost "
+        "after discovering the top-level resources, without running other APIs",
+    )
+
+    parser.add_argument(
+        "--import-blocks",
+        action="store_true",
+        help="Write Terraform import blocks and a JSON-lines inventory of the lifted "
+        "instances while lifting, instead of resource stubs",
+    )
+
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Lift again from the state of the previous lift, revalidating calls "
+        "bound with unchanged records instead of running them, keeping the names of "
+        "resources, and write the added and removed resources as a diff",
+    )
+
+    parser.add_argument(
+        "--journal",
+        action="store_true",
+        help="Journal the completed API calls of the lift, so that it can be resumed "
+        "if interrupted",
+    )
+
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue an interrupted lift from its journal without repeating "
+        "the completed API calls, and keep journaling it",
+    )
+
+    parser.add_argument(
+        "-j",
+        "--max-concurrency",
+        type=int,
+        help="Maximum number of cloud API calls running at the same time during lifting",
+    )
+
+    parser.add_argument(
+        "--discovery",
+        choices=["resource-list", "graph"],
+        help="How to discover top-level Azure resources, overrides azure_discovery",
+    )
+
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Bypass the shared cloud CLI response cache, "
+        "lifting bypasses it unless lift_cloud_cache is enabled",
+    )
+
+    parser.add_argument(
+        "--query-backend",
+        choices=["subprocess", "resident"],
+        help="Backend running cloud CLI commands, overrides cloud_query_backend",
     )
 
     args = parser.parse_args()
+    if args.no_cache or (args.lift and not Config["lift_cloud_cache"]):
+        Config["cloud_cache_enabled"] = False
+    if args.query_backend:
+        Config["cloud_query_backend"] = args.query_backend
+    if args.max_concurrency:
+        # also bounds the concurrency of each throttling scope of the query backend
+        Config["lift_max_concurrency"] = args.max_concurrency
 
     if args.query:
         if args.test_dir:
@@ -76,9 +158,10 @@ if __name__ == "__main__":
         else:
             print_error("[WARNNING] No test directory provided")
 
-    elif args.lift:
+    else:
         if args.rule_dir:
-            rule_dirs = [os.path.join("test", d) for d in args.rule_dir]
+            # names of directories under test/, joined with it below
+            rule_dirs = args.rule_dir
 
         else:
             print_error(
@@ -95,17 +178,75 @@ if __name__ == "__main__":
             if f.endswith(".json")
         ]
 
+    if args.compile_rules:
+        # rule compilation does not lift any resource group
+        inferController = AzureInferWorker("")
+        inferController.compile_infer_rules(rule_files, Config["rule_snapshot_path"])
+
+    elif args.lift:
         if args.resource_group:
-            inferController = AzureInferWorker(args.resource_group)
-            inferController.prepare_infer_rules(rule_files)
-            inferController.lifting_inference()
-
-            save_path = args.save_path
-            if not save_path:
-                print_error(
-                    "[WARNNING] No save path provided, default to output/lifted.tf"
+            group_names = args.resource_group
+            if group_names == ["all"]:
+                group_names = list_resource_groups()
+
+            # one worker per resource group, sharing the rules and API results
+            infer_rule, ledger, rule_loader = None, None, None
+            for group_name in group_names:
+                inferController = AzureInferWorker(
+                    group_name,
+                    max_concurrency=args.max_concurrency,
+                    discovery=args.discovery,
+                    group_names=group_names,
+                    infer_rule=infer_rule,
+                    ledger=ledger,
+                    rule_loader=rule_loader,
                 )
-                save_path = os.path.join("output", "lifted.tf")
-            inferController.save_lifted_instances(save_path)
+                if infer_rule is None:
+                    inferController.prepare_infer_rules(
+                        rule_files, Config["rule_snapshot_path"]
+                    )
+                    infer_rule = inferController.infer_rule
+                    ledger = inferController.ledger
+                    rule_loader = inferController.rule_loader
+                if args.plan_only:
+                    inferController.plan_inference(only_types=args.only_types)
+                    continue
+                if args.incremental:
+                    inferController.load_state(
+                        os.path.join(Config["lift_state_dir"], f"{group_name}.json")
+                    )
+
+                save_path = args.save_path
+                if len(group_names) > 1:
+                    save_dir = save_path or "output"
+                    os.makedirs(save_dir, exist_ok=True)
+                    save_path = os.path.join(save_dir, f"{group_name}.tf")
+                elif not save_path:
+                    print_error(
+                        "[WARNNING] No save path provided, default to output/lifted.tf"
+                    )
+                    save_path = os.path.join("output", "lifted.tf")
+
+                if args.journal or args.resume:
+                    inferController.open_journal(
+                        os.path.join(Config["lift_journal_dir"], f"{group_name}.jsonl"),
+                        resume=args.resume,
+                    )
+                if args.import_blocks:
+                    inferController.open_import_stream(save_path)
+                try:
+                    inferController.lifting_inference(only_types=args.only_types)
+                finally:
+                    inferController.close_import_stream()
+                    inferController.close_journal()
+
+                if args.import_blocks:
+                    inferController.print_instances()
+                else:
+                    inferController.save_lifted_instances(save_path)
+                if args.incremental:
+                    inferController.print_diff(
+                        os.path.splitext(save_path)[0] + ".diff.jsonl"
+                    )
         else:
             print_error("[WARNNING] No resource group provided")
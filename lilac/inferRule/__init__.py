@@ -1,6 +1,18 @@
 from .base import InferRule, InferAPIArg
 from .azure import AzureIDType, AzureIDSchema, AzureResponseInfo
 from .google import GoogleIDType, GoogleIDSchema, GoogleResponseInfo
+from .jsonpath import build_pruner, build_projection, reads_list_items
+from .snapshot import (
+    RuleManifest,
+    RuleSnapshot,
+    LazyRuleLoader,
+    open_snapshot,
+    load_fragments,
+    load_infer_rule,
+    merge_fragments,
+    compile_rule_file,
+    write_rule_snapshot,
+)
 
 __all__ = [
     "InferRule",
@@ -11,4 +23,16 @@ __all__ = [
     "GoogleIDSchema",
     "GoogleResponseInfo",
     "GoogleIDType",
+    "RuleSnapshot",
+    "RuleManifest",
+    "LazyRuleLoader",
+    "open_snapshot",
+    "load_fragments",
+    "merge_fragments",
+    "load_infer_rule",
+    "compile_rule_file",
+    "write_rule_snapshot",
+    "build_pruner",
+    "build_projection",
+    "reads_list_items",
 ]
@@ -5,6 +5,8 @@ from tabulate import tabulate
 
 from lilac.queryRule import QueryRule
 
+from .jsonpath import SchemaExtractor
+
 InferAPIArg = namedtuple("InferAPIArg", ["api_call", "arg_name"])
 
 
@@ -19,6 +21,16 @@ class ResponseInfo:
         self.schema_map = defaultdict(set)
         self.apiarg_schemas = set()  # set of InferAPIArg that can be infered
         self.tftypes_schemas = set()  # set of IDSchema that can be infered
+        self.extractor = None  # SchemaExtractor compiled from schema_map
+
+    def get_extractor(self) -> SchemaExtractor:
+        """
+        Return the jsonpaths of schema_map compiled for extraction.
+        Schemas are only added while loading rules, so compile again only if it grew.
+        """
+        if self.extractor is None or len(self.extractor) != len(self.schema_map):
+            self.extractor = SchemaExtractor(self.schema_map)
+        return self.extractor
 
     def add_id_schema(self):
         raise NotImplementedError
@@ -28,20 +40,60 @@ class ResponseInfo:
         self.schema_map[schema].add(InferAPIArg(api_call, arg_name))
         self.apiarg_schemas.add(InferAPIArg(api_call, arg_name))
 
+    def merge(self, other: "ResponseInfo"):
+        for schema, schemas in other.schema_map.items():
+            self.schema_map[schema].update(schemas)
+        self.apiarg_schemas.update(other.apiarg_schemas)
+        self.tftypes_schemas.update(other.tftypes_schemas)
+
     def __str__(self) -> str:
         return self.__str__
 
 
+class CloudTypeIndex:
+    """
+    Case-folded cloud types in a prefix tree of their `/` separated segments,
+    e.g. microsoft.network -> virtualnetworks -> subnets.
+    Every node keeps the values of its whole subtree, so a lookup takes O(segments).
+    """
+
+    def __init__(self):
+        self.children = {}  # key: segment, value: CloudTypeIndex
+        self.values = set()  # values of this cloud type and its descendants
+        self.exact_values = set()  # values of this cloud type only
+
+    def add(self, cloud_type: str, value):
+        node = self
+        for segment in cloud_type.lower().split("/"):
+            node = node.children.setdefault(segment, CloudTypeIndex())
+            node.values.add(value)
+        node.exact_values.add(value)
+
+    def get(self, cloud_type: str, children=True) -> set:
+        """
+        Return the values of the cloud type, and of its child types if `children`.
+        """
+        node = self
+        for segment in cloud_type.lower().split("/"):
+            node = node.children.get(segment)
+            if node is None:
+                return set()
+        return node.values if children else node.exact_values
+
+
 class InferRule:
     """
     The knowledge base that collects the global inference rules
     """
 
     def __init__(self, responseInfo_type):
+        self.responseInfo_type = responseInfo_type
         # key: api_call, value: ResponseInfo
         self.api_response_map = defaultdict(responseInfo_type)
         # key: cloud_type, value: set of api_call
         self.cloudtype_api_map = defaultdict(set)
+        # cloud_type -> api_call, for lookups of a type with its child types
+        self.cloudtype_index = CloudTypeIndex()
         # key: api_call, value: set of relevant api_call
         # response of key api_call can be used as arguments of value api_call
         self.relevant_api_map = defaultdict(set)
@@ -64,6 +116,10 @@ class InferRule:
         api_call_infos = [i for round_list in query_rule.api_chain for i in round_list]
         for api_call_info in api_call_infos:
             self.cloudtype_api_map[api_call_info.cloud_type].add(api_call_info.api_call)
+            if api_call_info.cloud_type:
+                self.cloudtype_index.add(
+                    api_call_info.cloud_type, api_call_info.api_call
+                )
             for arg in api_call_info.args:
                 self.api_args_map[api_call_info.api_call].add(arg.name)
                 for schema in arg.schema_list:
@@ -73,18 +129,34 @@ class InferRule:
                     # schema-api_call response contains arguments for this api_call
                     self.relevant_api_map[schema.api_call].add(api_call_info.api_call)
 
+    def merge(self, other: "InferRule"):
+        """
+        Extend the knowledge base with another one, e.g. compiled from a single rule file.
+        Merging the InferRules of rule files is the same as adding their query rules in order.
+        """
+        for api_call, response_info in other.api_response_map.items():
+            self.api_response_map[api_call].merge(response_info)
+        for cloud_type, api_calls in other.cloudtype_api_map.items():
+            self.cloudtype_api_map[cloud_type].update(api_calls)
+            if cloud_type:
+                for api_call in api_calls:
+                    self.cloudtype_index.add(cloud_type, api_call)
+        for api_call, relevant_apis in other.relevant_api_map.items():
+            self.relevant_api_map[api_call].update(relevant_apis)
+        for api_call, arg_names in other.api_args_map.items():
+            self.api_args_map[api_call].update(arg_names)
+        for tftype, components in other.tfid_components.items():
+            self.tfid_components[tftype].update(components)
+
     def get_id_components(self, tf_type: str) -> set:
         return self.tfid_components[tf_type]
 
     def get_response_info(self, api_call: str) -> ResponseInfo:
         return self.api_response_map[api_call]
 
-    def get_cloudtype_apis(self, cloud_type: str) -> set:
-        # some cloud types are not case-sensitive
-        for k in self.cloudtype_api_map.keys():
-            if cloud_type.lower() in k.lower():
-                return self.cloudtype_api_map[k]
-        return set()
+    def get_cloudtype_apis(self, cloud_type: str, children=True) -> set:
+        # some cloud types are not case-sensitive, child types are applicable as well
+        return self.cloudtype_index.get(cloud_type, children)
 
     def get_relevant_apis(self, api_call: str) -> set:
         return self.relevant_api_map[api_call]
@@ -92,6 +164,46 @@ class InferRule:
     def get_required_args(self, api_call: str) -> set:
         return self.api_args_map[api_call]
 
+    def get_reachable_apis(self, api_calls) -> set:
+        """
+        Forward reachability: APIs that can be scheduled after `api_calls` ran.
+        """
+        reachable, frontier = set(), list(api_calls)
+        while frontier:
+            api_call = frontier.pop()
+            if api_call in reachable:
+                continue
+            reachable.add(api_call)
+            frontier.extend(self.relevant_api_map.get(api_call, set()) - reachable)
+        return reachable
+
+    def get_contributing_apis(self, tftypes=None) -> set:
+        """
+        Backward reachability from the ID schemas of `tftypes`, all TF types if None.
+        Return APIs whose response provides IDs of the TF types,
+        or arguments of other contributing APIs.
+        """
+        targets = set(self.tfid_components) if tftypes is None else set(tftypes)
+        # key: api_call, value: set of api_call whose response provides its arguments
+        producers = defaultdict(set)
+        for api_call, relevant_apis in self.relevant_api_map.items():
+            for relevant_api in relevant_apis:
+                producers[relevant_api].add(api_call)
+
+        frontier = [
+            api_call
+            for api_call, response_info in self.api_response_map.items()
+            if any(schema.tftype in targets for schema in response_info.tftypes_schemas)
+        ]
+        contributing = set()
+        while frontier:
+            api_call = frontier.pop()
+            if api_call in contributing:
+                continue
+            contributing.add(api_call)
+            frontier.extend(producers[api_call] - contributing)
+        return contributing
+
     def __str__(self) -> str:
         ret = "==========Inference Rule==========\n"
 
@@ -0,0 +1,242 @@
+import re
+import json
+
+from jsonpath_ng import parse
+
+# a step of a compiled path: WILDCARD for `[*]`, otherwise a field name
+WILDCARD = None
+
+STEP_RE = re.compile(r"\[\*\]|\.(@?[a-zA-Z_][a-zA-Z0-9_@\-]*)")
+# field names jsonpath_ng reads as operators
+RESERVED_FIELDS = {"where", "wherenot", "when", "or", "and"}
+
+
+def compile_path(expr: str):
+    """
+    Compile a jsonpath of the `$[*].a.b[*].c` grammar produced by `process_schema`.
+    Return the tuple of steps, or None if the path is outside of the grammar.
+    """
+    if not expr.startswith("$"):
+        return None
+    steps, pos = [], 1
+    while pos < len(expr):
+        match = STEP_RE.match(expr, pos)
+        if not match:
+            return None
+        field = match.group(1)
+        if field in RESERVED_FIELDS:
+            return None
+        steps.append(field)
+        pos = match.end()
+    return tuple(steps)
+
+
+def _step(step, value) -> list:
+    """
+    Apply one step to a value, following the matching rules of jsonpath_ng.
+    """
+    if step is WILDCARD:
+        if value is None:
+            return []
+        # jsonpath_ng treats a single object as a one-element list
+        if isinstance(value, (dict, int, float, str, bool)):
+            return [value]
+        return value if isinstance(value, list) else []
+    if isinstance(value, dict) and step in value:
+        return [value[step]]
+    return []
+
+
+class TrieNode:
+    def __init__(self):
+        self.children = {}  # key: step, value: TrieNode
+        self.exprs = []  # paths ending at this node
+
+
+def reads_list_items(exprs) -> bool:
+    """
+    Return True if every jsonpath reads the items of a top-level list.
+    """
+    exprs = list(exprs)
+    return bool(exprs) and all(
+        (compile_path(expr) or (0,))[0] is WILDCARD for expr in exprs
+    )
+
+
+def _build_item_trie(exprs, fields=()):
+    """
+    Trie of the paths the jsonpaths of a list response read in each of its items.
+    Return None if the jsonpaths need whole items or are outside of the grammar.
+    """
+    root = TrieNode()
+    for expr in exprs:
+        steps = compile_path(expr)
+        if not steps or steps[0] is not WILDCARD:
+            return None
+        node = root
+        for step in steps:
+            node = node.children.setdefault(step, TrieNode())
+        node.exprs.append(expr)
+    item = root.children.get(WILDCARD)
+    if item is None or item.exprs:
+        return None
+    for field in fields:
+        item.children.setdefault(field, TrieNode()).exprs.append(field)
+    return item
+
+
+def build_projection(exprs, fields=()):
+    """
+    Build a JMESPath expression keeping only the values the jsonpaths of a list
+    response read, in the same shape so that the jsonpaths still apply.
+    Values read by nested wildcards are kept whole.
+    @param fields: fields kept in every item of the list as well
+    Return None if the jsonpaths need whole items or are outside of the grammar.
+    """
+    item = _build_item_trie(exprs, fields)
+    if item is None:
+        return None
+    projection = _project(item)
+    return None if projection == "@" else "[*]" + _chain(projection)
+
+
+def build_pruner(exprs, fields=()):
+    """
+    Like `build_projection`, build a function applying the projection locally
+    to an item of the list, e.g. as the items of an output are parsed.
+    Nested wildcards are pruned as well, reading single objects like the jsonpaths.
+    Return None if the jsonpaths need whole items or are outside of the grammar.
+    """
+    item = _build_item_trie(exprs, fields)
+    if item is None:
+        return None
+    return lambda record: _prune(item, record)
+
+
+def _project(node: TrieNode) -> str:
+    """
+    JMESPath expression of the current value keeping the paths below the node.
+    """
+    if node.exprs or not node.children:
+        return "@"
+    if WILDCARD in node.children:
+        # a nested value may be a list or a single object, which the jsonpaths read
+        # as a one-element list but JMESPath projects to null, it is kept whole
+        return "@"
+    pairs = [
+        f"{json.dumps(field)}: {json.dumps(field)}{_chain(_project(child))}"
+        for field, child in sorted(node.children.items())
+    ]
+    return "{" + ", ".join(pairs) + "}"
+
+
+def _prune(node: TrieNode, value):
+    """
+    The current value keeping the paths below the node, None if none of them match.
+    """
+    if node.exprs or not node.children:
+        return value
+    if WILDCARD in node.children:
+        if len(node.children) > 1:
+            return value
+        child = node.children[WILDCARD]
+        if isinstance(value, list):
+            return [_prune(child, item) for item in value]
+        # a single value is read as a one-element list
+        return _prune(child, value)
+    if not isinstance(value, dict):
+        return None
+    return {
+        field: _prune(child, value[field])
+        for field, child in node.children.items()
+        if field in value
+    }
+
+
+def _chain(expr: str) -> str:
+    if expr == "@":
+        return ""
+    return expr if expr.startswith("[") else f".{expr}"
+
+
+class SchemaExtractor:
+    """
+    Jsonpaths compiled into a trie of shared prefixes,
+    so that all of them are extracted in a single traversal of a response.
+    Paths outside of the grammar fall back to jsonpath_ng, parsed only once.
+    """
+
+    def __init__(self, exprs):
+        self.exprs = list(exprs)
+        self.root = TrieNode()
+        self.fallbacks = {}  # key: jsonpath, value: parsed jsonpath_ng expression
+        for expr in self.exprs:
+            steps = compile_path(expr)
+            if steps is None:
+                self.fallbacks[expr] = parse(expr)
+                continue
+            node = self.root
+            for step in steps:
+                node = node.children.setdefault(step, TrieNode())
+            node.exprs.append(expr)
+
+    def find(self, response) -> dict:
+        """
+        Return the matched values of every jsonpath in the response,
+        in document order like jsonpath_ng.
+        """
+        matches = {expr: [] for expr in self.exprs}
+        self._visit(self.root, response, matches)
+        for expr, jsonpath_expr in self.fallbacks.items():
+            matches[expr] = [match.value for match in jsonpath_expr.find(response)]
+        return matches
+
+    def find_records(self, response, offset=0) -> dict:
+        """
+        Like `find`, with the indices of the wildcard steps leading to every value,
+        so that values of the same record share a prefix.
+        @param offset: index of the first item when the response is a page of a list
+        Return {jsonpath: [(path, value)]}.
+        """
+        matches = {expr: [] for expr in self.exprs}
+        self._visit_records(self.root, response, (), matches, offset)
+        for expr, jsonpath_expr in self.fallbacks.items():
+            # positions are unknown, attribute the values to the whole response
+            matches[expr] = [
+                ((), match.value) for match in jsonpath_expr.find(response)
+            ]
+        return matches
+
+    def _visit_records(
+        self, node: TrieNode, value, path: tuple, matches: dict, offset=0
+    ):
+        for expr in node.exprs:
+            matches[expr].append((path, value))
+        for step, child in node.children.items():
+            items = _step(step, value)
+            if step is WILDCARD:
+                for i, item in enumerate(items, offset):
+                    self._visit_records(child, item, path + (i,), matches)
+            else:
+                for item in items:
+                    self._visit_records(child, item, path, matches)
+
+    def _visit(self, node: TrieNode, value, matches: dict):
+        for expr in node.exprs:
+            matches[expr].append(value)
+        for step, child in node.children.items():
+            for item in _step(step, value):
+                self._visit(child, item, matches)
+
+    def __len__(self) -> int:
+        return len(self.exprs)
+
+    def __getstate__(self):
+        # parsed jsonpath_ng expressions are not guaranteed to pickle, parse them again
+        state = self.__dict__.copy()
+        state["fallbacks"] = list(self.fallbacks)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.fallbacks = {expr: parse(expr) for expr in state["fallbacks"]}
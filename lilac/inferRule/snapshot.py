@@ -0,0 +1,310 @@
+import os
+import json
+import mmap
+import pickle
+import struct
+import hashlib
+from collections import defaultdict
+
+from .base import InferRule, CloudTypeIndex
+
+SNAPSHOT_MAGIC = b"LILACKB\x00"
+# bump when InferRule or the layout changes, older snapshots are then ignored
+SNAPSHOT_VERSION = 3
+# magic, version, length of the JSON header
+PREAMBLE = struct.Struct("<8sII")
+
+
+class RuleSnapshot:
+    """
+    Versioned binary snapshot of compiled inference rules, memory-mapped on load.
+
+    Layout: preamble, JSON header, then pickled blobs of the merged InferRule
+    and of one InferRule fragment per source rule file. The header records the
+    size, mtime and hash of every source, so that a rule file is only read again
+    when its content changed, and the manifest of what each source mentions.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, "rb")
+        try:
+            self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise ValueError(f"{path} is not a rule snapshot")
+        try:
+            magic, version, header_len = PREAMBLE.unpack_from(self.mm)
+            if magic != SNAPSHOT_MAGIC:
+                raise ValueError(f"{path} is not a rule snapshot")
+            if version != SNAPSHOT_VERSION:
+                raise ValueError(
+                    f"{path} has snapshot version {version}, expected {SNAPSHOT_VERSION}"
+                )
+            header = self.mm[PREAMBLE.size : PREAMBLE.size + header_len]
+        except (ValueError, struct.error):
+            self.close()
+            raise
+        self.header = json.loads(header)
+        self.data_offset = PREAMBLE.size + header_len
+        # key: rule file path, value: its header entry
+        self.sources = {source["path"]: source for source in self.header["sources"]}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if not self.mm.closed:
+            self.mm.close()
+        self.file.close()
+
+    def is_unchanged(self, path: str) -> bool:
+        """
+        Check if a rule file is the same as when the snapshot was compiled.
+        """
+        source = self.sources.get(path)
+        if not source or not os.path.exists(path):
+            return False
+        stat = os.stat(path)
+        if stat.st_size != source["size"]:
+            return False
+        if stat.st_mtime_ns == source["mtime_ns"]:
+            return True
+        # touched but maybe not modified
+        return file_digest(path) == source["sha256"]
+
+    def get_manifest(self, rule_files: list) -> "RuleManifest":
+        """
+        Manifest of the rule files unchanged since compiling.
+        """
+        manifest = RuleManifest()
+        for path in rule_files:
+            if self.is_unchanged(path):
+                source = self.sources[path]
+                manifest.add(
+                    path, source["cloud_types"], source["tftypes"], source["api_calls"]
+                )
+        return manifest
+
+    def get_fragment(self, path: str) -> InferRule:
+        return self._load_blob(self.sources[path])
+
+    def get_merged(self) -> InferRule:
+        return self._load_blob(self.header["merged"])
+
+    def _load_blob(self, entry: dict):
+        start = self.data_offset + entry["offset"]
+        # unpickle straight from the mapped pages, slicing the mmap would copy them
+        with memoryview(self.mm) as view:
+            return pickle.loads(view[start : start + entry["length"]])
+
+
+class RuleManifest:
+    """
+    Index of rule files by the cloud types, TF types and API calls they mention.
+    """
+
+    def __init__(self):
+        self.files = set()
+        self.cloudtype_files = CloudTypeIndex()
+        # key: tftype / api_call, value: list of rule files
+        self.tftype_files = defaultdict(list)
+        self.api_files = defaultdict(list)
+
+    def add(self, path: str, cloud_types, tftypes, api_calls):
+        self.files.add(path)
+        for cloud_type in cloud_types:
+            self.cloudtype_files.add(cloud_type, path)
+        for tftype in tftypes:
+            self.tftype_files[tftype].append(path)
+        for api_call in api_calls:
+            self.api_files[api_call].append(path)
+
+    def get_cloudtype_files(self, cloud_types) -> set:
+        # match like InferRule.get_cloudtype_apis
+        return {
+            path
+            for cloud_type in cloud_types
+            for path in self.cloudtype_files.get(cloud_type)
+        }
+
+    def get_tftype_files(self, tftypes) -> set:
+        return {path for tftype in tftypes for path in self.tftype_files[tftype]}
+
+    def get_api_files(self, api_calls) -> set:
+        return {path for api_call in api_calls for path in self.api_files[api_call]}
+
+
+class LazyRuleLoader:
+    """
+    Load rule fragments from a snapshot only when lifting reaches them.
+    Rule files changed since compiling are not in the manifest and load eagerly.
+    """
+
+    def __init__(self, snapshot_path: str, rule_files: list, load_fragment):
+        self.snapshot_path = snapshot_path
+        self.rule_files = list(rule_files)
+        self.load_fragment = load_fragment
+        self.loaded = set()
+        with RuleSnapshot(snapshot_path) as snapshot:
+            self.manifest = snapshot.get_manifest(self.rule_files)
+        self.stale = [p for p in self.rule_files if p not in self.manifest.files]
+
+    def load_stale(self, infer_rule: InferRule) -> list:
+        return self._load(infer_rule, set(self.stale))
+
+    def load_cloud_types(
+        self, infer_rule: InferRule, cloud_types, tftypes=None
+    ) -> list:
+        """
+        Merge the rule files reachable from the cloud types into infer_rule:
+        files mentioning the cloud types, then files sharing their API calls.
+        Return the newly loaded files.
+        @param tftypes: TF types to lift, only start from their rule files, None for all
+        """
+        files = self.manifest.get_cloudtype_files(cloud_types)
+        if tftypes:
+            files &= self.manifest.get_tftype_files(tftypes)
+        return self._load(infer_rule, files)
+
+    def _load(self, infer_rule: InferRule, files: set) -> list:
+        loaded = []
+        files -= self.loaded
+        with RuleSnapshot(self.snapshot_path) as snapshot:
+            while files:
+                api_calls = set()
+                # keep the order of rule_files so merging is deterministic
+                for path in [p for p in self.rule_files if p in files]:
+                    if path in self.manifest.files:
+                        fragment = snapshot.get_fragment(path)
+                    else:
+                        fragment = self.load_fragment(path)
+                    infer_rule.merge(fragment)
+                    api_calls.update(fragment.api_response_map)
+                    api_calls.update(fragment.api_args_map)
+                    self.loaded.add(path)
+                    loaded.append(path)
+                files = self.manifest.get_api_files(api_calls) - self.loaded
+        return loaded
+
+    def __len__(self) -> int:
+        return len(self.rule_files)
+
+
+def file_digest(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def compile_rule_file(path: str, load_query_rule, responseInfo_type) -> InferRule:
+    """
+    Compile a single rule file into its own InferRule fragment.
+    """
+    fragment = InferRule(responseInfo_type)
+    fragment.add_query_rule(load_query_rule(path))
+    return fragment
+
+
+def load_fragments(rule_files: list, load_fragment, snapshot=None):
+    """
+    Get the InferRule fragment of every rule file, from the snapshot when the file
+    is unchanged, otherwise by `load_fragment(path)`.
+    Return (dict of fragments in the order of rule_files, list of files read again).
+    """
+    fragments, stale = {}, []
+    for path in rule_files:
+        if snapshot and snapshot.is_unchanged(path):
+            fragments[path] = snapshot.get_fragment(path)
+        else:
+            fragments[path] = load_fragment(path)
+            stale.append(path)
+    return fragments, stale
+
+
+def merge_fragments(fragments: dict, responseInfo_type) -> InferRule:
+    infer_rule = InferRule(responseInfo_type)
+    for fragment in fragments.values():
+        infer_rule.merge(fragment)
+    return infer_rule
+
+
+def open_snapshot(path: str):
+    """
+    Return the RuleSnapshot at `path`, or None if it does not exist or is outdated.
+    """
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        return RuleSnapshot(path)
+    except ValueError:
+        return None
+
+
+def load_infer_rule(rule_files: list, load_fragment, responseInfo_type, snapshot_path):
+    """
+    Load the merged InferRule of the rule files through the snapshot at `snapshot_path`.
+    Return (InferRule, list of rule files read again because they changed).
+    """
+    snapshot = open_snapshot(snapshot_path)
+    if not snapshot:
+        fragments, stale = load_fragments(rule_files, load_fragment)
+        return merge_fragments(fragments, responseInfo_type), stale
+    with snapshot:
+        # fast path: the merged rule is still valid as a whole
+        if list(snapshot.sources) == list(rule_files) and all(
+            snapshot.is_unchanged(path) for path in rule_files
+        ):
+            return snapshot.get_merged(), []
+        fragments, stale = load_fragments(rule_files, load_fragment, snapshot)
+    return merge_fragments(fragments, responseInfo_type), stale
+
+
+def write_rule_snapshot(path: str, fragments: dict, infer_rule: InferRule):
+    """
+    Write the merged InferRule and the fragments of its rule files to `path`.
+    """
+    # precompute the compiled schema maps so they are loaded ready to use
+    for response_info in infer_rule.api_response_map.values():
+        response_info.get_extractor()
+
+    blobs, sources, offset = [], [], 0
+    for rule_file, fragment in fragments.items():
+        blob = pickle.dumps(fragment, protocol=pickle.HIGHEST_PROTOCOL)
+        stat = os.stat(rule_file)
+        api_calls = set(fragment.api_response_map) | set(fragment.api_args_map)
+        sources.append(
+            {
+                "path": rule_file,
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha256": file_digest(rule_file),
+                "offset": offset,
+                "length": len(blob),
+                # manifest of what the rule file mentions
+                "cloud_types": sorted(k for k in fragment.cloudtype_api_map if k),
+                "tftypes": sorted(fragment.tfid_components),
+                "api_calls": sorted(api_calls),
+            }
+        )
+        blobs.append(blob)
+        offset += len(blob)
+    merged = pickle.dumps(infer_rule, protocol=pickle.HIGHEST_PROTOCOL)
+    blobs.append(merged)
+    header = {
+        "sources": sources,
+        "merged": {"offset": offset, "length": len(merged)},
+    }
+    header = json.dumps(header).encode()
+
+    # write to a temporary file first so a running lift never maps a partial snapshot
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(PREAMBLE.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(header)))
+        f.write(header)
+        for blob in blobs:
+            f.write(blob)
+    os.replace(tmp_path, path)
@@ -1,4 +1,4 @@
-from .azure import AzureInferWorker
+from .azure import AzureInferWorker, list_resource_groups
 from .google import GoogleInferWorker
 
-__all__ = ["AzureInferWorker", "GoogleInferWorker"]
+__all__ = ["AzureInferWorker", "GoogleInferWorker", "list_resource_groups"]
@@ -1,24 +1,60 @@
-import os
 import json
-import subprocess
+import shlex
+import threading
+from itertools import product
+from collections import defaultdict
 
-from jsonpath_ng import parse
-
-from lilac.utils import Config, print_info, print_cmd_result
+from lilac.utils import Config, print_info, print_error
 from lilac.inferRule import (
     InferRule,
     AzureIDType,
     InferAPIArg,
     AzureIDSchema,
     AzureResponseInfo,
+    build_projection,
 )
 from lilac.queryRule import AzureQueryRule
+from lilac.queryBackend import get_page_cmd, run_cloud_cmd
 
 from .base import InferWorker, LiftedInstance
+from .lineage import Origin
+
+# page size of Azure Resource Graph queries, 1000 is the service maximum
+GRAPH_PAGE_SIZE = 1000
+# az command groups paging by markers printed as warnings, not by `--next-token`
+MARKER_COMMAND_GROUPS = {"storage"}
+# az command groups listing subscription-level objects, without `-g`
+SUBSCRIPTION_COMMAND_GROUPS = {
+    "account",
+    "ad",
+    "feature",
+    "graph",
+    "group",
+    "policy",
+    "provider",
+    "role",
+    "tag",
+}
 
 
 class AzureInferWorker(InferWorker):
-    def __init__(self, group_name: str):
+    def __init__(
+        self,
+        group_name: str,
+        max_concurrency=None,
+        discovery=None,
+        group_names=None,
+        infer_rule=None,
+        ledger=None,
+        rule_loader=None,
+    ):
+        """
+        @param group_names: all resource groups lifted in this run, top-level resources
+            of them are discovered together and shared through the ledger
+        @param infer_rule: InferRule already loaded by another worker
+        @param ledger: ExecutionLedger shared with the workers of other resource groups
+        @param rule_loader: LazyRuleLoader of infer_rule
+        """
         self.subscription_id = Config["azure_subscription_id"]
         if not self.subscription_id:
             raise ValueError("azure_subscription_id is not set in global-config.yml")
@@ -26,14 +62,38 @@ class AzureInferWorker(InferWorker):
         if not self.location:
             raise ValueError("azure_location is not set in global-config.yml")
         self.group_name = group_name
-        super().__init__(infer_rule=InferRule(AzureResponseInfo))
+        self.group_names = group_names or [group_name]
+        # how to discover top-level resources: resource-list or graph
+        self.discovery = discovery or Config["azure_discovery"]
+        # key: API call, value: JMESPath projection of its response or None
+        self.projections = {}
+        # key: full API call with pushed down scope or projection,
+        # value: (API call, full API call without them)
+        self.pushdown_calls = {}
+        self.plain_apis = set()  # API calls rejecting the pushdown
+        self.unpaged_apis = set()  # API calls rejecting `--max-items`
+        # (API call, paged) known to accept the pushdown
+        self.pushdown_apis = set()
+        # key: page call, value: full API call fetching the whole output
+        self.page_calls = {}
+        # key: API call, value: RLock held while its first call finds whether it
+        # accepts the pushdown
+        self.probe_locks = {}
+        self.probe_locks_lock = threading.Lock()
+        super().__init__(
+            infer_rule=infer_rule or InferRule(AzureResponseInfo),
+            account=self.subscription_id,
+            max_concurrency=max_concurrency,
+            ledger=ledger,
+            rule_loader=rule_loader,
+        )
+        # records are partitioned by resource group after they are pruned,
+        # and revalidated by their ETag in incremental lifts
+        self.record_fields = ("resourceGroup", "etag")
+        self.run_groups = {group_name.lower() for group_name in self.group_names}
 
-    def prepare_infer_rules(self, query_rule_paths: list):
-        for path in query_rule_paths:
-            query_rule = AzureQueryRule.load(path)
-            self.infer_rule.add_query_rule(query_rule)
-        print_info(self.infer_rule)
-        self.logger.info(self.infer_rule)
+    def _load_query_rule(self, path: str):
+        return AzureQueryRule.load(path)
 
     def _print_init_lifting(self):
         print_info(
@@ -45,68 +105,157 @@ class AzureInferWorker(InferWorker):
                             self.group_name}..."
         )
 
-    def _populate_top_api_queue(self, api_queue):
-        print_info(f"Running command: az resource list -g {self.group_name}")
-        self.logger.info(f"Running command: az resource list -g {self.group_name}")
-        result = subprocess.run(
-            f"az resource list -g {self.group_name}",
-            stdout=subprocess.PIPE,
-            shell=True,
-            text=True,
-        )
-        rg_resource = json.loads(result.stdout)
+    def _populate_top_api_queue(self, scheduler):
+        if self.discovery == "graph":
+            rg_resource = self._discover_graph_resources()
+        else:
+            rg_resource = self._discover_listed_resources()
+
         cloud_types = set()
+        # key: lower-cased cloud type, value: resources of the type
+        type_resources = defaultdict(list)
         for resource in rg_resource:
             cloudtype = resource["type"]
             cloud_types.add(cloudtype)
+            type_resources[cloudtype.lower()].append(resource)
+        self._prepare_rules(scheduler, cloud_types)
+
+        for cloudtype in sorted(cloud_types):
             cloudtype_apis = self.infer_rule.get_cloudtype_apis(
                 cloudtype
             )  # set of api_call
-            for api in cloudtype_apis:
-                if api not in api_queue:
-                    api_queue.append(api)
+            # only APIs listing this very type can be answered by its bulk records
+            exact_apis = self.infer_rule.get_cloudtype_apis(cloudtype, children=False)
+            for api in sorted(cloudtype_apis):
+                # bulk records already answer the API, no need to call it
+                if (
+                    self.discovery == "graph"
+                    and api in exact_apis
+                    and scheduler.accepts(api)
+                    and self._cover_api_by_bulk(
+                        scheduler, api, type_resources[cloudtype.lower()]
+                    )
+                ):
+                    continue
+                scheduler.submit(api)
         return cloud_types
 
-    def _analyze_response(self, response, response_info):
+    def _discover_listed_resources(self) -> list:
+        stream = Config["lift_stream_responses"]
+        if len(self.group_names) == 1:
+            return self._run_shared_call(
+                f"az resource list -g {self.group_name}", stream=stream
+            )
+        # list the whole subscription once for all resource groups of the run
+        return self._get_resource_group_response(
+            self._run_shared_call("az resource list", stream=stream)
+        )
+
+    def _discover_graph_resources(self) -> list:
+        """
+        Fetch every resource in the resource groups of the run with paged
+        Azure Resource Graph queries, then keep those in this resource group.
+        Records keep their full `properties`, unlike `az resource list`.
+        """
+        query = build_graph_query(self.group_names)
+        resources, skip_token = [], None
+        while True:
+            cmd = (
+                f"az graph query -q {shlex.quote(query)} --first {GRAPH_PAGE_SIZE}"
+                f" --subscriptions {self.subscription_id}"
+            )
+            if skip_token:
+                cmd += f" --skip-token {shlex.quote(skip_token)}"
+            page = self._run_shared_call(cmd)
+            resources.extend(flatten_properties(page["data"]))
+            skip_token = page.get("skip_token")
+            if not skip_token:
+                return self._get_resource_group_response(resources)
+
+    def _cover_api_by_bulk(self, scheduler, api: str, resources: list) -> bool:
+        """
+        Analyze bulk discovery records as the response of a top-level `api`.
+        Return False if the API needs other arguments or any of its jsonpaths
+        does not apply to the records, so it has to be called.
+        """
+        arg_names = self.infer_rule.get_required_args(api)
+        if not resources or arg_names - {"resource-group"}:
+            return False
+        response_info = self.infer_rule.get_response_info(api)
+        if not all(response_info.get_extractor().find(resources).values()):
+            return False
+
+        # mark the call as done so the scheduler and ledger never run it
+        full_api = api
+        for arg_map in self._resolve_args(api, arg_names):
+            scheduler.bind(api, arg_map)
+            full_api = self._get_full_api_call(api, arg_map)
+            # records of one group must not answer a subscription-scoped call
+            if "resource-group" in arg_names:
+                self.ledger.record(full_api, resources)
+                self.ledger_calls[api].append(full_api)
+        self.covered_calls += 1
+        print_info(f"Covered by bulk discovery: {api}")
+        self.logger.info(f"Covered by bulk discovery: {api}")
+        self._handle_response(scheduler, api, resources, full_api)
+        return True
+
+    def _analyze_matches(self, matches, response_info, full_api):
         for expr, schemas in response_info.schema_map.items():
-            jsonpath_expr = parse(expr)
-            values = {match.value for match in jsonpath_expr.find(response)}
+            # fields missing in a projected record come back as null
+            records = [
+                (path, value) for path, value in matches[expr] if value is not None
+            ]
+            values = {value for _, value in records}
             for schema in schemas:
                 if type(schema) == AzureIDSchema:
                     self.tfid_map[schema].update(values)
+                    for path, value in records:
+                        self.lineage.add_id(schema, value, Origin(full_api, path))
                 elif type(schema) == InferAPIArg:
                     self.apiarg_map[schema].update(values)
+                    for path, value in records:
+                        self.lineage.add_arg(schema, value, Origin(full_api, path))
 
-    def _resolve_args(self, api_queue, api, arg_names, arg_map):
-        args_ready = True
+    def _is_arg_ready(self, arg) -> bool:
+        # resource group is always known in advance
+        if arg.arg_name == "resource-group":
+            return True
+        return super()._is_arg_ready(arg)
+
+    def _resolve_args(self, api, arg_names):
+        arg_values = {}
         for arg_name in arg_names:
             if arg_name == "resource-group":
-                arg_map[arg_name] = self.group_name
+                arg_values[arg_name] = [self.group_name]
                 continue
-                # if any argument is not ready, place this API back to the queue
-            if InferAPIArg(api, arg_name) not in self.apiarg_map:
-                args_ready = False
-                break
-                # add each possible value for the argument
-            arg_map[arg_name] = self.apiarg_map[InferAPIArg(api, arg_name)].pop()
-            # if other possible values exist, put the API back to the queue
-            if self.apiarg_map[InferAPIArg(api, arg_name)]:
-                api_queue.insert(0, api)
-        return args_ready
+            # if any argument is not ready, let the scheduler wait for it
+            if not self._is_arg_ready(InferAPIArg(api, arg_name)):
+                return []
+            # read all possible values without consuming them
+            arg_values[arg_name] = sorted(
+                self.apiarg_map[InferAPIArg(api, arg_name)], key=str
+            )
+        names = sorted(arg_values)
+        return [
+            dict(zip(names, values))
+            for values in product(*[arg_values[name] for name in names])
+        ]
 
     def _infer_tfinstance(self, tftype):
         tfid_components = self.infer_rule.get_id_components(tftype)
         # Type 1: whole ID corresponds to the TF type
         if len(tfid_components) == 1:
-            assert tfid_components.pop() == "ID"
+            # the components are shared by workers using the same InferRule
+            assert next(iter(tfid_components)) == "ID"
             for id in self.tfid_map[AzureIDSchema(AzureIDType.ID, tftype)]:
-                self.lifted_instances.append(LiftedInstance(tftype, id))
+                yield LiftedInstance(tftype, id)
 
-        # Type 2: baseID and child components
+        # Type 2: baseID and child components, joined by the records they came from
         elif "baseID" in tfid_components:
-            ids = []
-            for id in self.tfid_map[AzureIDSchema(AzureIDType.BASE_CHILD, tftype)]:
-                ids.append(id)
+            ids = self.lineage.get_records(
+                AzureIDSchema(AzureIDType.BASE_CHILD, tftype)
+            )
             child_num = len(tfid_components) - 1
             for i in range(child_num):
                 child_key = self._get_child_key(i, tfid_components)
@@ -114,32 +263,33 @@ class AzureInferWorker(InferWorker):
                     child_key
                 ), f"child_{
                     i} not found in tfid_components of {tftype}"
-                running_ids = []
-                for child in self.tfid_map[
-                    AzureIDSchema(AzureIDType.BASE_CHILD, tftype, child_key)
-                ]:
-                    for id in ids:
-                        running_ids.append(
-                            f"{id}/{child_key[len('azurerm_'):]}/{child}"
-                        )
-                ids = running_ids
-            for id in ids:
-                self.lifted_instances.append(LiftedInstance(tftype, id))
+                segment = child_key[len("azurerm_") :]
+                ids = self.lineage.join(
+                    ids,
+                    self.lineage.get_records(
+                        AzureIDSchema(AzureIDType.BASE_CHILD, tftype, child_key)
+                    ),
+                    lambda id, child: f"{id}/{segment}/{child}",
+                )
+            for id in sorted({id for id, _ in ids}, key=str):
+                yield LiftedInstance(tftype, id)
 
         # Type 3: ID components associated by '|'
         else:
-            ids = []
+            ids = self.lineage.get_records(
+                AzureIDSchema(AzureIDType.COMPONENT, tftype, "component_0")
+            )
             comp_num = len(tfid_components)
-            for i in range(comp_num):
-                running_ids = []
-                for comp in self.tfid_map[
-                    AzureIDSchema(AzureIDType.COMPONENT, tftype, f"component_{i}")
-                ]:
-                    for id in ids:
-                        running_ids.append(f"{id}|{comp}")
-                ids = running_ids
-            for id in ids:
-                self.lifted_instances.append(LiftedInstance(tftype, id))
+            for i in range(1, comp_num):
+                ids = self.lineage.join(
+                    ids,
+                    self.lineage.get_records(
+                        AzureIDSchema(AzureIDType.COMPONENT, tftype, f"component_{i}")
+                    ),
+                    lambda id, comp: f"{id}|{comp}",
+                )
+            for id in sorted({id for id, _ in ids}, key=str):
+                yield LiftedInstance(tftype, id)
 
     def _save_instance_topo(self, path: str):
         content = f"""provider "azurerm" {{
@@ -162,47 +312,15 @@ resource "{instance.tftype}" "{instance.name}" {{
         with open(path, "w") as f:
             f.write(content)
 
-    def _save_instance_imported(self, output_path: str, buffer_dir="cache"):
-        import_file = f"""provider "azurerm" {{
+    def _get_provider_config(self) -> str:
+        return f"""provider "azurerm" {{
     features {{}}
     subscription_id = "{self.subscription_id}"
 }}
 """
-        for instance in self.import_instances:
-            import_file += f"""
-import {{
-    id = "{instance.id}"
-    to = {instance.tftype}.{instance.name}
-}}
-"""
-        with open(os.path.join(buffer_dir, "import.tf"), "w") as f:
-            f.write(import_file)
-
-        if os.path.exists(os.path.join(buffer_dir, "imported.tf")):
-            os.remove(os.path.join(buffer_dir, "imported.tf"))
-
-        print_info("Running terraform import...")
-        if not os.path.exists(os.path.join(buffer_dir, ".terraform")):
-            subprocess.run(
-                "terraform init",
-                cwd=buffer_dir,
-                shell=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-            )
-        result = subprocess.run(
-            "terraform plan -generate-config-out=imported.tf",
-            cwd=buffer_dir,
-            shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-        )
-        print_cmd_result(result)
 
-        with open(os.path.join(buffer_dir, "imported.tf"), "r") as f:
-            content = f.read()
+    def _save_instance_imported(self, output_path: str, buffer_dir="cache"):
+        content = self._plan_imported_config(self._get_provider_config(), buffer_dir)
         content = (
             f"""provider "azurerm" {{
     features {{}}
@@ -223,13 +341,121 @@ resource "azurerm_resource_group" "{self.group_name}" {{
         full_api = api
         for arg_name, arg_val in arg_map.items():
             full_api += f" --{arg_name} {arg_val}"
+        if not Config["lift_query_pushdown"] or api in self.plain_apis:
+            return full_api
+
+        plain_api = full_api
+        # scope list commands to the group, unless other groups of the run
+        # share the subscription-wide response
+        if (
+            "resource-group" not in arg_map
+            and len(self.group_names) == 1
+            and is_group_list(api)
+        ):
+            full_api += f" -g {self.group_name}"
+        # only download the fields read by the jsonpaths of the API,
+        # and the continuation token closing a page
+        if api not in self.projections:
+            fields = list(self.record_fields)
+            if self._is_paged(api):
+                fields.append("nextToken")
+            self.projections[api] = build_projection(
+                self.infer_rule.get_response_info(api).schema_map, fields
+            )
+        if self.projections[api]:
+            full_api += f" --query {shlex.quote(self.projections[api])}"
+        if full_api != plain_api:
+            self.pushdown_calls[full_api] = (api, plain_api)
         return full_api
 
-    def _get_resource_group_response(self, response: str):
+    def _is_paged(self, api: str) -> bool:
+        return (
+            Config["lift_page_size"] > 0
+            and api not in self.plain_apis
+            and api not in self.unpaged_apis
+            and is_group_list(api)
+            and api.split()[1] not in MARKER_COMMAND_GROUPS
+        )
+
+    def _get_page_call(self, api: str, full_api: str, token=None):
+        """
+        Only calls scoped to the resource group of the worker are paged, no other
+        worker reuses them, so their pages are not kept in the ledger.
+        """
+        if not self._is_paged(api) or not self._is_group_scoped(full_api):
+            return None
+        page_api = get_page_cmd(full_api, Config["lift_page_size"], token)
+        _, plain_api = self.pushdown_calls.get(full_api, (api, full_api))
+        self.pushdown_calls[page_api] = (api, plain_api)
+        self.page_calls[page_api] = full_api
+        return page_api
+
+    def _run_api_call(self, full_api: str, api=None, stream=False, paged=False):
+        if full_api not in self.pushdown_calls:
+            return super()._run_api_call(full_api, api, stream, paged)
+        api_call, plain_api = self.pushdown_calls[full_api]
+        if (api_call, paged) in self.pushdown_apis:
+            return super()._run_api_call(full_api, api, stream, paged)
+
+        # the first call of an API finds whether it accepts the pushdown, the
+        # concurrent ones wait for it instead of failing the same way
+        with self.probe_locks_lock:
+            probe_lock = self.probe_locks.setdefault(api_call, threading.RLock())
+        with probe_lock:
+            if api_call in self.plain_apis:
+                return super()._run_api_call(plain_api, api, stream)
+            if paged and api_call in self.unpaged_apis:
+                return self._run_api_call(self.page_calls[full_api], api, stream)
+
+            result = super()._run_api_call(full_api, api, stream, paged)
+            if result.returncode != 0 and "unrecognized arguments" in result.stderr:
+                rejected = result.stderr.split("unrecognized arguments", 1)[1]
+            elif result.returncode != 0 and "--query" in result.stderr:
+                rejected = "--query"
+            else:
+                # az parses the arguments first, any other error is not about them
+                self.pushdown_apis.add((api_call, paged))
+                return result
+
+            if paged and "--max-items" in rejected:
+                # only AAZ commands page, fetch the whole output instead
+                self.unpaged_apis.add(api_call)
+                msg = f"{api_call} rejected the paging"
+                print_error(f"[WARNNING] {msg}")
+                self.logger.warning(msg)
+                return self._run_api_call(self.page_calls[full_api], api, stream)
+
+            # the command does not support `-g` or the projection,
+            # fetch the whole output and filter it locally
+            self.plain_apis.add(api_call)
+            msg = f"{api_call} rejected the pushed down scope or projection"
+            print_error(f"[WARNNING] {msg}")
+            self.logger.warning(msg)
+            return super()._run_api_call(plain_api, api, stream)
+
+    def _is_group_scoped(self, full_api: str) -> bool:
+        try:
+            tokens = shlex.split(full_api)
+        except ValueError:
+            return False
+        return any(
+            flag in ("-g", "--resource-group")
+            and group_name.lower() == self.group_name.lower()
+            for flag, group_name in zip(tokens, tokens[1:])
+        )
+
+    def _is_run_record(self, record) -> bool:
+        """
+        Only keep the records in the resource groups of the run, as they are read.
+        """
+        return isinstance(record, dict) and (
+            (record.get("resourceGroup") or "").lower() in self.run_groups
+        )
+
+    def _get_resource_group_response(self, response):
         """
         Only return resources in this resource group
         """
-        response = json.loads(response)
         rg_response = []
         if isinstance(response, list):
             for resource in response:
@@ -238,5 +464,57 @@ resource "azurerm_resource_group" "{self.group_name}" {{
                     and resource["resourceGroup"].lower() == self.group_name.lower()
                 ):
                     rg_response.append(resource)
-        # TODO: handle dict type response
+        elif isinstance(response, dict):
+            # a single resource, e.g. the output of a `show` call
+            group_name = response.get("resourceGroup")
+            if group_name is None or group_name.lower() == self.group_name.lower():
+                return response
         return rg_response
+
+
+def is_group_list(api: str) -> bool:
+    """
+    Whether `api` lists resources that belong to resource groups.
+    """
+    words = api.split()
+    return words[-1] == "list" and words[1] not in SUBSCRIPTION_COMMAND_GROUPS
+
+
+def build_graph_query(group_names=None) -> str:
+    """
+    KQL query of all resources in `group_names`, or the whole subscription if None.
+    """
+    query = "Resources"
+    if group_names:
+        groups = ", ".join(f"'{group}'" for group in group_names)
+        query += f" | where resourceGroup in~ ({groups})"
+    return query + " | order by id asc"
+
+
+def flatten_properties(value):
+    """
+    Lift nested ARM `properties` into their parent object,
+    matching the shape of az CLI list output.
+    """
+    if isinstance(value, list):
+        return [flatten_properties(item) for item in value]
+    if isinstance(value, dict):
+        ret = {}
+        properties = value.get("properties")
+        if isinstance(properties, dict):
+            ret.update(flatten_properties(properties))
+        for k, v in value.items():
+            if k != "properties" or not isinstance(properties, dict):
+                ret[k] = flatten_properties(v)
+        return ret
+    return value
+
+
+def list_resource_groups() -> list:
+    """
+    Names of all resource groups in the subscription.
+    """
+    result = run_cloud_cmd("az group list", account=Config["azure_subscription_id"])
+    if result.returncode != 0:
+        raise RuntimeError(f"Failed to list resource groups: {result.stderr}")
+    return sorted(group["name"] for group in json.loads(result.stdout))
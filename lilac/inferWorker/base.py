@@ -1,25 +1,102 @@
 import os
+import re
+import json
+import time
+import hashlib
 import logging
 import subprocess
+from operator import attrgetter
+from itertools import count, groupby
 from collections import namedtuple, defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 from tabulate import tabulate
 
-from lilac.utils import print_info
+from lilac.utils import Config, print_info, print_error, print_cmd_result
+from lilac.inferRule import (
+    InferAPIArg,
+    LazyRuleLoader,
+    build_pruner,
+    open_snapshot,
+    load_fragments,
+    load_infer_rule,
+    merge_fragments,
+    reads_list_items,
+    compile_rule_file,
+    write_rule_snapshot,
+)
+from lilac.queryBackend import CloudPage, run_cloud_cmd, stream_cloud_cmd
+
+from .state import LiftState
+from .ledger import ExecutionLedger
+from .journal import LiftJournal, JournalSpool
+from .lineage import Lineage
+from .planner import APIPlanner, APICostModel
+from .importer import ImportBlockWriter, plan_imports
+from .scheduler import APIScheduler
 
 LiftedInstance = namedtuple("LiftedInstance", ["tftype", "id"])
 ImportInstance = namedtuple("ImportInstance", ["tftype", "name", "id"])
+# outcome of a cloud API call, response is the parsed output if it succeeded,
+# next_token resumes the call when the response is a page of the output
+APIResult = namedtuple(
+    "APIResult", ["returncode", "response", "stderr", "next_token"], defaults=[None]
+)
 
 
 class InferWorker:
-    def __init__(self, infer_rule):
+    def __init__(
+        self,
+        infer_rule,
+        account: str,
+        max_concurrency=None,
+        ledger=None,
+        rule_loader=None,
+    ):
         self.infer_rule = infer_rule
+        # loads rules reachable from the discovered cloud types, None if all are loaded
+        self.rule_loader = rule_loader
+        self.account = account  # subscription or project, scopes the response cache
+        # maximum number of cloud API calls running at the same time
+        self.max_concurrency = max_concurrency or Config["lift_max_concurrency"]
         self.lifted_instances = []  # list of LiftedInstance
         self.import_instances = []  # list of ImportInstance
+        # streams import blocks as instances are inferred, None if not streaming
+        self.import_writer = None
 
         # key: InferAPIArg, value: arg value
         self.apiarg_map = defaultdict(set)
         self.tfid_map = defaultdict(set)  # key: IDSchema, value: ID value
+        # records the ID values and arguments came from, to join ID components
+        self.lineage = Lineage()
+
+        # executed API calls and their responses, may be shared between workers
+        self.ledger = ledger if ledger is not None else ExecutionLedger()
+        # key: API call or None for discovery, value: full API calls whose responses
+        # this worker put in the ledger, released once the API can not run again
+        self.ledger_calls = defaultdict(list)
+        self.live_apis = None  # APIs that could still run at the last eviction
+        self.executed_calls = 0
+        self.failed_calls = 0
+        self.covered_calls = 0  # API calls answered by bulk discovery
+        self.reused_calls = 0  # API calls answered by the ledger
+        self.changed_calls = 0  # API calls whose response differs from the last lift
+        # API calls answered by the last lift, bound with unchanged records
+        self.revalidated_calls = 0
+        self.replayed_calls = 0  # API calls answered by the journal when resuming
+        self.fetched_pages = 0  # pages of paged API calls
+        # key: API call, value: function pruning its streamed records or None
+        self.pruners = {}
+        self.record_fields = ()  # fields of streamed records kept for the worker
+        # journal of the analyzed responses, None if not journaling
+        self.journal = None
+        # previous lift of the same resource group, None if not lifting incrementally
+        self.state = None
+        self.pruned_apis = 0  # APIs that cannot contribute to the target TF types
+        self.only_types = None  # TF types to lift, None for all
+        # observed API costs, planning the cheapest APIs for the TF types
+        self.cost_model = APICostModel(Config["api_cost_path"])
+        self.planner = None
 
         logging.basicConfig(
             level=logging.INFO,
@@ -29,81 +106,894 @@ class InferWorker:
         )
         self.logger = logging.getLogger(__name__)
 
-    def prepare_infer_rules(self):
+    def prepare_infer_rules(self, query_rule_paths: list, snapshot_path=None):
+        """
+        Load the query rules into the inference rule.
+        With a compiled snapshot, only the rule files changed since compiling are read.
+        """
+        if (
+            snapshot_path
+            and os.path.exists(snapshot_path)
+            and Config["lazy_rule_loading"]
+        ):
+            try:
+                self.rule_loader = LazyRuleLoader(
+                    snapshot_path, query_rule_paths, self._compile_rule_file
+                )
+            except ValueError:
+                self.rule_loader = None  # outdated snapshot, load everything
+            else:
+                stale = self.rule_loader.load_stale(self.infer_rule)
+                msg = (
+                    f"Indexed {len(query_rule_paths)} rule files from {snapshot_path}"
+                    ", loading them on demand"
+                )
+                if stale:
+                    msg += (
+                        f", {len(stale)} changed since compiling, run --compile-rules"
+                    )
+                print_info(msg)
+                self.logger.info(msg)
+                return
+
+        if snapshot_path and os.path.exists(snapshot_path):
+            self.infer_rule, stale = load_infer_rule(
+                query_rule_paths,
+                self._compile_rule_file,
+                self.infer_rule.responseInfo_type,
+                snapshot_path,
+            )
+            msg = f"Loaded {len(query_rule_paths)} rule files from {snapshot_path}"
+            if stale:
+                msg += f", {len(stale)} changed since compiling, run --compile-rules"
+            print_info(msg)
+            self.logger.info(msg)
+            return
+
+        for path in query_rule_paths:
+            self.infer_rule.add_query_rule(self._load_query_rule(path))
+        print_info(self.infer_rule)
+        self.logger.info(self.infer_rule)
+
+    def compile_infer_rules(self, query_rule_paths: list, snapshot_path: str):
+        """
+        Compile the query rules into a snapshot for fast loading in later lifting,
+        reusing the fragments of rule files unchanged since the last compilation.
+        """
+        snapshot = open_snapshot(snapshot_path)
+        fragments, stale = load_fragments(
+            query_rule_paths, self._compile_rule_file, snapshot
+        )
+        if snapshot:
+            snapshot.close()
+        self.infer_rule = merge_fragments(fragments, self.infer_rule.responseInfo_type)
+        write_rule_snapshot(snapshot_path, fragments, self.infer_rule)
+        msg = (
+            f"Compiled {len(fragments)} rule files ({len(stale)} changed) "
+            f"to {snapshot_path}"
+        )
+        print_info(msg)
+        self.logger.info(msg)
+
+    def _prepare_rules(self, scheduler: APIScheduler, cloud_types: set):
+        """
+        Once the top-level cloud types are discovered, load the rules reachable from them
+        if loading lazily, and prune the APIs that cannot contribute to the TF types.
+        """
+        if self.rule_loader:
+            loaded = self.rule_loader.load_cloud_types(
+                self.infer_rule, cloud_types, self.only_types
+            )
+            msg = (
+                f"Loaded {len(loaded)} rule files for the discovered cloud types, "
+                f"{len(self.rule_loader.loaded)}/{len(self.rule_loader)} in total"
+            )
+            print_info(msg)
+            self.logger.info(msg)
+
+        contributing = self.infer_rule.get_contributing_apis(self.only_types)
+        scheduler.restrict(contributing)
+        msg = f"{len(contributing)} APIs can contribute to the lifted TF types"
+        if self.only_types:
+            msg += f" {sorted(self.only_types)}"
+        print_info(msg)
+        self.logger.info(msg)
+        if not Config["lift_api_planner"]:
+            return
+
+        # among the APIs reachable from the top-level ones, run only the cheapest
+        # that still provide every ID component, keep the others as fallbacks
+        top_apis = set()
+        for cloud_type in cloud_types:
+            top_apis |= self.infer_rule.get_cloudtype_apis(cloud_type)
+        candidates = self.infer_rule.get_reachable_apis(top_apis) & contributing
+        self.planner = APIPlanner(
+            self.infer_rule, self._estimate_cost, self._is_arg_ready
+        )
+        planned = self.planner.plan(candidates, self.only_types)
+        scheduler.restrict(planned)
+        msg = (
+            f"Planned {len(planned)} of {len(candidates)} APIs, "
+            f"estimated {sum(self._estimate_cost(api) for api in planned):.1f}s"
+        )
+        print_info(msg)
+        self.logger.info(msg)
+
+    def _estimate_cost(self, api: str) -> float:
+        """
+        Estimated seconds of running all calls of `api`, with its fan-out known
+        from the argument values once they are ready.
+        """
+        fanout = len(self._resolve_args(api, self.infer_rule.get_required_args(api)))
+        return self.cost_model.estimate(api, fanout or None)
+
+    def _fallback(self, scheduler: APIScheduler, api: str):
+        """
+        Schedule alternative APIs for the ID components a failed API would provide.
+        """
+        if not self.planner:
+            return
+        fallback_apis = self.planner.fallback(api)
+        if not fallback_apis:
+            return
+        print_error(f"[WARNNING] {api} failed, falling back to {sorted(fallback_apis)}")
+        self.logger.warning(f"{api} failed, falling back to {sorted(fallback_apis)}")
+        scheduler.allow(fallback_apis)
+        for fallback_api in sorted(fallback_apis):
+            scheduler.submit(fallback_api)
+
+    def _load_query_rule(self, path: str):
         raise NotImplementedError
 
-    def lifting_inference(self):
+    def _compile_rule_file(self, path: str):
+        return compile_rule_file(
+            path, self._load_query_rule, self.infer_rule.responseInfo_type
+        )
+
+    def lifting_inference(self, only_types=None):
+        """
+        @param only_types: TF types to lift, skip API calls not needed by them
+        """
+        # instances of a TF type are yielded together once it is complete
+        for _, lifted in groupby(
+            self.iter_lifted_instances(only_types), key=attrgetter("tftype")
+        ):
+            lifted = list(lifted)
+            self.lifted_instances.extend(lifted)
+            self.__post_process_instances(lifted)
+        self._print_lift_summary()
+        if self.state:
+            self.state.save(self.import_instances)
+
+    def iter_lifted_instances(self, only_types=None):
+        """
+        Run lifting inference and yield LiftedInstance of every TF type as soon as
+        no pending API can provide more of its ID components.
+        The ID values of a TF type are released once its instances are yielded.
+        @param only_types: TF types to lift, skip API calls not needed by them
+        """
+        self.only_types = set(only_types) if only_types else None
         self._print_init_lifting()
 
-        # BFS search for all resources by APIs
-        api_queue = []
+        # schedule API calls once their arguments are satisfied
+        scheduler = APIScheduler(self.infer_rule, self._is_arg_ready)
 
         # search from top-level resources in the resource group
-        cloud_types = self._populate_top_api_queue(api_queue)
+        cloud_types = self._populate_top_api_queue(scheduler)
         print_info(f"Top-level resources types: {cloud_types}")
         self.logger.info(f"Top-level resources types: {cloud_types}")
 
-        while api_queue:
-            api = api_queue.pop(0)
-            arg_names = self.infer_rule.get_required_args(api)  # set of arg_name
+        invocations = defaultdict(int)  # key: api_call, value: number of calls
+        lifted_tftypes = set()  # TF types whose instances are yielded
+        # key: Future of the APIResult of a page, value: (order the call started in,
+        # APIInvocation, full_api, number of the previous pages, JournalSpool of
+        # them or None, index of the first record of the page)
+        running = {}
+        call_order = count()
+        # duplicate calls of calls still running, answered once those complete
+        deferred = []
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            while scheduler or running or deferred:
+                # resolve every runnable API into a batch of independent calls
+                batch = []  # list of (APIInvocation, full_api)
+                # calls already executed, maybe by another worker
+                reused, deferred = deferred, []
+                restored = []  # calls answered by the journal of an interrupted run
+                revalidated = []  # calls answered by the previous lift
+                while scheduler:
+                    api = scheduler.pop()
+                    arg_names = self.infer_rule.get_required_args(api)
 
-            # check if all arguments are ready
-            arg_map = {}
-            args_ready = self._resolve_args(api_queue, api, arg_names, arg_map)
-            if not args_ready:
-                api_queue.append(api)
-                continue
+                    # bind each combination of argument values as a separate call
+                    for arg_map in self._resolve_args(api, arg_names):
+                        invocation = scheduler.bind(api, arg_map)
+                        if not invocation:
+                            continue
+                        invocations[api] += 1
+                        # skip commands that already ran in this lifting run
+                        full_api = self._get_full_api_call(api, arg_map)
+                        self.lineage.bind_call(
+                            full_api,
+                            {
+                                InferAPIArg(api, arg_name): arg_value
+                                for arg_name, arg_value in arg_map.items()
+                            },
+                        )
+                        response = self._get_saved_response(full_api)
+                        matches = None
+                        if response is None:
+                            matches = self._revalidate(api, full_api)
+                        if response is not None:
+                            restored.append((invocation, full_api, response))
+                        elif matches is not None:
+                            revalidated.append((invocation, full_api, matches))
+                        elif self.ledger.claim(full_api):
+                            batch.append((invocation, full_api))
+                        else:
+                            reused.append((invocation, full_api))
 
-            # run the API call and analyze the response
-            full_api = self._get_full_api_call(api, arg_map)
-            print_info(f"Running command: {full_api}")
-            self.logger.info(f"Running command: {full_api}")
-            result = subprocess.run(
-                full_api, stdout=subprocess.PIPE, shell=True, text=True
-            )
-            if result.returncode != 0:
-                continue
+                # run the new calls concurrently with the pages of running ones
+                for invocation, full_api in batch:
+                    future = self._submit_page(executor, invocation.api_call, full_api)
+                    running[future] = (
+                        next(call_order),
+                        invocation,
+                        full_api,
+                        0,
+                        None,
+                        0,
+                    )
+
+                # partition the recorded responses of duplicate calls as well
+                for invocation, full_api in reused:
+                    response = self.ledger.lookup(full_api)
+                    if (
+                        response is None
+                        and running
+                        and not self.ledger.has_failed(full_api)
+                    ):
+                        deferred.append((invocation, full_api))
+                        continue
+                    if response is None:
+                        # the call failed, in this or an earlier lifting
+                        self.failed_calls += 1
+                        self.logger.warning(f"Failed: {full_api}")
+                        self._fallback(scheduler, invocation.api_call)
+                        continue
+                    self.reused_calls += 1
+                    self._handle_response(
+                        scheduler,
+                        invocation.api_call,
+                        self._get_resource_group_response(response),
+                        full_api,
+                    )
+
+                for invocation, full_api, response in restored:
+                    if self.ledger.claim(full_api):
+                        self.ledger.record(full_api, response)
+                        self.ledger_calls[invocation.api_call].append(full_api)
+                    self._handle_response(
+                        scheduler,
+                        invocation.api_call,
+                        self._get_resource_group_response(response),
+                        full_api,
+                    )
+
+                for invocation, full_api, matches in revalidated:
+                    self.revalidated_calls += 1
+                    self._handle_matches(
+                        scheduler, invocation.api_call, matches, full_api
+                    )
+
+                if running:
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    # calls are analyzed as they complete, those completing
+                    # together in the order they started
+                    for future in sorted(done, key=lambda f: running[f][0]):
+                        order, invocation, full_api, pages, spool, offset = running.pop(
+                            future
+                        )
+                        api = invocation.api_call
+                        result = future.result()
+                        if result.returncode != 0:
+                            if spool is not None:
+                                spool.close()
+                            self.ledger.fail(full_api)
+                            self.executed_calls += 1
+                            self.failed_calls += 1
+                            self.logger.warning(f"Failed: {full_api}\n{result.stderr}")
+                            self._fallback(scheduler, api)
+                            continue
 
-            # check if any info can be infered from the response
-            response = self._get_resource_group_response(result.stdout)
-            response_info = self.infer_rule.get_response_info(api)  # ResponseInfo
-            self._analyze_response(response, response_info)
+                        # check if any info can be infered from the response, the
+                        # pages of a call are analyzed as soon as they are fetched
+                        page = self._get_resource_group_response(result.response)
+                        self._handle_response(
+                            scheduler,
+                            api,
+                            page,
+                            full_api,
+                            offset,
+                            last=not result.next_token,
+                        )
+                        if result.next_token and self.journal is not None:
+                            spool = spool or JournalSpool(full_api)
+                        if spool is not None:
+                            spool.write(result.response)
+                        if result.next_token:
+                            future = self._submit_page(
+                                executor, api, full_api, result.next_token
+                            )
+                            running[future] = (
+                                order,
+                                invocation,
+                                full_api,
+                                pages + 1,
+                                spool,
+                                offset + len(page),
+                            )
+                            continue
 
-            # add relevant API calls to the queue
-            for relevant_api in self.infer_rule.get_relevant_apis(api):
-                if relevant_api not in api_queue:
-                    api_queue.append(relevant_api)
+                        self.executed_calls += 1
+                        response = result.response
+                        if pages:
+                            # the pages were analyzed as they arrived and are not
+                            # kept, only this worker runs paged calls
+                            response = []
+                        self.ledger.record(full_api, response)
+                        self.ledger_calls[api].append(full_api)
+                        if spool is not None:
+                            self.journal.append_spool(spool)
+                        else:
+                            self._record_journal(full_api, response)
+
+                if self.journal is not None:
+                    self.journal.checkpoint()
+                running_apis = {
+                    invocation.api_call
+                    for _, invocation, *_ in list(running.values()) + deferred
+                }
+                yield from self._iter_complete_tftypes(
+                    scheduler, lifted_tftypes, running_apis
+                )
+                self._evict_completed(
+                    scheduler,
+                    running_apis,
+                    {full_api for _, _, full_api, *_ in running.values()},
+                )
+
+        # no more APIs can be resolved, report those that never became runnable
+        self._print_unresolved_apis(scheduler)
+        self.pruned_apis = len(scheduler.pruned)
+        for api, calls in invocations.items():
+            self.cost_model.observe_fanout(api, calls)
+        self.cost_model.save()
+
+        # every API has run, the remaining TF types are complete
+        yield from self._iter_complete_tftypes(scheduler, lifted_tftypes)
+        self._evict_completed(scheduler)
+
+    def _iter_complete_tftypes(
+        self, scheduler: APIScheduler, lifted_tftypes: set, running=()
+    ):
+        """
+        Infer and yield the instances of the TF types no pending API can provide
+        ID components for, then drop their ID values.
+        @param running: APIs with calls still fetching pages
+        """
+        # APIs that may still run: running, runnable, waiting, or submitted by those
+        pending = set()
+        frontier = list(running) + list(scheduler.ready) + list(scheduler.waiting)
+        while frontier:
+            api = frontier.pop()
+            if api in pending or not scheduler.accepts(api):
+                continue
+            pending.add(api)
+            frontier.extend(self.infer_rule.get_relevant_apis(api))
+        pending_tftypes = {
+            schema.tftype
+            for api in pending
+            if api in self.infer_rule.api_response_map
+            for schema in self.infer_rule.api_response_map[api].tftypes_schemas
+        }
 
-        # after BFS, process the tfid_map to get the lifted instances
         tftypes = set()
         for schema in self.tfid_map:
-            tftypes.add(schema.tftype)
-        # check each inferable TF type
-        for tftype in tftypes:
-            self._infer_tfinstance(tftype)
+            if self.only_types is None or schema.tftype in self.only_types:
+                tftypes.add(schema.tftype)
+        for tftype in sorted(tftypes - pending_tftypes - lifted_tftypes):
+            lifted_tftypes.add(tftype)
+            yield from self._infer_tfinstance(tftype)
+            for schema in [s for s in self.tfid_map if s.tftype == tftype]:
+                del self.tfid_map[schema]
+                self.lineage.id_records.pop(schema, None)
+
+    def plan_inference(self, only_types=None):
+        """
+        Dry run of lifting inference: discover the top-level resources, then print
+        the planned API dependency graph with the expected fan-out of every API and
+        the estimated calls and wall time, without running any dependent API.
+        @param only_types: TF types to lift, skip API calls not needed by them
+        """
+        self.only_types = set(only_types) if only_types else None
+        self._print_init_lifting()
+        scheduler = APIScheduler(self.infer_rule, self._is_arg_ready)
+        cloud_types = self._populate_top_api_queue(scheduler)
+        print_info(f"Top-level resources types: {cloud_types}")
+        self.logger.info(f"Top-level resources types: {cloud_types}")
+
+        # APIs answered by bulk discovery records are already bound
+        covered = {invocation.api_call for invocation in scheduler.bound}
+        top_apis = set(scheduler.ready) | set(scheduler.waiting) | covered
+        # the planned graph: edges from an API to those using its response
+        apis, frontier = set(), list(top_apis)
+        while frontier:
+            api = frontier.pop()
+            if api in apis or not scheduler.accepts(api):
+                continue
+            apis.add(api)
+            frontier.extend(self.infer_rule.get_relevant_apis(api))
+        producers = defaultdict(set)
+        for api in apis:
+            for relevant_api in self.infer_rule.get_relevant_apis(api) & apis:
+                if relevant_api != api:
+                    producers[relevant_api].add(api)
+
+        # waves in topological order, like the batches of lifting_inference
+        waves, fanouts, sources = {}, {}, {}
+        indegree = {api: len(producers[api]) for api in apis}
+        ready = sorted(api for api in apis if not indegree[api])
+        while ready:
+            api = ready.pop(0)
+            waves[api] = max((waves[p] + 1 for p in producers[api]), default=0)
+            fanouts[api], sources[api] = self._estimate_fanout(
+                api, covered, [fanouts[p] for p in producers[api]]
+            )
+            for relevant_api in sorted(self.infer_rule.get_relevant_apis(api) & apis):
+                if relevant_api in indegree and relevant_api != api:
+                    indegree[relevant_api] -= 1
+                    if not indegree[relevant_api]:
+                        ready.append(relevant_api)
+        # APIs in cyclic dependencies never become runnable
+        cyclic = sorted(apis - set(waves))
+        if cyclic:
+            print_error(f"[WARNNING] Cyclic argument dependency: {cyclic}")
+            self.logger.warning(f"Cyclic argument dependency: {cyclic}")
 
-        self.__post_process_instances()
+        rows, wave_costs = [], defaultdict(list)
+        for api in sorted(waves, key=lambda api: (waves[api], api)):
+            latency = self.cost_model.estimate(api, 1)
+            rows.append(
+                [
+                    waves[api],
+                    api,
+                    ", ".join(sorted(producers[api])) or "-",
+                    fanouts[api],
+                    sources[api],
+                    f"{fanouts[api] * latency:.1f}",
+                ]
+            )
+            if fanouts[api]:
+                wave_costs[waves[api]].append((fanouts[api], latency))
+        table = tabulate(
+            rows,
+            headers=["Wave", "API", "Depends on", "Fan-out", "Basis", "Cost (s)"],
+            tablefmt="pretty",
+        )
+        print_info(table)
+        self.logger.info(table)
+
+        # every wave runs its calls concurrently and waits for the slowest one
+        calls = sum(fanouts.values())
+        wall_time = sum(
+            max(
+                sum(fanout * latency for fanout, latency in costs)
+                / self.max_concurrency,
+                max(latency for _, latency in costs),
+            )
+            for costs in wave_costs.values()
+        )
+        table = tabulate(
+            [
+                ["Discovery API calls", self.executed_calls + self.reused_calls],
+                ["Planned APIs", len(waves)],
+                ["Pruned APIs", len(scheduler.pruned)],
+                ["Estimated API calls", calls],
+                ["Concurrency", self.max_concurrency],
+                ["Estimated wall time (s)", f"{wall_time:.1f}"],
+            ],
+            headers=["Lift Plan", "Estimate"],
+            tablefmt="pretty",
+        )
+        print_info(table)
+        self.logger.info(table)
+
+    def _estimate_fanout(self, api: str, covered: set, producer_fanouts: list):
+        """
+        Expected number of calls of `api` in a dry run, and what it is based on.
+        """
+        if api in covered:
+            return 0, "bulk"
+        fanout = len(self._resolve_args(api, self.infer_rule.get_required_args(api)))
+        if fanout:
+            return fanout, "known"
+        stat = self.cost_model.stats.get(api, {})
+        if "fanout" in stat:
+            return round(stat["fanout"]), "observed"
+        # assume every call of the producers provides a single argument value
+        return max(producer_fanouts, default=1), "assumed"
+
+    def _evict_completed(
+        self, scheduler: APIScheduler, running_apis=(), running_calls=()
+    ):
+        """
+        Once APIs can not run again, drop the origins of their arguments and their
+        invocations, and release their ledger responses no other worker reuses.
+        @param running_apis: APIs with calls still running
+        @param running_calls: full_api of the calls still running
+        """
+        # APIs still running, runnable, waiting, possible fallbacks, or submitted by
+        # those, regardless of the APIs allowed to run now
+        live = set()
+        frontier = list(running_apis) + list(scheduler.ready) + list(scheduler.waiting)
+        frontier += list(scheduler.pruned)
+        while frontier:
+            api = frontier.pop()
+            if api not in live:
+                live.add(api)
+                frontier.extend(self.infer_rule.get_relevant_apis(api))
+        # only when APIs completed since the last eviction
+        if self.live_apis is not None and not self.live_apis - live:
+            self.live_apis = live
+            return
+        self.live_apis = live
+
+        for api in [api for api in self.ledger_calls if api not in live]:
+            for full_api in self.ledger_calls.pop(api):
+                if self._is_group_scoped(full_api):
+                    self.ledger.release(full_api)
+        scheduler.release(live)
+        self.lineage.evict(live, set(running_calls))
+
+    def _is_group_scoped(self, full_api: str) -> bool:
+        """
+        Whether a call is only made by the worker of this resource group.
+        """
+        return False
 
     def _print_init_lifting(self):
         raise NotImplementedError
 
-    def _resolve_args(self) -> bool:
+    def _handle_response(
+        self,
+        scheduler: APIScheduler,
+        api: str,
+        response,
+        full_api: str,
+        offset=0,
+        last=True,
+    ):
+        """
+        Analyze a response of `api` called as `full_api`
+        and schedule the APIs depending on it.
+        @param offset: index of the first record when the response is a page
+        @param last: the response is complete, not followed by another page
+        """
+        response_info = self.infer_rule.get_response_info(api)  # ResponseInfo
+        matches = response_info.get_extractor().find_records(response, offset)
+        if self.state:
+            # values of calls that can be revalidated are kept for the next lift
+            unchanged = self.state.record(
+                full_api,
+                response,
+                None if self._is_listing(api) else matches,
+                last,
+            )
+            if unchanged is False:
+                self.changed_calls += 1
+        self._handle_matches(scheduler, api, matches, full_api)
+
+    def _handle_matches(
+        self, scheduler: APIScheduler, api: str, matches: dict, full_api: str
+    ):
+        """
+        Analyze the values extracted from a response of `api` called as `full_api`
+        and schedule the APIs depending on it.
+        @param matches: {jsonpath: [(path, value)]}, see `SchemaExtractor.find_records`
+        """
+        response_info = self.infer_rule.get_response_info(api)  # ResponseInfo
+        self._analyze_matches(matches, response_info, full_api)
+
+        # wake up APIs waiting on the arguments and add relevant API calls
+        scheduler.notify(response_info.apiarg_schemas)
+        for relevant_api in self.infer_rule.get_relevant_apis(api):
+            scheduler.submit(relevant_api)
+
+    def _submit_page(self, executor, api: str, full_api: str, token=None):
+        """
+        Start running `full_api` in the executor, or its page after `token`
+        if the API is paged. Return the Future of its APIResult.
+        """
+        stream = self._is_streamed(api)
+        page_api = self._get_page_call(api, full_api, token)
+        if page_api is None:
+            return executor.submit(self._run_api_call, full_api, api, stream)
+        self.fetched_pages += 1
+        return executor.submit(self._run_api_call, page_api, api, stream, True)
+
+    def _get_page_call(self, api: str, full_api: str, token=None):
+        """
+        Return the command fetching the page of `full_api` after `token`,
+        None if the API is not paged. The pages of a call are not kept,
+        so only calls no other worker reuses may be paged.
+        """
+        return None
+
+    def _run_api_call(
+        self, full_api: str, api=None, stream=False, paged=False
+    ) -> APIResult:
+        """
+        Run a single cloud API call and parse its output, may be called from worker
+        threads. If `api` is given, the cost of the call is observed for planning.
+        @param stream: parse the items of a list output one by one as they are read,
+            only keeping the records relevant to the run
+        @param paged: the output is a page, closed by the token of the next one
+        """
+        print_info(f"Running command: {full_api}")
+        self.logger.info(f"Running command: {full_api}")
+        start = time.monotonic()
+        page = None
+        if stream:
+            try:
+                records = stream_cloud_cmd(full_api, account=self.account)
+                if paged:
+                    records = page = CloudPage(records)
+                response = self._filter_records(records, api)
+            except subprocess.CalledProcessError as e:
+                return APIResult(e.returncode, None, e.stderr)
+            # the output size is unknown, the latency covers reading it
+            size = 0
+        else:
+            result = run_cloud_cmd(full_api, account=self.account)
+            if result.returncode != 0:
+                return APIResult(result.returncode, None, result.stderr)
+            response = json.loads(result.stdout)
+            if paged and isinstance(response, list):
+                page = CloudPage(response)
+                response = list(page)
+            size = len(result.stdout)
+        if api:
+            self.cost_model.observe(api, time.monotonic() - start, size)
+        return APIResult(0, response, "", page.next_token if page else None)
+
+    def _is_streamed(self, api: str) -> bool:
+        """
+        Outputs of APIs reading the items of a list are parsed item by item.
+        """
+        return Config["lift_stream_responses"] and self._is_listing(api)
+
+    def _is_listing(self, api: str) -> bool:
+        """
+        Whether the rules of `api` read the items of a list response.
+        """
+        return reads_list_items(self.infer_rule.get_response_info(api).schema_map)
+
+    def _filter_records(self, records, api=None) -> list:
+        """
+        Keep the values the rules of `api` read in the records of a streamed list
+        output that workers of the run may use, as each record is parsed.
+        """
+        if api and api not in self.pruners:
+            self.pruners[api] = build_pruner(
+                self.infer_rule.get_response_info(api).schema_map, self.record_fields
+            )
+        # records of discovery calls are read by the rules of many APIs
+        prune = self.pruners.get(api)
+        return [
+            prune(record) if prune else record
+            for record in records
+            if self._is_run_record(record)
+        ]
+
+    def _is_run_record(self, record) -> bool:
+        return True
+
+    def load_state(self, path: str):
+        """
+        Lift incrementally from the state of the previous lift saved at `path`:
+        calls that do not list items, bound only with records unchanged since the
+        previous lift, are revalidated instead of run again, and instances keep
+        their names. The state is updated after lifting.
+        """
+        self.state = LiftState(path)
+        if self.state.loaded:
+            msg = (
+                f"Loaded the previous lift from {path}, "
+                f"{len(self.state.responses)} responses, "
+                f"{len(self.state.names)} instances"
+            )
+        else:
+            msg = f"No previous lift at {path}, lifting from scratch"
+        print_info(msg)
+        self.logger.info(msg)
+
+    def open_journal(self, path: str, resume=False):
+        """
+        Journal the responses of executed calls to `path`, so that an interrupted
+        lift can be resumed. If `resume`, calls completed in the journal are not
+        run again.
+        """
+        self.journal = LiftJournal(path, resume, Config["lift_journal_sync_interval"])
+        if resume:
+            msg = f"Resuming from {path}, {len(self.journal)} completed API calls"
+            print_info(msg)
+            self.logger.info(msg)
+
+    def close_journal(self):
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+    def _record_journal(self, full_api: str, response):
+        # duplicate calls are answered by the ledger, also when resuming
+        if self.journal is not None:
+            self.journal.append(full_api, response)
+
+    def _get_saved_response(self, full_api: str):
+        """
+        Return the response of a call completed before the lift was interrupted,
+        otherwise None.
+        """
+        if self.journal is not None:
+            response = self.journal.pop(full_api)
+            if response is not None:
+                self.replayed_calls += 1
+                return response
+        return None
+
+    def _revalidate(self, api: str, full_api: str):
+        """
+        Return the values extracted from the response of a call in the previous
+        lift if every record the call is bound with is unchanged, by its ETag and
+        hash, otherwise None so that the call runs. Listings always run, they find
+        the children added or removed below unchanged records.
+        """
+        if not self.state or self._is_listing(api):
+            return None
+        parents = self.lineage.call_parents.get(full_api)
+        if not parents or not all(
+            self.state.is_unchanged_record(origin.full_api, origin.path)
+            for origin in parents
+        ):
+            return None
+        return self.state.revalidate(
+            full_api, self.infer_rule.get_response_info(api).schema_map
+        )
+
+    def print_diff(self, path=None):
+        """
+        Print the instances added and removed since the previous lift,
+        and write them as JSON lines to `path` if given.
+        """
+        if not self.state:
+            return
+        added, removed = self.state.diff(self.import_instances)
+        changes = [("+", instance._asdict()) for instance in added] + [
+            ("-", instance) for instance in removed
+        ]
+        table = tabulate(
+            [
+                [change, instance["tftype"], instance["name"], instance["id"]]
+                for change, instance in changes
+            ],
+            headers=["Change", "TF Type", "Name", "ID"],
+            tablefmt="pretty",
+        )
+        print_info(table)
+        self.logger.info(table)
+        msg = (
+            f"{len(added)} instances added, {len(removed)} removed since the last lift"
+        )
+        print_info(msg)
+        self.logger.info(msg)
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "w") as f:
+                for change, instance in changes:
+                    f.write(json.dumps({"change": change, **instance}) + "\n")
+
+    def _run_shared_call(self, full_api: str, stream=False):
+        """
+        Run a command at most once for all workers sharing the ledger.
+        Return its parsed response, raise RuntimeError if it failed.
+        @param stream: see `_run_api_call`
+        """
+        response = self.journal.pop(full_api) if self.journal is not None else None
+        if response is not None:
+            self.replayed_calls += 1
+            if self.ledger.claim(full_api):
+                self.ledger.record(full_api, response)
+            return response
+        if not self.ledger.claim(full_api):
+            response = self.ledger.lookup(full_api)
+            if response is None:
+                raise RuntimeError(f"{full_api} failed in an earlier lifting")
+            self.reused_calls += 1
+            return response
+        self.executed_calls += 1
+        result = self._run_api_call(full_api, stream=stream)
+        if result.returncode != 0:
+            self.ledger.fail(full_api)
+            self.failed_calls += 1
+            raise RuntimeError(f"{full_api} failed: {result.stderr}")
+        response = result.response
+        self.ledger.record(full_api, response)
+        self.ledger_calls[None].append(full_api)
+        self._record_journal(full_api, response)
+        return response
+
+    def _print_lift_summary(self):
+        table = tabulate(
+            [
+                ["Executed API calls", self.executed_calls],
+                ["Failed API calls", self.failed_calls],
+                ["Bulk-covered API calls", self.covered_calls],
+                ["Reused API calls", self.reused_calls],
+                ["Ledger hits", self.ledger.hits],
+                ["Ledger misses", self.ledger.misses],
+                ["Changed API responses", self.changed_calls],
+                ["Revalidated API calls", self.revalidated_calls],
+                ["Replayed API calls", self.replayed_calls],
+                ["Fetched pages", self.fetched_pages],
+                ["Pruned APIs", self.pruned_apis],
+                ["Lifted instances", len(self.import_instances)],
+            ],
+            headers=["Lift Summary", "Count"],
+            tablefmt="pretty",
+        )
+        print_info(table)
+        self.logger.info(table)
+
+    def _print_unresolved_apis(self, scheduler: APIScheduler):
+        starved = scheduler.get_starved_apis()
+        if not starved:
+            return
+        for api, missing in sorted(starved.items()):
+            arg_names = sorted(arg.arg_name for arg in missing)
+            print_error(f"[WARNNING] {api} never ran, missing args: {arg_names}")
+            self.logger.warning(f"{api} never ran, missing args: {arg_names}")
+        for cycle in scheduler.get_cycles():
+            print_error(f"[WARNNING] Cyclic argument dependency: {sorted(cycle)}")
+            self.logger.warning(f"Cyclic argument dependency: {sorted(cycle)}")
+
+    def _is_arg_ready(self, arg) -> bool:
         """
-        Check if all required arguments are ready in the arg_map.
+        Check if the InferAPIArg has any value to run the API with.
+        """
+        return bool(self.apiarg_map.get(arg))
+
+    def _resolve_args(self) -> list:
+        """
+        Expand every combination of the ready argument values of an API.
+        Return a list of arg_map, empty if any required argument is not ready.
         """
         raise NotImplementedError
 
     def _populate_top_api_queue(self):
         """
-        Search for top-level resources in the resource group and populate the API queue.
+        Search for top-level resources in the resource group, load the rules reachable
+        from their cloud types and submit their APIs to the scheduler.
         Return the set of cloud types found in the resource group.
         """
         raise NotImplementedError
 
-    def _analyze_response(self):
+    def _analyze_matches(self):
         raise NotImplementedError
 
     def _infer_tfinstance(self):
+        """
+        Yield LiftedInstance of a TF type assembled from its ID components.
+        """
         raise NotImplementedError
 
     def save_lifted_instances(self, path: str, imported=False):
@@ -126,17 +1016,88 @@ class InferWorker:
         print_info(table)
         self.logger.info(table)
 
-    def __post_process_instances(self):
+    def open_import_stream(self, path: str):
+        """
+        Stream Terraform import blocks of the instances to `path` while lifting,
+        and their inventory to a JSON-lines file next to it.
+        """
+        jsonl_path = os.path.splitext(path)[0] + ".jsonl"
+        self.import_writer = ImportBlockWriter(
+            path, jsonl_path, self._get_provider_config()
+        )
+        msg = f"Streaming import blocks to {path} and inventory to {jsonl_path}"
+        print_info(msg)
+        self.logger.info(msg)
+
+    def close_import_stream(self):
+        if self.import_writer:
+            self.import_writer.close()
+            self.import_writer = None
+
+    def __post_process_instances(self, lifted_instances: list):
         tftypes = defaultdict(set)
-        for instance in self.lifted_instances:
+        for instance in lifted_instances:
             tftypes[instance.tftype].add(instance.id)
         for tftype, ids in tftypes.items():
-            for i, id in enumerate(ids):
-                self.import_instances.append(ImportInstance(tftype, f"example-{i}", id))
+            names = self._get_instance_names(tftype, ids)
+            instances = [ImportInstance(tftype, names[id], id) for id in sorted(ids)]
+            self.import_instances.extend(instances)
+            if self.import_writer:
+                self.import_writer.write(instances)
+
+    def _get_instance_names(self, tftype: str, ids: set) -> dict:
+        """
+        Stable resource names of the IDs: the name given in the previous lift,
+        otherwise the last ID segment, with a short hash of the ID if it is taken.
+        """
+        names = {}
+        if self.state:
+            for id in ids:
+                if self.state.get_name(tftype, id):
+                    names[id] = self.state.get_name(tftype, id)
+        used = set(names.values())
+        for id in sorted(ids - set(names)):
+            name = re.sub(r"[^A-Za-z0-9_-]", "_", id.rstrip("/").split("/")[-1])
+            if not re.match(r"[A-Za-z_]", name):
+                name = f"_{name}"
+            if name in used:
+                name = f"{name}_{hashlib.sha256(id.encode()).hexdigest()[:8]}"
+            names[id] = name
+            used.add(name)
+        return names
+
+    def _get_provider_config(self) -> str:
+        raise NotImplementedError
 
     def _save_instance_topo(self):
         raise NotImplementedError
 
+    def _plan_imported_config(self, provider: str, buffer_dir: str) -> str:
+        """
+        Generate the config of all import instances by sharded `terraform plan`.
+        Instances failing the plan are reported and left out.
+        """
+        msg = (
+            f"Running terraform import of {len(self.import_instances)} instances "
+            f"in {Config['import_shards']} shards..."
+        )
+        print_info(msg)
+        self.logger.info(msg)
+        content, failed = plan_imports(
+            provider,
+            self.import_instances,
+            buffer_dir,
+            Config["import_shards"],
+            Config["terraform_plugin_cache"],
+        )
+        for instance, result in failed:
+            print_error(f"[WARNNING] Failed to import {instance.tftype} {instance.id}")
+            print_cmd_result(result)
+            self.logger.warning(
+                f"Failed to import {instance.tftype} {instance.id}\n{result.stderr}"
+            )
+        return content
+
     def _save_instance_imported(self):
         raise NotImplementedError
 
@@ -145,7 +1106,7 @@ class InferWorker:
 
     def _get_resource_group_response(self):
         """
-        Get all resources in the self resource group
+        Get all resources of a parsed response in the self resource group
         """
         raise NotImplementedError
 
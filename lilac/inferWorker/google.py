@@ -1,10 +1,6 @@
-import os
 import json
-import subprocess
 
-from jsonpath_ng import parse
-
-from lilac.utils import Config, print_info, print_cmd_result
+from lilac.utils import Config, print_info
 from lilac.inferRule import (
     InferRule,
     InferAPIArg,
@@ -13,14 +9,16 @@ from lilac.inferRule import (
     GoogleResponseInfo,
 )
 from lilac.queryRule import GoogleQueryRule
+from lilac.queryBackend import run_cloud_cmd
 
 from .base import InferWorker, LiftedInstance
+from .lineage import Origin
 
 GOOGLE_SELFLINK_PREFIX = "https://www.googleapis.com/"
 
 
 class GoogleInferWorker(InferWorker):
-    def __init__(self):
+    def __init__(self, max_concurrency=None):
         self.project = Config["google_project"]
         if not self.project:
             raise ValueError("google_project is not set in global-config.yml")
@@ -30,7 +28,11 @@ class GoogleInferWorker(InferWorker):
         self.zone = Config["google_zone"]
         if not self.zone:
             raise ValueError("google_zone is not set in global-config.yml")
-        super().__init__(infer_rule=InferRule(GoogleResponseInfo))
+        super().__init__(
+            infer_rule=InferRule(GoogleResponseInfo),
+            account=self.project,
+            max_concurrency=max_concurrency,
+        )
 
     def _print_init_lifting(self):
         print_info(f"Start lifting inference in project {self.project}...")
@@ -39,14 +41,10 @@ class GoogleInferWorker(InferWorker):
                             self.project}..."
         )
 
-    def prepare_infer_rules(self, query_rule_paths: list):
-        for path in query_rule_paths:
-            query_rule = GoogleQueryRule.load(path)
-            self.infer_rule.add_query_rule(query_rule)
-        print_info(self.infer_rule)
-        self.logger.info(self.infer_rule)
+    def _load_query_rule(self, path: str):
+        return GoogleQueryRule.load(path)
 
-    def _populate_top_api_queue(self, api_queue):
+    def _populate_top_api_queue(self, scheduler):
         print_info(
             f'Running command: gcloud asset search-all-resources --project="{
                    self.project}" --format json'
@@ -54,61 +52,67 @@ class GoogleInferWorker(InferWorker):
         self.logger.info(
             f'Running command: gcloud asset search-all-resources --project="{self.project}" --format json'
         )
-        result = subprocess.run(
+        result = run_cloud_cmd(
             f'gcloud asset search-all-resources --project="{self.project}" --format json',
-            stdout=subprocess.PIPE,
-            shell=True,
-            text=True,
+            account=self.account,
         )
         rg_resource = json.loads(result.stdout)
         cloud_types = set()
         for resource in rg_resource:
-            cloudtype = resource["assetType"]
-            cloud_types.add(cloudtype)
+            cloud_types.add(resource["assetType"])
+        self._prepare_rules(scheduler, cloud_types)
+
+        for cloudtype in sorted(cloud_types):
             cloudtype_apis = self.infer_rule.get_cloudtype_apis(
                 cloudtype
             )  # set of api_call
             for api in cloudtype_apis:
-                if api not in api_queue:
-                    api_queue.append(api)
+                scheduler.submit(api)
         return cloud_types
 
-    def _analyze_response(self, response, response_info):
+    def _analyze_matches(self, matches, response_info, full_api):
         for expr, schemas in response_info.schema_map.items():
-            jsonpath_expr = parse(expr)
-            values = {match.value for match in jsonpath_expr.find(response)}
-            cleaned_values = set()
-            for value in values:
+            cleaned_records = set()
+            for path, value in matches[expr]:
                 if isinstance(value, str) and value.startswith(GOOGLE_SELFLINK_PREFIX):
                     value = value[len(GOOGLE_SELFLINK_PREFIX) :]
                     value = "/".join(value.split("/")[2:])
-                    cleaned_values.add(value)
+                    cleaned_records.add((path, value))
                 else:
-                    cleaned_values.add(str(value))
+                    cleaned_records.add((path, str(value)))
+            cleaned_values = {value for _, value in cleaned_records}
             for schema in schemas:
                 if isinstance(schema, GoogleIDSchema):
                     self.tfid_map[schema].update(cleaned_values)
+                    for path, value in cleaned_records:
+                        self.lineage.add_id(schema, value, Origin(full_api, path))
                 elif isinstance(schema, InferAPIArg):
                     self.apiarg_map[schema].update(cleaned_values)
+                    for path, value in cleaned_records:
+                        self.lineage.add_arg(schema, value, Origin(full_api, path))
 
-    def _resolve_args(self, api_queue, api, arg_names, arg_map):
-        args_ready = True
+    def _is_arg_ready(self, arg) -> bool:
+        # TODO: gcloud args are not filled in yet, never block on them
+        return True
+
+    def _resolve_args(self, api, arg_names):
         # TODO: fill in gcloud args
-        return args_ready
+        return [{}]
 
     def _infer_tfinstance(self, tftype):
         tfid_components = self.infer_rule.get_id_components(tftype)
         # Type 1: whole ID corresponds to the TF type
         if len(tfid_components) == 1:
-            assert tfid_components.pop() == "ID"
+            # the components are shared by workers using the same InferRule
+            assert next(iter(tfid_components)) == "ID"
             for id in self.tfid_map[GoogleIDSchema(GoogleIDType.ID, tftype)]:
-                self.lifted_instances.append(LiftedInstance(tftype, id))
+                yield LiftedInstance(tftype, id)
 
-        # Type 2: baseID and child components
+        # Type 2: baseID and child components, joined by the records they came from
         elif "baseID" in tfid_components:
-            ids = []
-            for id in self.tfid_map[GoogleIDSchema(GoogleIDType.BASE_CHILD, tftype)]:
-                ids.append(id)
+            ids = self.lineage.get_records(
+                GoogleIDSchema(GoogleIDType.BASE_CHILD, tftype)
+            )
             child_num = len(tfid_components) - 1
             for i in range(child_num):
                 child_key = self._get_child_key(i, tfid_components)
@@ -116,31 +120,35 @@ class GoogleInferWorker(InferWorker):
                     child_key
                 ), f"child_{
                     i} not found in tfid_components of {tftype}"
-                running_ids = []
-                for child in self.tfid_map[
-                    GoogleIDSchema(GoogleIDType.BASE_CHILD, tftype, child_key)
-                ]:
-                    for id in ids:
-                        running_ids.append(
-                            f"{id}/{child_key[len('child_i_'):]}/{child}"
-                        )
-                ids = running_ids
-            for id in ids:
-                self.lifted_instances.append(LiftedInstance(tftype, id))
+                segment = child_key[len("child_i_") :]
+                ids = self.lineage.join(
+                    ids,
+                    self.lineage.get_records(
+                        GoogleIDSchema(GoogleIDType.BASE_CHILD, tftype, child_key)
+                    ),
+                    lambda id, child: f"{id}/{segment}/{child}",
+                )
+            for id in sorted({id for id, _ in ids}, key=str):
+                yield LiftedInstance(tftype, id)
 
         else:
-            ids = [self.project]
+            ids = {
+                (f"{self.project}/{comp}", origin)
+                for comp, origin in self.lineage.get_records(
+                    GoogleIDSchema(GoogleIDType.COMPONENT, tftype, "component_0")
+                )
+            }
             comp_num = len(tfid_components)
-            for i in range(comp_num):
-                running_ids = []
-                for comp in self.tfid_map[
-                    GoogleIDSchema(GoogleIDType.COMPONENT, tftype, f"component_{i}")
-                ]:
-                    for id in ids:
-                        running_ids.append(f"{id}/{comp}")
-                ids = running_ids
-            for id in ids:
-                self.lifted_instances.append(LiftedInstance(tftype, id))
+            for i in range(1, comp_num):
+                ids = self.lineage.join(
+                    ids,
+                    self.lineage.get_records(
+                        GoogleIDSchema(GoogleIDType.COMPONENT, tftype, f"component_{i}")
+                    ),
+                    lambda id, comp: f"{id}/{comp}",
+                )
+            for id in sorted({id for id, _ in ids}, key=str):
+                yield LiftedInstance(tftype, id)
 
     def _save_instance_topo(self, path: str):
         content = f"""provider "google" {{
@@ -158,47 +166,15 @@ resource "{instance.tftype}" "{instance.name}" {{
         with open(path, "w") as f:
             f.write(content)
 
-    def _save_instance_imported(self, output_path: str, buffer_dir="cache"):
-        import_file = f"""provider "google" {{
+    def _get_provider_config(self) -> str:
+        return f"""provider "google" {{
     project     = "{self.project}"
     region      = "{self.region}"
 }}
 """
-        for instance in self.import_instances:
-            import_file += f"""
-import {{
-    id = "{instance.id}"
-    to = {instance.tftype}.{instance.name}
-}}
-"""
-        with open(os.path.join(buffer_dir, "import.tf"), "w") as f:
-            f.write(import_file)
-
-        if os.path.exists(os.path.join(buffer_dir, "imported.tf")):
-            os.remove(os.path.join(buffer_dir, "imported.tf"))
-
-        print_info("Running terraform import...")
-        if not os.path.exists(os.path.join(buffer_dir, ".terraform")):
-            subprocess.run(
-                "terraform init",
-                cwd=buffer_dir,
-                shell=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-            )
-        result = subprocess.run(
-            "terraform plan -generate-config-out=imported.tf",
-            cwd=buffer_dir,
-            shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-        )
-        print_cmd_result(result)
 
-        with open(os.path.join(buffer_dir, "imported.tf"), "r") as f:
-            content = f.read()
+    def _save_instance_imported(self, output_path: str, buffer_dir="cache"):
+        content = self._plan_imported_config(self._get_provider_config(), buffer_dir)
         content = (
             f"""provider "google" {{
     project     = "{self.project}"
@@ -214,6 +190,6 @@ import {{
         # TODO: fill in gcloud command args using arg_map
         return api + " --format json"
 
-    def _get_resource_group_response(self, response: str):
+    def _get_resource_group_response(self, response):
         # TODO: how to isolate a group of resource?
-        return json.loads(response)
+        return response
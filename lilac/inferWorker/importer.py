@@ -0,0 +1,196 @@
+import os
+import re
+import json
+import shutil
+import subprocess
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+# header terraform writes on top of every generated config
+GENERATED_HEADER = (
+    "# __generated__ by Terraform\n"
+    "# Please review these resources and move them into your main configuration files.\n"
+)
+
+
+def get_import_block(instance) -> str:
+    return f"""
+import {{
+    id = "{instance.id}"
+    to = {instance.tftype}.{instance.name}
+}}
+"""
+
+
+class ImportBlockWriter:
+    """
+    Write Terraform import blocks of lifted instances to `tf_path` and their
+    inventory to a JSON-lines file as they are inferred, without terraform plan.
+    """
+
+    def __init__(self, tf_path: str, jsonl_path: str, provider: str):
+        for path in (tf_path, jsonl_path):
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.tf_file = open(tf_path, "w")
+        self.jsonl_file = open(jsonl_path, "w")
+        self.count = 0
+        self.tf_file.write(provider)
+        self.tf_file.flush()
+
+    def write(self, instances: list):
+        """
+        Append a batch of ImportInstance, readable by downstream tools right away.
+        """
+        for instance in instances:
+            self.tf_file.write(get_import_block(instance))
+            self.jsonl_file.write(json.dumps(instance._asdict()) + "\n")
+        self.count += len(instances)
+        self.tf_file.flush()
+        self.jsonl_file.flush()
+
+    def close(self):
+        self.tf_file.close()
+        self.jsonl_file.close()
+
+
+def is_generated_config_error(stderr: str) -> bool:
+    """
+    Whether every error of a failed plan is in the generated config, which terraform
+    writes after checking the import IDs even if it is not valid on its own,
+    e.g. with conflicting arguments.
+    """
+    errors = re.split(r"^\W*Error: ", stderr, flags=re.MULTILINE)[1:]
+    return bool(errors) and all("on imported.tf line" in error for error in errors)
+
+
+def _get_terraform_env(plugin_cache: str) -> dict:
+    # providers are downloaded once into the shared cache and linked into workspaces
+    return dict(
+        os.environ,
+        TF_PLUGIN_CACHE_DIR=os.path.abspath(plugin_cache),
+        TF_PLUGIN_CACHE_MAY_BREAK_DEPENDENCY_LOCK_FILE="1",
+    )
+
+
+def init_workspace(workspace: str, provider: str, plugin_cache: str):
+    """
+    Run `terraform init` of the provider once, the only writer of the plugin cache.
+    Shard workspaces copy the initialized `.terraform` instead of running init,
+    since the plugin cache is not safe for concurrent writers.
+    Return the CompletedProcess of the init.
+    """
+    os.makedirs(workspace, exist_ok=True)
+    with open(os.path.join(workspace, "provider.tf"), "w") as f:
+        f.write(provider)
+    return subprocess.run(
+        "terraform init",
+        cwd=workspace,
+        shell=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        env=_get_terraform_env(plugin_cache),
+    )
+
+
+def plan_shard(
+    workspace: str, provider: str, instances: list, plugin_cache: str, init_dir: str
+):
+    """
+    Run `terraform plan -generate-config-out` for a shard of import instances
+    in its own workspace initialized like `init_dir`, may be called from worker
+    processes. Return (generated config or None if the plan failed, CompletedProcess).
+    """
+    os.makedirs(workspace, exist_ok=True)
+    with open(os.path.join(workspace, "import.tf"), "w") as f:
+        f.write(provider + "".join(get_import_block(i) for i in instances))
+    imported_path = os.path.join(workspace, "imported.tf")
+    if os.path.exists(imported_path):
+        os.remove(imported_path)
+
+    # providers in `.terraform` are links into the plugin cache, cheap to copy
+    if not os.path.exists(os.path.join(workspace, ".terraform")):
+        shutil.copytree(
+            os.path.join(init_dir, ".terraform"),
+            os.path.join(workspace, ".terraform"),
+            symlinks=True,
+        )
+        lock_path = os.path.join(init_dir, ".terraform.lock.hcl")
+        if os.path.exists(lock_path):
+            shutil.copy(lock_path, workspace)
+    result = subprocess.run(
+        "terraform plan -no-color -generate-config-out=imported.tf",
+        cwd=workspace,
+        shell=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        env=_get_terraform_env(plugin_cache),
+    )
+    # generated config may not be syntatically correct, but the IDs are still valid
+    if not os.path.exists(imported_path) or (
+        result.returncode != 0 and not is_generated_config_error(result.stderr)
+    ):
+        return None, result
+    with open(imported_path, "r") as f:
+        content = f.read()
+    if content.startswith(GENERATED_HEADER):
+        content = content[len(GENERATED_HEADER) :]
+    return content, result
+
+
+def plan_imports(
+    provider: str, instances: list, buffer_dir: str, shards: int, plugin_cache: str
+):
+    """
+    Generate the config of the import instances with `shards` terraform plans
+    running in parallel processes, one workspace per shard under `buffer_dir`.
+    A failed shard is split in halves and planned again, until the instances
+    failing on their own are isolated.
+    Return (generated config merged in the order of instances,
+    list of (failed instance, CompletedProcess of its plan)).
+    """
+    instances = sorted(instances, key=lambda i: (i.tftype, i.name, i.id))
+    if not instances:
+        return "", []
+    os.makedirs(plugin_cache, exist_ok=True)
+    init_dir = os.path.join(buffer_dir, "import-shards", "init")
+    result = init_workspace(init_dir, provider, plugin_cache)
+    if result.returncode != 0:
+        return GENERATED_HEADER, [(instance, result) for instance in instances]
+    shard_size = -(-len(instances) // max(shards, 1))
+    # key: (start, end) range of instances, value: generated config
+    fragments, failed = {}, {}
+    with ProcessPoolExecutor(max_workers=max(shards, 1)) as executor:
+        pending = {}  # key: Future, value: (start, end)
+
+        def submit(start, end):
+            workspace = os.path.join(buffer_dir, "import-shards", f"{start}-{end}")
+            future = executor.submit(
+                plan_shard,
+                workspace,
+                provider,
+                instances[start:end],
+                plugin_cache,
+                init_dir,
+            )
+            pending[future] = (start, end)
+
+        for start in range(0, len(instances), shard_size):
+            submit(start, min(start + shard_size, len(instances)))
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                start, end = pending.pop(future)
+                content, result = future.result()
+                if content is not None:
+                    fragments[(start, end)] = content
+                elif end - start > 1:
+                    # bisect to isolate the instances failing the plan
+                    middle = (start + end) // 2
+                    submit(start, middle)
+                    submit(middle, end)
+                else:
+                    failed[start] = (instances[start], result)
+
+    content = GENERATED_HEADER + "".join(fragments[key] for key in sorted(fragments))
+    return content, [failed[start] for start in sorted(failed)]
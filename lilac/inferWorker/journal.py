@@ -0,0 +1,118 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+
+from lilac.utils import normalize_cmd
+
+
+class LiftJournal:
+    """
+    Append-only journal of the responses analyzed in a lifting run, one JSON line
+    per completed API invocation. Lifting inference is deterministic given the
+    responses, so replaying the journal rebuilds the argument and ID maps and the
+    scheduler state, and a resumed run continues after the last completed call.
+    """
+
+    def __init__(self, path: str, resume=False, sync_interval=0):
+        """
+        @param sync_interval: seconds between syncs to disk, 0 to sync at every checkpoint
+        """
+        self.path = path
+        self.sync_interval = sync_interval
+        # key: normalized command, value: offset of its line in the resumed journal,
+        # responses are read back when replayed instead of kept in memory
+        self.offsets = {}
+        cut_off = False  # the last line was cut off by a crash
+        if resume and os.path.exists(path):
+            with open(path, "rb") as f:
+                offset = 0
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        entry = None
+                    if entry:
+                        self.offsets[normalize_cmd(entry["cmd"])] = offset
+                    offset += len(line)
+                    cut_off = not line.endswith(b"\n")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.file = open(path, "a" if resume else "w")
+        self.reader = open(path, "rb") if self.offsets else None
+        self.dirty = False  # entries appended since the last sync
+        self.synced = time.monotonic()
+        if cut_off:
+            self.file.write("\n")
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def pop(self, full_api: str):
+        """
+        Return the journaled response of a command and forget it,
+        None if it did not complete or was already replayed.
+        """
+        offset = self.offsets.pop(normalize_cmd(full_api), None)
+        if offset is None:
+            return None
+        self.reader.seek(offset)
+        return json.loads(self.reader.readline())["response"]
+
+    def append(self, full_api: str, response):
+        self.file.write(json.dumps({"cmd": full_api, "response": response}) + "\n")
+        self.dirty = True
+
+    def append_spool(self, spool: "JournalSpool"):
+        """
+        Append the response of a paged call spooled page by page, and close it.
+        """
+        spool.file.seek(0)
+        self.file.write(f'{{"cmd": {json.dumps(spool.full_api)}, "response": [')
+        shutil.copyfileobj(spool.file, self.file)
+        self.file.write("]}\n")
+        spool.close()
+        self.dirty = True
+
+    def checkpoint(self, force=False):
+        """
+        Make the appended entries durable, called whenever API calls completed.
+        Unless forced, entries are synced at most every `sync_interval` seconds.
+        """
+        if not self.dirty:
+            return
+        if not force and time.monotonic() - self.synced < self.sync_interval:
+            return
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.dirty = False
+        self.synced = time.monotonic()
+
+    def close(self):
+        if not self.file.closed:
+            self.checkpoint(force=True)
+            self.file.close()
+        if self.reader:
+            self.reader.close()
+
+
+class JournalSpool:
+    """
+    Response of a paged call, written to a temporary file as its pages arrive
+    so that they are not held in memory until the call completes.
+    """
+
+    def __init__(self, full_api: str):
+        self.full_api = full_api
+        self.file = tempfile.TemporaryFile("w+")
+        self.empty = True
+
+    def write(self, page: list):
+        for item in page:
+            if not self.empty:
+                self.file.write(", ")
+            self.file.write(json.dumps(item))
+            self.empty = False
+
+    def close(self):
+        self.file.close()
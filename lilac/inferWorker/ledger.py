@@ -0,0 +1,65 @@
+import threading
+
+from lilac.utils import normalize_cmd
+
+
+class ExecutionLedger:
+    """
+    Record of cloud API calls executed in a lifting run,
+    keyed by the normalized full command with its parsed response.
+    Responses are kept unfiltered so that workers lifting different
+    resource groups can share one ledger and partition them.
+    """
+
+    def __init__(self):
+        # key: normalized command, value: parsed response, None if pending or failed
+        self.entries = {}
+        self.failed = set()  # normalized commands that failed
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def claim(self, full_api: str) -> bool:
+        """
+        Return True if the command has not run yet and should be executed now,
+        False if it is a duplicate of an executed or running command.
+        """
+        key = normalize_cmd(full_api)
+        with self.lock:
+            if key in self.entries:
+                self.hits += 1
+                return False
+            self.entries[key] = None
+            self.misses += 1
+            return True
+
+    def record(self, full_api: str, response):
+        with self.lock:
+            self.entries[normalize_cmd(full_api)] = response
+
+    def fail(self, full_api: str):
+        with self.lock:
+            self.failed.add(normalize_cmd(full_api))
+
+    def has_failed(self, full_api: str) -> bool:
+        with self.lock:
+            return normalize_cmd(full_api) in self.failed
+
+    def lookup(self, full_api: str):
+        """
+        Return the parsed response of an executed command, or None if it failed.
+        """
+        with self.lock:
+            return self.entries.get(normalize_cmd(full_api))
+
+    def release(self, full_api: str):
+        """
+        Forget an executed command no worker will reuse, it runs again if claimed.
+        """
+        key = normalize_cmd(full_api)
+        with self.lock:
+            self.entries.pop(key, None)
+            self.failed.discard(key)
+
+    def __len__(self) -> int:
+        return len(self.entries)
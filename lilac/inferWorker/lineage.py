@@ -0,0 +1,183 @@
+from collections import namedtuple, defaultdict
+
+# the response record a value was extracted from:
+# the full API call and the indices of the wildcard steps leading to the value
+Origin = namedtuple("Origin", ["full_api", "path"])
+
+
+class Lineage:
+    """
+    Provenance of the values extracted in lifting inference.
+
+    Values of the same record share the prefix of their paths, e.g. the ID of a VM
+    at (0,) and the names of its data disks at (0, 0) and (0, 1). An API call bound
+    with argument values descends from the records those values came from.
+    ID components are joined along these relations instead of in cartesian products,
+    e.g. the ID of a VNet from `vnet show` with the names of its subnets from
+    `subnet list`, both bound with the name in the record of the VNet.
+    """
+
+    def __init__(self):
+        # key: (InferAPIArg, arg value), value: set of Origin
+        self.arg_origins = defaultdict(set)
+        # key: full_api, value: set of Origin of its argument values
+        self.call_parents = defaultdict(set)
+        # key: IDSchema, value: set of (ID component value, Origin)
+        self.id_records = defaultdict(set)
+        # calls whose response is a single record, with values outside of any list
+        self.object_calls = set()
+
+    def add_arg(self, arg, value, origin: Origin):
+        self.arg_origins[(arg, value)].add(origin)
+        if not origin.path:
+            self.object_calls.add(origin.full_api)
+
+    def add_id(self, schema, value, origin: Origin):
+        self.id_records[schema].add((value, origin))
+        if not origin.path:
+            self.object_calls.add(origin.full_api)
+
+    def bind_call(self, full_api: str, arg_values: dict):
+        """
+        Record the origins of the argument values a call runs with. A common value
+        comes from many records, only those related to the records of the other
+        argument values are kept, unless the arguments come from unrelated records.
+        @param arg_values: key: InferAPIArg, value: arg value
+        """
+        origins = [
+            self.arg_origins[(arg, value)]
+            for arg, value in arg_values.items()
+            if (arg, value) in self.arg_origins
+        ]
+        ancestors = {
+            origin: self.ancestors(origin)
+            for candidates in origins
+            for origin in candidates
+        }
+        # key: (i, origin of the i-th argument), value: indices of the arguments
+        # with an origin related to it
+        related = defaultdict(set)
+        for i, candidates in enumerate(origins):
+            for j in range(i + 1, len(origins)):
+                for origin in candidates:
+                    for other in origins[j]:
+                        if self._is_related(origin, other, ancestors):
+                            related[(i, origin)].add(j)
+                            related[(j, other)].add(i)
+        # arguments with an origin related to some origin of the i-th argument
+        related_args = defaultdict(set)
+        for (i, _), args in related.items():
+            related_args[i] |= args
+
+        for i, candidates in enumerate(origins):
+            for origin in candidates:
+                if related_args[i] <= related[(i, origin)]:
+                    self.call_parents[full_api].add(origin)
+
+    def evict(self, live_apis: set, running_calls: set):
+        """
+        Drop the origins of the arguments of APIs that can not run again,
+        and the parents of calls no remaining value or running call descends from.
+        """
+        for key in [
+            key for key in self.arg_origins if key[0].api_call not in live_apis
+        ]:
+            del self.arg_origins[key]
+        keep = set(running_calls)
+        for records in self.id_records.values():
+            keep |= {origin.full_api for _, origin in records}
+        for origins in self.arg_origins.values():
+            keep |= {origin.full_api for origin in origins}
+        frontier = list(keep)
+        while frontier:
+            for origin in self.call_parents.get(frontier.pop(), ()):
+                if origin.full_api not in keep:
+                    keep.add(origin.full_api)
+                    frontier.append(origin.full_api)
+        for full_api in [key for key in self.call_parents if key not in keep]:
+            del self.call_parents[full_api]
+        self.object_calls &= keep
+
+    def get_records(self, schema) -> set:
+        return self.id_records.get(schema, set())
+
+    def ancestors(self, origin: Origin) -> set:
+        """
+        Return the origin, the records containing it and those its call descends from.
+        """
+        ret, frontier = set(), [origin]
+        while frontier:
+            full_api, path = frontier.pop()
+            # from the record itself up to the whole response
+            for i in range(len(path), -1, -1):
+                ancestor = Origin(full_api, path[:i])
+                if ancestor in ret:
+                    break
+                ret.add(ancestor)
+            frontier.extend(self.call_parents.get(full_api, set()) - ret)
+        return ret
+
+    def _is_record(self, origin: Origin) -> bool:
+        """
+        Whether the origin is a single record: an item of a response,
+        or a whole response holding values outside of any list.
+        """
+        return bool(origin.path) or origin.full_api in self.object_calls
+
+    def _is_related(self, origin: Origin, other: Origin, ancestors: dict) -> bool:
+        """
+        Whether one origin contains or descends from the other, or both descend
+        from the same record, e.g. the responses of calls bound with its values.
+        @param ancestors: key: Origin, value: its ancestors
+        """
+        if origin in ancestors[other] or other in ancestors[origin]:
+            return True
+        return any(
+            self._is_record(ancestor)
+            for ancestor in ancestors[origin] & ancestors[other]
+        )
+
+    def join(self, left: set, right: set, combine) -> set:
+        """
+        Join two sets of (value, Origin) whose origins are related: one contains or
+        descends from the other, keeping the deeper origin, or both descend from the
+        same record, keeping both. If no origin is related to the other side, the
+        values can not be told apart by provenance and all of them are combined.
+        @param combine: callable(left value, right value) -> joined value
+        """
+        ancestors = {}
+        # key: record, value: list of (left value, left origin) in or below it
+        left_index = defaultdict(list)
+        for value, origin in left:
+            if origin not in ancestors:
+                ancestors[origin] = self.ancestors(origin)
+            for ancestor in ancestors[origin]:
+                if self._is_record(ancestor):
+                    left_index[ancestor].append((value, origin))
+
+        joined = set()
+        for right_value, right_origin in right:
+            if right_origin not in ancestors:
+                ancestors[right_origin] = self.ancestors(right_origin)
+            right_ancestors = ancestors[right_origin]
+            matches = set()
+            for ancestor in right_ancestors:
+                if self._is_record(ancestor):
+                    matches.update(left_index.get(ancestor, ()))
+            for left_value, left_origin in matches:
+                value = combine(left_value, right_value)
+                if left_origin in right_ancestors:
+                    joined.add((value, right_origin))
+                elif right_origin in ancestors[left_origin]:
+                    joined.add((value, left_origin))
+                else:
+                    joined.add((value, left_origin))
+                    joined.add((value, right_origin))
+        if joined or not left or not right:
+            return joined
+        return {
+            (combine(left_value, right_value), origin)
+            for left_value, left_origin in left
+            for right_value, right_origin in right
+            for origin in (left_origin, right_origin)
+        }
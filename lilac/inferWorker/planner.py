@@ -0,0 +1,202 @@
+import os
+import json
+import threading
+from collections import defaultdict
+
+from lilac.inferRule import InferAPIArg
+
+# seconds of a cloud CLI call never observed before
+DEFAULT_LATENCY = 2.0
+# weight of the newest observation in the moving averages
+EWMA_ALPHA = 0.3
+# cost of transferring and parsing response bytes, in bytes per second
+BYTES_PER_SECOND = 1 << 20
+
+
+class APICostModel:
+    """
+    Estimated cost of API calls in seconds, from the latency, response size
+    and fan-out observed in earlier lifting runs.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        # key: api_call, value: dict of latency, size and fanout moving averages
+        self.stats = {}
+        self.lock = threading.Lock()
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r") as f:
+                    self.stats = json.load(f)
+            except (OSError, ValueError):
+                self.stats = {}
+
+    def observe(self, api: str, latency: float, size: int):
+        """
+        Record a single invocation of `api`, may be called from worker threads.
+        """
+        with self.lock:
+            self._update(api, "latency", latency)
+            self._update(api, "size", size)
+
+    def observe_fanout(self, api: str, invocations: int):
+        with self.lock:
+            self._update(api, "fanout", invocations)
+
+    def _update(self, api: str, key: str, value: float):
+        stat = self.stats.setdefault(api, {})
+        if key in stat:
+            value = EWMA_ALPHA * value + (1 - EWMA_ALPHA) * stat[key]
+        stat[key] = value
+
+    def estimate(self, api: str, fanout=None) -> float:
+        """
+        Estimated seconds of running `api`, `fanout` times if known,
+        otherwise as many times as observed before.
+        """
+        stat = self.stats.get(api, {})
+        if fanout is None:
+            fanout = stat.get("fanout", 1)
+        latency = stat.get("latency", DEFAULT_LATENCY)
+        return fanout * (latency + stat.get("size", 0) / BYTES_PER_SECOND)
+
+    def save(self):
+        if not self.path:
+            return
+        with self.lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "w") as f:
+                json.dump(self.stats, f, indent=2, sort_keys=True)
+
+
+class APIPlanner:
+    """
+    Choose a cheapest set of APIs that still provides every ID schema of the target
+    TF types, by greedy weighted set cover. An API is only chosen together with the
+    cheapest APIs providing its arguments. Alternative APIs of the same ID schemas
+    are kept as fallbacks when a chosen API fails.
+    """
+
+    def __init__(self, infer_rule, cost, arg_known):
+        """
+        @param cost: callable(api_call) -> estimated seconds of running the API
+        @param arg_known: callable(InferAPIArg) -> bool, whether the argument
+            needs no other API to provide it
+        """
+        self.infer_rule = infer_rule
+        self.cost = cost
+        self.arg_known = arg_known
+        # key: InferAPIArg, value: set of api_call whose response provides it
+        self.arg_producers = defaultdict(set)
+        for api_call, response_info in infer_rule.api_response_map.items():
+            for arg in response_info.apiarg_schemas:
+                self.arg_producers[arg].add(api_call)
+
+        self.candidates = set()
+        self.targets = set()
+        self.selected = set()  # api_call chosen to run
+        self.failed = set()  # api_call with failed calls, never chosen again
+        self.plans = []  # (api_call, set of api_call it needs) in the order chosen
+
+    def plan(self, candidates: set, tftypes=None) -> set:
+        """
+        Return the APIs to run among `candidates` for the ID schemas of `tftypes`,
+        all TF types if None.
+        """
+        self.candidates = set(candidates)
+        self.targets = (
+            set(self.infer_rule.tfid_components) if tftypes is None else set(tftypes)
+        )
+        universe = set()
+        for api_call in self.candidates:
+            universe |= self._covers(api_call)
+        self._cover(universe)
+        return set(self.selected)
+
+    def fallback(self, failed_api: str) -> set:
+        """
+        Replace a failed API with alternatives for the ID schemas only it provided.
+        Return the newly chosen APIs.
+        """
+        if failed_api in self.failed:
+            return set()
+        self.failed.add(failed_api)
+        self.plans = [(api, plan) for api, plan in self.plans if failed_api not in plan]
+        covered = set()
+        for api, plan in self.plans:
+            for api_call in plan:
+                covered |= self._covers(api_call)
+        universe = set()
+        for api_call in self.candidates - self.failed:
+            universe |= self._covers(api_call)
+        before = set(self.selected)
+        self._cover(universe - covered)
+        return self.selected - before
+
+    def _cover(self, uncovered: set):
+        while uncovered:
+            # marginal costs change with every chosen plan
+            memo = {}
+            best, best_plan, best_ratio = None, None, None
+            for api_call in sorted(self.candidates - self.failed):
+                gain = self._covers(api_call) & uncovered
+                if not gain:
+                    continue
+                plan = self._get_plan(api_call, frozenset(), memo)
+                if plan is None:
+                    continue
+                for planned in plan:
+                    gain |= self._covers(planned) & uncovered
+                # only APIs not chosen yet add to the cost
+                cost = sum(self.cost(planned) for planned in plan - self.selected)
+                ratio = cost / len(gain)
+                if best_ratio is None or ratio < best_ratio:
+                    best, best_plan, best_ratio = api_call, plan, ratio
+            if best is None:
+                # the remaining ID schemas can not be provided by any API
+                return
+            self.selected |= best_plan
+            self.plans.append((best, best_plan))
+            for planned in best_plan:
+                uncovered -= self._covers(planned)
+
+    def _get_plan(self, api_call: str, visiting: frozenset, memo: dict):
+        """
+        Return `api_call` with the cheapest APIs providing its arguments,
+        or None if any argument can not be provided.
+        """
+        if api_call in memo:
+            return memo[api_call]
+        if api_call in visiting:
+            return None
+        visiting = visiting | {api_call}
+        plan = {api_call}
+        for arg_name in sorted(self.infer_rule.get_required_args(api_call)):
+            arg = InferAPIArg(api_call, arg_name)
+            if self.arg_known(arg):
+                continue
+            options = []
+            for producer in sorted(self.arg_producers[arg] & self.candidates):
+                if producer in self.failed:
+                    continue
+                producer_plan = self._get_plan(producer, visiting, memo)
+                if producer_plan is not None:
+                    cost = sum(self.cost(p) for p in producer_plan - self.selected)
+                    options.append((cost, producer_plan))
+            if not options:
+                return None
+            plan |= min(options, key=lambda option: option[0])[1]
+        # plans found while visiting a cycle depend on the path, do not memoize them
+        if len(visiting) == 1:
+            memo[api_call] = plan
+        return plan
+
+    def _covers(self, api_call: str) -> set:
+        response_info = self.infer_rule.api_response_map.get(api_call)
+        if response_info is None:
+            return set()
+        return {
+            schema
+            for schema in response_info.tftypes_schemas
+            if schema.tftype in self.targets
+        }
@@ -0,0 +1,170 @@
+from collections import deque, namedtuple, defaultdict
+
+from lilac.inferRule import InferAPIArg
+
+# a fully bound API call, args is a sorted tuple of (arg_name, arg_value)
+APIInvocation = namedtuple("APIInvocation", ["api_call", "args"])
+
+
+class APIScheduler:
+    """
+    Dependency-driven scheduler of API calls in lifting inference.
+
+    An API is only runnable once all its required arguments are satisfied.
+    APIs with missing arguments wait on those arguments instead of being
+    re-dequeued, and are woken up when a response provides them.
+    """
+
+    def __init__(self, infer_rule, arg_ready):
+        """
+        @param infer_rule: InferRule providing `api_args_map` and `relevant_api_map`
+        @param arg_ready: callable(InferAPIArg) -> bool, whether the argument has values
+        """
+        self.infer_rule = infer_rule
+        self.arg_ready = arg_ready
+
+        self.ready = deque()  # runnable api_call in FIFO order
+        self.queued = set()  # api_call in ready queue, for O(1) dedup
+        # key: api_call, value: set of missing InferAPIArg
+        self.waiting = {}
+        # key: InferAPIArg, value: set of api_call waiting for it
+        self.arg_waiters = defaultdict(set)
+        self.bound = set()  # APIInvocation already handed out to run
+        self.allowed = None  # api_call allowed to run, None if not restricted
+        self.pruned = set()  # submitted api_call dropped by the restriction
+
+    def __bool__(self) -> bool:
+        return bool(self.ready)
+
+    def restrict(self, apis: set):
+        """
+        Only schedule `apis` from now on, other submitted APIs are pruned.
+        """
+        self.allowed = set(apis)
+
+    def allow(self, apis: set):
+        """
+        Lift the restriction of `apis`, e.g. fallbacks of failed APIs.
+        """
+        if self.allowed is not None:
+            self.allowed |= apis
+        self.pruned -= apis
+
+    def accepts(self, api: str) -> bool:
+        return self.allowed is None or api in self.allowed
+
+    def submit(self, api: str):
+        """
+        Make `api` runnable if all its arguments are ready, otherwise let it wait.
+        """
+        if not self.accepts(api):
+            self.pruned.add(api)
+            return
+        if api in self.queued:
+            return
+        missing = {
+            InferAPIArg(api, arg_name)
+            for arg_name in self.infer_rule.get_required_args(api)
+            if not self.arg_ready(InferAPIArg(api, arg_name))
+        }
+        if missing:
+            self.waiting[api] = missing
+            for arg in missing:
+                self.arg_waiters[arg].add(api)
+            return
+        self.waiting.pop(api, None)
+        self.ready.append(api)
+        self.queued.add(api)
+
+    def notify(self, args: set):
+        """
+        Wake up APIs waiting on any of `args` that now have values.
+        """
+        for arg in args:
+            if arg not in self.arg_waiters or not self.arg_ready(arg):
+                continue
+            for api in self.arg_waiters.pop(arg):
+                missing = self.waiting.get(api)
+                if missing is None:
+                    continue
+                missing.discard(arg)
+                if not missing:
+                    self.submit(api)
+
+    def pop(self) -> str:
+        api = self.ready.popleft()
+        self.queued.discard(api)
+        return api
+
+    def bind(self, api: str, arg_map: dict):
+        """
+        Return the APIInvocation of `api` with `arg_map`, or None if already bound.
+        """
+        invocation = APIInvocation(api, tuple(sorted(arg_map.items())))
+        if invocation in self.bound:
+            return None
+        self.bound.add(invocation)
+        return invocation
+
+    def release(self, live_apis: set):
+        """
+        Drop the invocations of APIs other than `live_apis`, which can not run again.
+        """
+        self.bound = {
+            invocation for invocation in self.bound if invocation.api_call in live_apis
+        }
+
+    def get_starved_apis(self) -> dict:
+        """
+        Return APIs that can never run, with their missing arguments.
+        Only meaningful once the ready queue is drained.
+        """
+        return {api: set(missing) for api, missing in self.waiting.items()}
+
+    def get_cycles(self) -> list:
+        """
+        Return the strongly connected groups of starved APIs that wait on each other.
+        """
+        # key: InferAPIArg, value: set of api_call whose response provides it
+        arg_producers = defaultdict(set)
+        for api_call, response_info in self.infer_rule.api_response_map.items():
+            for arg in response_info.apiarg_schemas:
+                arg_producers[arg].add(api_call)
+
+        # edge: producer api -> consumer api, both starved
+        graph = defaultdict(set)
+        for api, missing in self.waiting.items():
+            for arg in missing:
+                for producer in arg_producers[arg]:
+                    if producer in self.waiting:
+                        graph[producer].add(api)
+
+        # Tarjan's algorithm
+        index, lowlink, on_stack = {}, {}, set()
+        stack, cycles = [], []
+
+        def strongconnect(node):
+            index[node] = lowlink[node] = len(index)
+            stack.append(node)
+            on_stack.add(node)
+            for succ in graph[node]:
+                if succ not in index:
+                    strongconnect(succ)
+                    lowlink[node] = min(lowlink[node], lowlink[succ])
+                elif succ in on_stack:
+                    lowlink[node] = min(lowlink[node], index[succ])
+            if lowlink[node] == index[node]:
+                component = set()
+                while True:
+                    succ = stack.pop()
+                    on_stack.discard(succ)
+                    component.add(succ)
+                    if succ == node:
+                        break
+                if len(component) > 1 or node in graph[node]:
+                    cycles.append(component)
+
+        for node in sorted(self.waiting):
+            if node not in index:
+                strongconnect(node)
+        return cycles
@@ -0,0 +1,165 @@
+import os
+import json
+import hashlib
+
+from lilac.utils import normalize_cmd
+
+# bump when the layout changes, older states are then ignored
+STATE_VERSION = 3
+
+
+def response_digest(response) -> str:
+    return hashlib.sha256(
+        json.dumps(response, sort_keys=True, separators=(",", ":")).encode()
+    ).hexdigest()
+
+
+class ResponseDigest:
+    """
+    Hashes of a response recorded page by page: of every item if it is a list,
+    and of the whole response.
+    """
+
+    def __init__(self):
+        self.items = None  # hashes of the items of a list response
+        self.whole = None  # hash of a response that is not a list
+
+    def update(self, page):
+        if not isinstance(page, list):
+            self.whole = response_digest(page)
+            return
+        if self.items is None:
+            self.items = []
+        # short hashes, only compared with those of the same command
+        self.items.extend(response_digest(item)[:16] for item in page)
+
+    def get_state(self) -> dict:
+        if self.items is None:
+            return {"sha256": self.whole}
+        whole = hashlib.sha256("".join(self.items).encode()).hexdigest()
+        return {"sha256": whole, "records": self.items}
+
+
+class LiftState:
+    """
+    Persisted result of lifting a resource group, to lift it again incrementally:
+    the hashes of the responses of the executed commands and of their records,
+    the values extracted from the responses of calls that can be revalidated,
+    and the lifted instances with the names given to them.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        # key: normalized command, value: {"sha256": hash of the response,
+        # "records": hashes of its items if it is a list,
+        # "matches": {jsonpath: [(path, value)]} if it can be revalidated}
+        self.responses = {}
+        # key: (tftype, id), value: instance name
+        self.names = {}
+        self.loaded = False
+        if os.path.exists(path):
+            try:
+                with open(path, "r") as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                state = None
+            if state and state.get("version") == STATE_VERSION:
+                self.responses = state["responses"]
+                self.names = {
+                    (instance["tftype"], instance["id"]): instance["name"]
+                    for instance in state["instances"]
+                }
+                self.loaded = True
+        # key: normalized command, value: set of the hashes of its previous records
+        self.previous_records = {}
+        # responses of this lift, saved as the next state
+        self.recorded = {}
+        # key: normalized command, value: ResponseDigest of a response being paged
+        self.digests = {}
+
+    def record(self, full_api: str, page, matches=None, last=True):
+        """
+        Record a response of this lift, or a page of it.
+        Return True if the whole response is the same as in the previous lift,
+        None until its last page is recorded.
+        @param matches: values extracted from the response, saved so that the call
+            can be revalidated instead of run in the next lift
+        """
+        key = normalize_cmd(full_api)
+        digest = self.digests.setdefault(key, ResponseDigest())
+        digest.update(page)
+        # records are compared as soon as they arrive, by the calls bound with them
+        self.recorded[key] = digest.get_state()
+        if not last:
+            return None
+        del self.digests[key]
+        if matches is not None:
+            self.recorded[key]["matches"] = matches
+        previous = self.responses.get(key)
+        return (
+            previous is not None and previous["sha256"] == self.recorded[key]["sha256"]
+        )
+
+    def is_unchanged_record(self, full_api: str, path: tuple) -> bool:
+        """
+        Whether the record at `path` of a response of this lift, the item of a list
+        or the whole response, is the same as in the previous lift.
+        """
+        key = normalize_cmd(full_api)
+        current, previous = self.recorded.get(key), self.responses.get(key)
+        if current is None or previous is None:
+            return False
+        if "records" not in current or not path:
+            return current["sha256"] == previous["sha256"]
+        if path[0] >= len(current["records"]):
+            return False
+        if key not in self.previous_records:
+            self.previous_records[key] = set(previous.get("records", ()))
+        return current["records"][path[0]] in self.previous_records[key]
+
+    def revalidate(self, full_api: str, exprs):
+        """
+        Return the values extracted by `exprs` from the response of the previous
+        lift, and keep them for the next one. None if they were not saved.
+        """
+        key = normalize_cmd(full_api)
+        previous = self.responses.get(key)
+        if previous is None or "matches" not in previous:
+            return None
+        if not set(exprs) <= set(previous["matches"]):
+            return None
+        self.recorded[key] = previous
+        return {
+            expr: [(tuple(path), value) for path, value in previous["matches"][expr]]
+            for expr in exprs
+        }
+
+    def get_name(self, tftype: str, id: str):
+        return self.names.get((tftype, id))
+
+    def diff(self, import_instances: list):
+        """
+        Return (added, removed) instances compared with the previous lift.
+        Removed instances are ImportInstance-like dicts of the previous state.
+        """
+        current = {(i.tftype, i.id) for i in import_instances}
+        added = [i for i in import_instances if (i.tftype, i.id) not in self.names]
+        removed = [
+            {"tftype": tftype, "name": name, "id": id}
+            for (tftype, id), name in sorted(self.names.items())
+            if (tftype, id) not in current
+        ]
+        return added, removed
+
+    def save(self, import_instances: list):
+        state = {
+            "version": STATE_VERSION,
+            "responses": self.recorded,
+            "instances": [instance._asdict() for instance in import_instances],
+        }
+        # write to a temporary file first so a crash never leaves a partial state
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f, sort_keys=True)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,23 @@
+from .base import QueryBackend
+from .stub import StubARMServer
+from .shell import SubprocessBackend
+from .paging import CloudPage, get_page_cmd
+from .runner import run_cloud_cmd, stream_cloud_cmd, get_query_backend
+from .stream import iter_json_array
+from .resident import ARMSession, ResidentBackend
+from .throttle import ThrottledBackend
+
+__all__ = [
+    "QueryBackend",
+    "SubprocessBackend",
+    "ResidentBackend",
+    "ThrottledBackend",
+    "ARMSession",
+    "StubARMServer",
+    "run_cloud_cmd",
+    "stream_cloud_cmd",
+    "iter_json_array",
+    "CloudPage",
+    "get_page_cmd",
+    "get_query_backend",
+]
@@ -0,0 +1,38 @@
+import io
+import subprocess
+
+from .stream import iter_json_array
+
+
+class QueryBackend:
+    """
+    Execute cloud CLI commands and return their results like `subprocess.run`.
+    """
+
+    def run(self, cmd: str) -> subprocess.CompletedProcess:
+        raise NotImplementedError
+
+    def stream(self, cmd: str):
+        """
+        Yield the items of the JSON array printed by a command,
+        parsed incrementally if the backend can read the output as it comes.
+        Raise subprocess.CalledProcessError if the command fails.
+        """
+        result = self.run(cmd)
+        if result.returncode != 0:
+            raise subprocess.CalledProcessError(
+                result.returncode, cmd, result.stdout, result.stderr
+            )
+        yield from iter_json_array(io.StringIO(result.stdout))
+
+    def close(self):
+        """
+        Release the resources held by the backend, e.g. pooled connections.
+        """
+        pass
+
+
+def cmd_result(cmd: str, returncode: int, stdout="", stderr=""):
+    return subprocess.CompletedProcess(
+        args=cmd, returncode=returncode, stdout=stdout, stderr=stderr
+    )
@@ -0,0 +1,52 @@
+import shlex
+
+# keys of the item az appends to a truncated list output, holding the token to resume
+NEXT_TOKEN_KEYS = ("nextToken", "next_token", "nextMarker", "nextLink")
+
+
+def get_page_cmd(cmd: str, page_size: int, token=None) -> str:
+    """
+    Return the az list command fetching at most `page_size` items,
+    from the start or from the continuation `token` of the previous page.
+    """
+    cmd += f" --max-items {page_size}"
+    if token:
+        cmd += f" --next-token {shlex.quote(token)}"
+    return cmd
+
+
+def get_next_token(item):
+    """
+    Return the continuation token if `item` is the one closing a truncated page,
+    fields of a `--query` projection may come along with null values.
+    """
+    if not isinstance(item, dict):
+        return None
+    tokens = [item.get(key) for key in NEXT_TOKEN_KEYS if item.get(key)]
+    others = [v for k, v in item.items() if k not in NEXT_TOKEN_KEYS]
+    if len(tokens) != 1 or not isinstance(tokens[0], str) or any(others):
+        return None
+    return tokens[0]
+
+
+class CloudPage:
+    """
+    Items of one page of a list output, iterated without its closing token item.
+    The continuation token is known once the items are exhausted.
+    """
+
+    def __init__(self, items):
+        self.items = items
+        self.next_token = None
+
+    def __iter__(self):
+        # hold one item back, only the last one may close the page
+        previous, started = None, False
+        for item in self.items:
+            if started:
+                yield previous
+            previous, started = item, True
+        if started:
+            self.next_token = get_next_token(previous)
+            if self.next_token is None:
+                yield previous
@@ -0,0 +1,433 @@
+import io
+import json
+import time
+import queue
+import shlex
+import logging
+import threading
+import subprocess
+import http.client
+from urllib.parse import urlsplit
+
+from .base import QueryBackend, cmd_result
+from .shell import SubprocessBackend
+from .paging import CloudPage
+
+ARM_API_VERSION = "2021-04-01"
+# logger of knack, the framework of the Azure CLI
+CLI_LOGGER_NAME = "cli"
+GRAPH_API_VERSION = "2021-03-01"
+
+# short flags of az commands translated to REST
+AZ_SHORT_FLAGS = {
+    "-g": "--resource-group",
+    "-o": "--output",
+    "-n": "--name",
+    "-q": "--graph-query",
+}
+
+
+class ARMSession:
+    """
+    Keep-alive HTTP connections to the Azure Resource Manager endpoint,
+    pooled and shared by all threads of the lifting run.
+    """
+
+    def __init__(self, endpoint: str, token_provider, pool_size=8, timeout=60):
+        url = urlsplit(endpoint)
+        self.endpoint = endpoint.rstrip("/")
+        self.https = url.scheme == "https"
+        self.host = url.netloc
+        self.token_provider = token_provider
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.pool = queue.LifoQueue()
+
+    def _get_conn(self):
+        try:
+            return self.pool.get_nowait()
+        except queue.Empty:
+            if self.https:
+                return http.client.HTTPSConnection(self.host, timeout=self.timeout)
+            return http.client.HTTPConnection(self.host, timeout=self.timeout)
+
+    def _put_conn(self, conn):
+        if self.pool.qsize() < self.pool_size:
+            self.pool.put(conn)
+        else:
+            conn.close()
+
+    def request(self, method: str, url: str, body=None):
+        """
+        Send a request to `url`, absolute or relative to the endpoint.
+        Return (status, headers with lower-case keys, parsed JSON body or None).
+        """
+        if url.startswith(self.endpoint):
+            url = url[len(self.endpoint) :]
+        headers = {
+            "Authorization": f"Bearer {self.token_provider()}",
+            "Content-Type": "application/json",
+        }
+        payload = json.dumps(body) if body is not None else None
+        for attempt in range(2):
+            conn = self._get_conn()
+            try:
+                conn.request(method, url, body=payload, headers=headers)
+                response = conn.getresponse()
+                data = response.read()
+            except (http.client.HTTPException, OSError):
+                # the server may have closed an idle pooled connection, retry once
+                conn.close()
+                if attempt:
+                    raise
+                continue
+            if response.will_close:
+                conn.close()
+            else:
+                self._put_conn(conn)
+            response_headers = {k.lower(): v for k, v in response.getheaders()}
+            return response.status, response_headers, json.loads(data) if data else None
+
+    def close(self):
+        while not self.pool.empty():
+            self.pool.get_nowait().close()
+
+
+class CLIErrorHandler(logging.Handler):
+    """
+    Collect the errors the in-process Azure CLI logs into the error buffer of the
+    command running in the current thread, the CLIs of a process share loggers.
+    """
+
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.local = threading.local()
+
+    def emit(self, record: logging.LogRecord):
+        buffer = getattr(self.local, "buffer", None)
+        if buffer is not None:
+            buffer.write(f"{record.levelname}: {record.getMessage()}\n")
+
+
+class ARMError(Exception):
+    def __init__(self, status: int, headers: dict, body):
+        self.status = status
+        self.headers = headers
+        error = body.get("error", {}) if isinstance(body, dict) else {}
+        self.code = error.get("code", str(status))
+        super().__init__(error.get("message", f"HTTP status {status}"))
+
+    def __str__(self) -> str:
+        msg = f"ERROR: ({self.code}) {super().__str__()}"
+        if "retry-after" in self.headers:
+            msg += f"\nRetry-After: {self.headers['retry-after']}"
+        return msg
+
+
+class ResidentBackend(QueryBackend):
+    """
+    Persistent in-process backend that keeps one warm cloud session.
+
+    ARM-shaped az commands (`az resource list`, `az group list`, `az graph query`,
+    `az rest`) are served over pooled HTTP connections. Other az commands run one
+    at a time in the in-process Azure CLI when `azure-cli` is installed, everything
+    else falls back to spawning a process.
+    """
+
+    def __init__(self, endpoint: str, subscription_id: str, token=None, fallback=None):
+        """
+        @param endpoint: ARM endpoint, e.g. https://management.azure.com or a local stub
+        @param token: fixed bearer token, fetched from `az account get-access-token` if None
+        @param fallback: QueryBackend for commands the resident session can't serve
+        """
+        self.subscription_id = subscription_id
+        self.token = token
+        self.token_expires = float("inf") if token else 0
+        self.token_lock = threading.Lock()
+        self.session = ARMSession(endpoint, self._get_token)
+        self.fallback = fallback or SubprocessBackend()
+        self.cli = None  # in-process Azure CLI, created by the first command it runs
+        self.cli_errors = None  # CLIErrorHandler, False if azure-cli is unavailable
+        self.cli_lock = threading.Lock()
+        self.cli_run_lock = threading.Lock()  # held while the in-process CLI runs
+
+    def run(self, cmd: str) -> subprocess.CompletedProcess:
+        try:
+            tokens = shlex.split(cmd)
+        except ValueError:
+            return self.fallback.run(cmd)
+        if not tokens or tokens[0] != "az":
+            return self.fallback.run(cmd)
+
+        handler, args = self._translate(tokens)
+        if handler:
+            try:
+                result = self._serve(handler, args)
+            except ARMError as e:
+                return cmd_result(cmd, 1, stderr=str(e))
+            return cmd_result(cmd, 0, stdout=json.dumps(result, indent=2) + "\n")
+
+        if self._has_cli():
+            return self._run_cli(cmd, tokens[1:])
+        return self.fallback.run(cmd)
+
+    def stream(self, cmd: str):
+        """
+        Yield the items of REST-served responses without serializing them to text.
+        """
+        try:
+            tokens = shlex.split(cmd)
+        except ValueError:
+            tokens = []
+        handler, args = None, None
+        if tokens[:1] == ["az"]:
+            handler, args = self._translate(tokens)
+        if not handler:
+            yield from super().stream(cmd)
+            return
+        try:
+            result = self._serve(handler, args)
+        except ARMError as e:
+            raise subprocess.CalledProcessError(1, cmd, stderr=str(e))
+        if isinstance(result, list):
+            yield from result
+        else:
+            yield result
+
+    def close(self):
+        self.session.close()
+        if self.cli_errors:
+            logging.getLogger(CLI_LOGGER_NAME).removeHandler(self.cli_errors)
+
+    def _serve(self, handler, args: dict):
+        result = handler(args)
+        if "--query" in args:
+            import jmespath
+
+            result = jmespath.search(args["--query"], result)
+        return result
+
+    def _get_token(self) -> str:
+        with self.token_lock:
+            # refresh the token 5 minutes before it expires
+            if time.time() > self.token_expires - 300:
+                result = subprocess.run(
+                    "az account get-access-token -o json",
+                    shell=True,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    text=True,
+                )
+                if result.returncode != 0:
+                    # fail the command like ARM does, e.g. when not logged in
+                    raise ARMError(
+                        401,
+                        {},
+                        {
+                            "error": {
+                                "code": "AuthenticationFailed",
+                                "message": "az account get-access-token failed: "
+                                + result.stderr.strip(),
+                            }
+                        },
+                    )
+                token = json.loads(result.stdout)
+                self.token = token["accessToken"]
+                self.token_expires = float(token.get("expires_on", time.time() + 600))
+            return self.token
+
+    def _translate(self, tokens: list):
+        """
+        Return (handler, args) if the command can be served over REST, else (None, None).
+        """
+        words, args = [], {}
+        i = 1
+        while i < len(tokens):
+            token = AZ_SHORT_FLAGS.get(tokens[i], tokens[i])
+            if not token.startswith("-"):
+                if args:
+                    return None, None
+                words.append(token)
+            elif i + 1 < len(tokens) and not tokens[i + 1].startswith("-"):
+                args[token] = tokens[i + 1]
+                i += 1
+            else:
+                args[token] = ""
+            i += 1
+
+        handlers = {
+            ("resource", "list"): (
+                self._resource_list,
+                {
+                    "--resource-group",
+                    "--resource-type",
+                    "--subscription",
+                    "--max-items",
+                    "--next-token",
+                },
+            ),
+            ("group", "list"): (
+                self._group_list,
+                {"--subscription", "--max-items", "--next-token"},
+            ),
+            ("graph", "query"): (
+                self._graph_query,
+                {"--graph-query", "--first", "--skip-token", "--subscriptions"},
+            ),
+            ("rest",): (
+                self._rest,
+                {"--method", "--url", "--uri", "--body", "--subscription"},
+            ),
+        }
+        if tuple(words) not in handlers:
+            return None, None
+        handler, supported = handlers[tuple(words)]
+        supported = supported | {"--output", "--query"}
+        if any(arg not in supported for arg in args):
+            return None, None
+        if args.get("--output", "json") != "json":
+            return None, None
+        if "--query" in args and not _has_jmespath():
+            return None, None
+        return handler, args
+
+    def _list_all(self, url: str) -> list:
+        """
+        GET a collection and follow its `nextLink` pages.
+        """
+        items = []
+        while url:
+            status, headers, body = self.session.request("GET", url)
+            if status >= 400:
+                raise ARMError(status, headers, body)
+            items.extend(body.get("value", []))
+            url = body.get("nextLink")
+        return items
+
+    def _list_page(self, url: str, args: dict) -> list:
+        """
+        GET a collection, or with `--max-items` only one of its pages, closed by
+        a `nextToken` item if more follow. ARM pages stand for CLI pages and the
+        token is the `nextLink` of the page.
+        """
+        if "--max-items" not in args:
+            return self._list_all(url)
+        status, headers, body = self.session.request(
+            "GET", args.get("--next-token") or url
+        )
+        if status >= 400:
+            raise ARMError(status, headers, body)
+        items = body.get("value", [])
+        if body.get("nextLink"):
+            items.append({"nextToken": body["nextLink"]})
+        return items
+
+    def _resource_list(self, args: dict) -> list:
+        subscription = args.get("--subscription", self.subscription_id)
+        url = f"/subscriptions/{subscription}"
+        if "--resource-group" in args:
+            url += f"/resourceGroups/{args['--resource-group']}"
+        resources = self._list_page(
+            f"{url}/resources?api-version={ARM_API_VERSION}", args
+        )
+        page = CloudPage(resources)
+        resource_type = args.get("--resource-type", "").lower()
+        ret = []
+        for resource in page:
+            if resource_type and resource.get("type", "").lower() != resource_type:
+                continue
+            # az adds the resource group parsed from the ID
+            parts = resource.get("id", "").split("/")
+            if len(parts) > 4 and parts[3].lower() == "resourcegroups":
+                resource.setdefault("resourceGroup", parts[4])
+            ret.append(resource)
+        if page.next_token:
+            ret.append({"nextToken": page.next_token})
+        return ret
+
+    def _group_list(self, args: dict) -> list:
+        subscription = args.get("--subscription", self.subscription_id)
+        return self._list_page(
+            f"/subscriptions/{subscription}/resourcegroups?api-version={ARM_API_VERSION}",
+            args,
+        )
+
+    def _graph_query(self, args: dict) -> dict:
+        """
+        One page of an Azure Resource Graph query, in `az graph query` output shape.
+        """
+        options = {"$top": int(args.get("--first", 100)), "resultFormat": "objectArray"}
+        if args.get("--skip-token"):
+            options["$skipToken"] = args["--skip-token"]
+        body = {
+            "subscriptions": args.get("--subscriptions", self.subscription_id).split(),
+            "query": args["--graph-query"],
+            "options": options,
+        }
+        status, headers, response = self.session.request(
+            "POST",
+            f"/providers/Microsoft.ResourceGraph/resources?api-version={GRAPH_API_VERSION}",
+            body,
+        )
+        if status >= 400:
+            raise ARMError(status, headers, response)
+        return {
+            "count": response.get("count", len(response["data"])),
+            "data": response["data"],
+            "skip_token": response.get("$skipToken"),
+            "total_records": response.get("totalRecords"),
+        }
+
+    def _rest(self, args: dict):
+        url = args.get("--url", args.get("--uri", ""))
+        url = url.replace("{subscriptionId}", self.subscription_id)
+        body = json.loads(args["--body"]) if "--body" in args else None
+        method = args.get("--method", "get").upper()
+        status, headers, response = self.session.request(method, url, body)
+        if status >= 400:
+            raise ARMError(status, headers, response)
+        return response
+
+    def _has_cli(self) -> bool:
+        with self.cli_lock:
+            if self.cli_errors is None:
+                try:
+                    import azure.cli.core  # noqa: F401
+                except ImportError:
+                    self.cli_errors = False
+                else:
+                    # the CLI logs errors instead of returning them, and leaves
+                    # its console handlers out if the logger is configured
+                    self.cli_errors = CLIErrorHandler()
+                    logging.getLogger(CLI_LOGGER_NAME).addHandler(self.cli_errors)
+        return bool(self.cli_errors)
+
+    def _run_cli(self, cmd: str, args: list) -> subprocess.CompletedProcess:
+        from azure.cli.core import get_default_cli
+
+        # azure-cli and knack keep global state, so the in-process CLI runs one
+        # command at a time, while REST-served commands keep running concurrently
+        with self.cli_run_lock:
+            if self.cli is None:
+                self.cli = get_default_cli()
+            out, err = io.StringIO(), io.StringIO()
+            self.cli_errors.local.buffer = err
+            # knack leaves the root logger at DEBUG when it configures logging
+            root_logger = logging.getLogger()
+            level = root_logger.level
+            try:
+                returncode = self.cli.invoke(args, out_file=out)
+            except SystemExit as e:
+                returncode = e.code if isinstance(e.code, int) else 1
+            finally:
+                root_logger.setLevel(level)
+                self.cli_errors.local.buffer = None
+        return cmd_result(cmd, returncode, out.getvalue(), err.getvalue())
+
+
+def _has_jmespath() -> bool:
+    try:
+        import jmespath  # noqa: F401
+    except ImportError:
+        return False
+    return True
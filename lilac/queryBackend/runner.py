@@ -0,0 +1,116 @@
+import json
+import tempfile
+import threading
+import subprocess
+
+from lilac.utils import Config, is_read_cmd, normalize_cmd, get_response_cache
+
+from .shell import SubprocessBackend
+from .stream import iter_json_array
+from .resident import ResidentBackend
+from .throttle import ThrottledBackend
+
+_query_backend = None
+_query_backend_lock = threading.Lock()
+
+
+def get_query_backend():
+    """
+    Return the process-wide QueryBackend selected by `cloud_query_backend`,
+    rate limited per subscription and provider namespace.
+    """
+    global _query_backend
+    with _query_backend_lock:
+        if _query_backend is None:
+            if Config["cloud_query_backend"] == "resident":
+                backend = ResidentBackend(
+                    endpoint=Config["azure_arm_endpoint"],
+                    subscription_id=Config["azure_subscription_id"],
+                    token=Config["azure_access_token"],
+                )
+            else:
+                backend = SubprocessBackend()
+            _query_backend = ThrottledBackend(
+                backend,
+                rate=Config["cloud_rate_limit"],
+                burst=Config["cloud_rate_burst"],
+                max_concurrency=Config["lift_max_concurrency"],
+                max_retries=Config["cloud_max_retries"],
+                backoff_base=Config["cloud_backoff_base"],
+                backoff_max=Config["cloud_backoff_max"],
+            )
+    return _query_backend
+
+
+def run_cloud_cmd(cmd: str, account="", use_cache=None) -> subprocess.CompletedProcess:
+    """
+    Run a cloud CLI command on the query backend, through the response cache.
+    Only successful responses are cached.
+    @param use_cache: None to only cache commands that read, see `is_read_cmd`
+    """
+    if use_cache is None:
+        use_cache = is_read_cmd(cmd)
+    cache = get_response_cache() if use_cache else None
+    if cache:
+        stdout = cache.get(cmd, account)
+        if stdout is not None:
+            return subprocess.CompletedProcess(
+                args=cmd, returncode=0, stdout=stdout, stderr=""
+            )
+
+    result = get_query_backend().run(cmd)
+    if cache and result.returncode == 0:
+        cache.put(cmd, account, result.stdout)
+    elif not use_cache:
+        _invalidate_changed(cmd, account)
+    return result
+
+
+def stream_cloud_cmd(cmd: str, account="", use_cache=None):
+    """
+    Yield the items of the JSON array printed by a cloud CLI command as they are
+    parsed, through the response cache. Items are spooled to a temporary file for
+    the cache only if the command is cached, and written once the whole output is
+    read, so that the output is never in memory at once.
+    Raise subprocess.CalledProcessError if the command fails.
+    @param use_cache: see `run_cloud_cmd`
+    """
+    if use_cache is None:
+        use_cache = is_read_cmd(cmd)
+    cache = get_response_cache() if use_cache else None
+    if cache:
+        cached = cache.open(cmd, account)
+        if cached is not None:
+            with cached:
+                yield from iter_json_array(cached)
+            return
+        if cache.get_ttl(normalize_cmd(cmd)) <= 0:
+            cache = None
+
+    if not cache:
+        try:
+            yield from get_query_backend().stream(cmd)
+        finally:
+            if not use_cache:
+                _invalidate_changed(cmd, account)
+        return
+    with tempfile.TemporaryFile() as spool:
+        spool.write(b"[")
+        for i, item in enumerate(get_query_backend().stream(cmd)):
+            if i:
+                spool.write(b", ")
+            spool.write(json.dumps(item).encode())
+            yield item
+        spool.write(b"]")
+        cache.put_file(cmd, account, spool)
+
+
+def _invalidate_changed(cmd: str, account: str):
+    """
+    Drop the cached responses of `account` after a command that may have changed
+    the infrastructure, even if it failed part way.
+    """
+    if not is_read_cmd(cmd):
+        cache = get_response_cache()
+        if cache:
+            cache.invalidate(account)
@@ -0,0 +1,50 @@
+import tempfile
+import subprocess
+
+from .base import QueryBackend
+from .stream import iter_json_array
+
+
+class SubprocessBackend(QueryBackend):
+    """
+    Spawn a fresh CLI process for every command.
+    """
+
+    def run(self, cmd: str) -> subprocess.CompletedProcess:
+        return subprocess.run(
+            cmd,
+            shell=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+
+    def stream(self, cmd: str):
+        """
+        Parse the output items straight from the pipe of the CLI process.
+        """
+        # stderr goes to a file so a chatty CLI never blocks on a full pipe
+        with tempfile.TemporaryFile("w+") as stderr:
+            process = subprocess.Popen(
+                cmd, shell=True, stdout=subprocess.PIPE, stderr=stderr, text=True
+            )
+            error = None
+            try:
+                try:
+                    yield from iter_json_array(process.stdout)
+                except ValueError as e:
+                    # the output of a failed command is not JSON
+                    error = e
+                if process.wait() != 0:
+                    stderr.seek(0)
+                    raise subprocess.CalledProcessError(
+                        process.returncode, cmd, stderr=stderr.read()
+                    )
+                if error:
+                    raise error
+            finally:
+                # the caller may stop reading before the end
+                if process.poll() is None:
+                    process.kill()
+                    process.wait()
+                process.stdout.close()
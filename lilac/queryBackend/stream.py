@@ -0,0 +1,156 @@
+import re
+import json
+
+# characters read from the output at a time
+CHUNK_SIZE = 1 << 16
+WHITESPACE = " \t\n\r"
+
+STRUCTURAL_RE = re.compile(r'["{}\[\]]')
+STRING_END_RE = re.compile(r'["\\]')
+SCALAR_END_RE = re.compile(r"[\s,\]}]")
+
+_decoder = json.JSONDecoder()
+
+
+class _Scanner:
+    """
+    Find the end of a JSON value read in chunks. The scan state is kept between
+    chunks, so every character is looked at once however large the value is.
+    """
+
+    def __init__(self, first: str):
+        self.scalar = first not in '{["'
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, text: str, pos=0) -> bool:
+        """
+        Scan `text` from `pos`. Return True once the value is complete.
+        """
+        if self.scalar:
+            # a number or literal ends at the next delimiter
+            return SCALAR_END_RE.search(text, pos) is not None
+        while True:
+            if self.escaped:
+                if pos >= len(text):
+                    return False
+                self.escaped = False
+                pos += 1
+            if self.in_string:
+                match = STRING_END_RE.search(text, pos)
+                if not match:
+                    return False
+                pos = match.end()
+                if match.group() == "\\":
+                    self.escaped = True
+                    continue
+                self.in_string = False
+                if self.depth == 0:
+                    return True
+                continue
+            match = STRUCTURAL_RE.search(text, pos)
+            if not match:
+                return False
+            pos = match.end()
+            char = match.group()
+            if char == '"':
+                self.in_string = True
+            elif char in "{[":
+                self.depth += 1
+            else:
+                self.depth -= 1
+                if self.depth == 0:
+                    return True
+
+
+class _Reader:
+    """
+    Buffer over a text stream, holding the unparsed text of at most one value.
+    """
+
+    def __init__(self, file, chunk_size: int):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+
+    def _read(self) -> bool:
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            return False
+        self.buffer = self.buffer[self.pos :] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """
+        Skip whitespace and return the next character, None at the end of the text.
+        """
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._read():
+                return None
+
+    def advance(self):
+        self.pos += 1
+
+    def decode(self):
+        """
+        Parse the value at the current position, reading the chunks it spans.
+        A value cut off by the end of the buffer is parsed once it is complete.
+        """
+        char = self.peek()
+        if char is None:
+            raise json.JSONDecodeError("Expecting value", self.buffer, self.pos)
+        if char in '{["':
+            # objects, arrays and strings end at their closing character
+            try:
+                value, self.pos = _decoder.raw_decode(self.buffer, self.pos)
+                return value
+            except json.JSONDecodeError:
+                pass  # the value continues in the next chunk
+        scanner = _Scanner(char)
+        if not scanner.feed(self.buffer, self.pos):
+            chunks = [self.buffer[self.pos :]]
+            while True:
+                chunk = self.file.read(self.chunk_size)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                if scanner.feed(chunk):
+                    break
+            # joined once, a value spanning many chunks is not copied for each
+            self.buffer = "".join(chunks)
+            self.pos = 0
+        value, self.pos = _decoder.raw_decode(self.buffer, self.pos)
+        return value
+
+
+def iter_json_array(file, chunk_size=CHUNK_SIZE):
+    """
+    Yield the items of the top-level JSON array read incrementally from a text
+    stream, e.g. a subprocess pipe, so only one item is parsed in memory at a time.
+    Any other top-level value is yielded as a single item, an empty text as none.
+    """
+    reader = _Reader(file, chunk_size)
+    char = reader.peek()
+    if char is None:
+        return
+    if char != "[":
+        yield reader.decode()
+        return
+    reader.advance()
+    if reader.peek() == "]":
+        return
+    while True:
+        yield reader.decode()
+        char = reader.peek()
+        if char == "]":
+            return
+        if char != ",":
+            raise ValueError(f"Expecting ',' or ']' in the JSON array, got {char!r}")
+        reader.advance()
@@ -0,0 +1,195 @@
+import re
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlsplit
+
+
+class StubARMServer:
+    """
+    Local stub of the Azure Resource Manager REST API serving in-memory resources,
+    for exercising ResidentBackend without a real subscription.
+    It also fakes the Azure Resource Graph endpoint for `Resources` queries
+    filtered by resource group, with skip token paging, and can throttle requests
+    like ARM does under load.
+
+    Usage:
+        with StubARMServer(resources, subscription_id="sub") as server:
+            backend = ResidentBackend(server.endpoint, "sub", token="stub")
+            backend.run("az resource list -g my-group")
+    """
+
+    def __init__(
+        self,
+        resources: list,
+        subscription_id="stub",
+        page_size=0,
+        throttle_every=0,
+        retry_after=0,
+    ):
+        """
+        @param resources: list of ARM resource dicts with at least `id` and `type`
+        @param page_size: split collections into `nextLink` pages of this size, 0 to disable
+        @param throttle_every: answer every n-th request with 429, 0 to disable
+        @param retry_after: `Retry-After` seconds of throttled requests, 0 for no header
+        """
+        self.resources = resources
+        self.subscription_id = subscription_id
+        self.page_size = page_size
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.throttled = 0  # number of requests answered with 429
+        self.requests = []  # (method, path) of every request served
+        self.clients = set()  # client addresses, one per pooled connection
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.endpoint = f"http://127.0.0.1:{self.server.server_port}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def route(self, method: str, path: str, query: dict, body):
+        """
+        Return (status, headers, body) of a request.
+        """
+        prefix = f"/subscriptions/{self.subscription_id}".lower()
+        lower_path = path.rstrip("/").lower()
+        if method == "POST" and lower_path == GRAPH_PATH:
+            return self._graph_query(body or {})
+        if method != "GET" or not lower_path.startswith(prefix):
+            return 404, {}, _error("NotFound", f"{method} {path} is not supported")
+
+        rest = lower_path[len(prefix) :]
+        if rest == "/resources":
+            return self._page(path, query, self.resources)
+        if rest == "/resourcegroups":
+            groups = sorted({_resource_group(r) for r in self.resources} - {""})
+            return self._page(path, query, [{"name": g} for g in groups])
+        parts = rest.split("/")
+        if len(parts) == 4 and parts[1] == "resourcegroups" and parts[3] == "resources":
+            resources = [r for r in self.resources if _resource_group(r) == parts[2]]
+            return self._page(path, query, resources)
+        for resource in self.resources:
+            if resource["id"].lower() == lower_path:
+                return 200, {}, resource
+        return 404, {}, _error("ResourceNotFound", f"{path} was not found")
+
+    def throttle(self):
+        """
+        Return the (status, headers, body) of a throttled request.
+        """
+        headers = {"Retry-After": str(self.retry_after)} if self.retry_after else {}
+        message = "Rate limit exceeded, too many requests."
+        return 429, headers, _error("TooManyRequests", message)
+
+    def _page(self, path: str, query: dict, items: list):
+        if not self.page_size:
+            return 200, {}, {"value": items}
+        skip = int(query.get("$skiptoken", ["0"])[0])
+        body = {"value": items[skip : skip + self.page_size]}
+        if skip + self.page_size < len(items):
+            body["nextLink"] = (
+                f"{self.endpoint}{path}?api-version={query['api-version'][0]}"
+                f"&$skiptoken={skip + self.page_size}"
+            )
+        return 200, {}, body
+
+    def _graph_query(self, body: dict):
+        """
+        Answer a Resource Graph query, only `resourceGroup =~` / `in~` filters are understood.
+        """
+        if self.subscription_id not in body.get(
+            "subscriptions", [self.subscription_id]
+        ):
+            return 200, {}, {"totalRecords": 0, "count": 0, "data": []}
+        query = body.get("query", "")
+        groups = None
+        match = re.search(r"resourceGroup\s+in~\s*\(([^)]*)\)", query)
+        if match:
+            groups = {g.strip().strip("'\"").lower() for g in match.group(1).split(",")}
+        match = re.search(r"resourceGroup\s*=~\s*['\"]([^'\"]*)['\"]", query)
+        if match:
+            groups = {match.group(1).lower()}
+
+        records = []
+        for resource in sorted(self.resources, key=lambda r: r["id"].lower()):
+            group = _resource_group(resource)
+            if groups is not None and group not in groups:
+                continue
+            record = dict(resource)
+            record.setdefault("resourceGroup", group)
+            record.setdefault("subscriptionId", self.subscription_id)
+            records.append(record)
+
+        options = body.get("options", {})
+        top = int(options.get("$top", 100))
+        skip = int(options.get("$skipToken") or options.get("$skip") or 0)
+        response = {
+            "totalRecords": len(records),
+            "count": len(records[skip : skip + top]),
+            "data": records[skip : skip + top],
+            "resultTruncated": "false",
+        }
+        if skip + top < len(records):
+            response["$skipToken"] = str(skip + top)
+        return 200, {}, response
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep connections alive
+
+            def _serve(self):
+                url = urlsplit(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length)) if length else None
+                with stub.lock:
+                    stub.requests.append((self.command, url.path))
+                    stub.clients.add(self.client_address)
+                    throttled = (
+                        stub.throttle_every
+                        and len(stub.requests) % stub.throttle_every == 0
+                    )
+                    stub.throttled += bool(throttled)
+                if throttled:
+                    status, headers, response = stub.throttle()
+                else:
+                    status, headers, response = stub.route(
+                        self.command, url.path, parse_qs(url.query), body
+                    )
+                data = json.dumps(response).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for k, v in headers.items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = _serve
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+GRAPH_PATH = "/providers/microsoft.resourcegraph/resources"
+
+
+def _resource_group(resource: dict) -> str:
+    parts = resource.get("id", "").lower().split("/")
+    if len(parts) > 4 and parts[3] == "resourcegroups":
+        return parts[4]
+    return ""
+
+
+def _error(code: str, message: str) -> dict:
+    return {"error": {"code": code, "message": message}}
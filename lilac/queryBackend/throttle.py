@@ -0,0 +1,282 @@
+import re
+import time
+import shlex
+import random
+import threading
+import subprocess
+
+from lilac.utils import Config, print_error
+
+from .base import QueryBackend
+
+# errors of throttled requests from ARM, the Azure CLI and gcloud
+THROTTLED_PATTERN = re.compile(
+    r"\b429\b|TooManyRequests|Too Many Requests|throttl|RESOURCE_EXHAUSTED"
+    r"|rateLimitExceeded",
+    re.IGNORECASE,
+)
+RETRY_AFTER_PATTERNS = [
+    re.compile(r"Retry-After:?\s*(\d+(?:\.\d+)?)", re.IGNORECASE),
+    re.compile(r"try again (?:after|in) (\d+(?:\.\d+)?) seconds", re.IGNORECASE),
+]
+
+# resource providers of az command groups, ARM throttles each of them separately
+AZ_PROVIDERS = {
+    "resource": "Microsoft.Resources",
+    "group": "Microsoft.Resources",
+    "graph": "Microsoft.ResourceGraph",
+    "vm": "Microsoft.Compute",
+    "vmss": "Microsoft.Compute",
+    "disk": "Microsoft.Compute",
+    "snapshot": "Microsoft.Compute",
+    "image": "Microsoft.Compute",
+    "network": "Microsoft.Network",
+    "storage": "Microsoft.Storage",
+    "keyvault": "Microsoft.KeyVault",
+    "sql": "Microsoft.Sql",
+    "webapp": "Microsoft.Web",
+    "functionapp": "Microsoft.Web",
+    "appservice": "Microsoft.Web",
+}
+
+
+def get_throttle_scope(cmd: str):
+    """
+    Return the (account, namespace) a command is rate limited in:
+    subscription and resource provider for az, project and service for gcloud.
+    """
+    try:
+        tokens = shlex.split(cmd)
+    except ValueError:
+        tokens = cmd.split()
+    if not tokens:
+        return "", ""
+    words, args = [], {}
+    for i, token in enumerate(tokens[1:], 1):
+        if token.startswith("--"):
+            flag, _, value = token.partition("=")
+            if not value and i + 1 < len(tokens):
+                value = tokens[i + 1]
+            args[flag] = value
+        elif not tokens[i - 1].startswith("-"):
+            words.append(token)
+
+    if tokens[0] == "az":
+        account = args.get("--subscription") or Config["azure_subscription_id"] or ""
+        group = words[0] if words else ""
+        namespace = AZ_PROVIDERS.get(group, f"az {group}")
+        if group == "rest":
+            url = args.get("--url") or args.get("--uri") or ""
+            match = re.search(r"/providers/([^/?]+)", url, re.IGNORECASE)
+            namespace = match.group(1) if match else "Microsoft.Resources"
+        return account, namespace.lower()
+    if tokens[0] == "gcloud":
+        account = args.get("--project") or Config["google_project"] or ""
+        services = [w for w in words if w not in ("alpha", "beta")]
+        return account, f"gcloud {services[0] if services else ''}"
+    return "", tokens[0]
+
+
+def is_throttled(result: subprocess.CompletedProcess) -> bool:
+    return result.returncode != 0 and bool(
+        THROTTLED_PATTERN.search(result.stderr or "")
+    )
+
+
+def get_retry_after(result: subprocess.CompletedProcess):
+    """
+    Return the seconds to wait hinted by a throttled response, None without a hint.
+    """
+    for pattern in RETRY_AFTER_PATTERNS:
+        match = pattern.search(result.stderr or "")
+        if match:
+            return float(match.group(1))
+    return None
+
+
+class TokenBucket:
+    """
+    Allow `rate` requests per second on average and bursts of `burst` requests.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            # reserve a token, callers wait in turn for the bucket to refill
+            self.tokens -= 1
+            wait = -self.tokens / self.rate
+        if wait > 0:
+            time.sleep(wait)
+
+
+class AdaptiveLimiter:
+    """
+    Rate and concurrency limits of one throttling scope.
+    The concurrency limit grows by one per round of successful requests and is
+    halved by throttled ones (AIMD), the whole scope pauses for retry hints.
+    """
+
+    def __init__(self, rate: float, burst: int, max_concurrency: int):
+        self.bucket = TokenBucket(rate, burst)
+        self.max_concurrency = max(max_concurrency, 1)
+        self.limit = float(self.max_concurrency)
+        self.active = 0
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self.cond = threading.Condition()
+
+    def acquire(self) -> float:
+        """
+        Wait for a slot and a token. Return the start time of the request.
+        """
+        with self.cond:
+            while True:
+                pause = self.paused_until - time.monotonic()
+                if pause > 0:
+                    self.cond.wait(pause)
+                elif self.active >= int(self.limit):
+                    self.cond.wait()
+                else:
+                    break
+            self.active += 1
+        self.bucket.acquire()
+        return time.monotonic()
+
+    def release(self, start: float, throttled: bool, retry_after=None):
+        with self.cond:
+            self.active -= 1
+            now = time.monotonic()
+            if throttled:
+                # requests sent before the last decrease were throttled by the old limit
+                if start > self.last_decrease:
+                    self.limit = max(1.0, self.limit / 2)
+                    self.last_decrease = now
+                if retry_after:
+                    self.paused_until = max(self.paused_until, now + retry_after)
+            else:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            self.cond.notify_all()
+
+
+class ThrottledBackend(QueryBackend):
+    """
+    Run commands on another backend within the rate limits of their scope,
+    retrying throttled commands with jittered exponential backoff.
+    """
+
+    def __init__(
+        self,
+        backend: QueryBackend,
+        rate: float,
+        burst: int,
+        max_concurrency: int,
+        max_retries: int,
+        backoff_base: float,
+        backoff_max: float,
+    ):
+        """
+        @param rate: requests per second of each (account, namespace) scope, 0 for no limit
+        @param max_concurrency: upper bound of the adaptive concurrency of each scope
+        """
+        self.backend = backend
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # key: (account, namespace), value: AdaptiveLimiter
+        self.limiters = {}
+        self.lock = threading.Lock()
+        self.throttled = 0  # number of throttled responses
+
+    def get_limiter(self, scope: tuple) -> AdaptiveLimiter:
+        with self.lock:
+            if scope not in self.limiters:
+                self.limiters[scope] = AdaptiveLimiter(
+                    self.rate, self.burst, self.max_concurrency
+                )
+            return self.limiters[scope]
+
+    def run(self, cmd: str) -> subprocess.CompletedProcess:
+        limiter = self.get_limiter(get_throttle_scope(cmd))
+        for attempt in range(self.max_retries + 1):
+            start = limiter.acquire()
+            throttled, retry_after = False, None
+            try:
+                result = self.backend.run(cmd)
+                throttled = is_throttled(result)
+                retry_after = get_retry_after(result) if throttled else None
+            finally:
+                limiter.release(start, throttled, retry_after)
+            if not throttled:
+                return result
+
+            with self.lock:
+                self.throttled += 1
+            if attempt == self.max_retries:
+                break
+            delay = self.get_backoff(attempt, retry_after)
+            print_error(
+                f"[WARNNING] Throttled, retrying in {delay:.1f}s "
+                f"({attempt + 1}/{self.max_retries}): {cmd}"
+            )
+            time.sleep(delay)
+        return result
+
+    def stream(self, cmd: str):
+        limiter = self.get_limiter(get_throttle_scope(cmd))
+        for attempt in range(self.max_retries + 1):
+            start = limiter.acquire()
+            throttled, retry_after, streamed = False, None, False
+            try:
+                for item in self.backend.stream(cmd):
+                    streamed = True
+                    yield item
+                return
+            except subprocess.CalledProcessError as e:
+                result = subprocess.CompletedProcess(
+                    cmd, e.returncode, e.output, e.stderr
+                )
+                # items already yielded can't be taken back, only retry before them
+                throttled = not streamed and is_throttled(result)
+                if throttled:
+                    retry_after = get_retry_after(result)
+                    with self.lock:
+                        self.throttled += 1
+                if not throttled or attempt == self.max_retries:
+                    raise
+            finally:
+                limiter.release(start, throttled, retry_after)
+
+            delay = self.get_backoff(attempt, retry_after)
+            print_error(
+                f"[WARNNING] Throttled, retrying in {delay:.1f}s "
+                f"({attempt + 1}/{self.max_retries}): {cmd}"
+            )
+            time.sleep(delay)
+
+    def get_backoff(self, attempt: int, retry_after=None) -> float:
+        """
+        Seconds to wait before a retry, with jitter so that throttled callers
+        don't come back at the same time.
+        """
+        if retry_after is not None:
+            return retry_after + random.uniform(0, self.backoff_base)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    def close(self):
+        self.backend.close()
@@ -10,6 +10,7 @@ class AzureQueryWorker(QueryWorker):
         self.subscription_id = Config["azure_subscription_id"]
         if self.subscription_id is None:
             raise ValueError("Azure azure_subscription_id not set in global-config.yml")
+        self.account = self.subscription_id
         self.cloud_type = "Azure"
 
     def add_tools(self, cmds: list, cmd_tool_dict: dict, category: str):
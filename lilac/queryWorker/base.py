@@ -8,6 +8,7 @@ from langchain_core.output_parsers import StrOutputParser
 from langchain_core.output_parsers.openai_tools import JsonOutputToolsParser
 
 from lilac.utils import Config, print_info, print_error, print_cmd_result
+from lilac.queryBackend import run_cloud_cmd
 
 
 class AgentResponse(Enum):
@@ -35,6 +36,7 @@ class QueryWorker:
             ""  # used to truncate the tool name to obey GPT tool name length limit
         )
         self.messages = []
+        self.account = ""  # subscription or project, scopes the response cache
 
     def reset(self):
         """
@@ -135,13 +137,7 @@ class QueryWorker:
         for i, cloud_api_call in enumerate(cloud_api_call_list):
             print_info(f"Running command: {cloud_api_call}")
             try:
-                result = subprocess.run(
-                    cloud_api_call,
-                    shell=True,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True,
-                )
+                result = run_cloud_cmd(cloud_api_call, account=self.account)
             except subprocess.TimeoutExpired:
                 result = subprocess.CompletedProcess(
                     args=cloud_api_call,
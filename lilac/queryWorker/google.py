@@ -10,6 +10,7 @@ class GoogleQueryWorker(QueryWorker):
         self.project = Config["google_project"]
         if self.project is None:
             raise ValueError("Google project not set in global-config.yml")
+        self.account = self.project
         self.region = Config["google_region"]
         if self.region is None:
             raise ValueError("Google region not set in global-config.yml")
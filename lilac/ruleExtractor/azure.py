@@ -59,6 +59,7 @@ class AzureRuleExtractor(RuleExtractor):
                     subprocess.run(
                         "terraform apply -auto-approve", cwd=test_path, shell=True
                     )
+                    self.invalidate_cloud_cache()
                 except subprocess.CalledProcessError:
                     print_error(f"Terraform apply failed for {test_path}")
                     self.logger.error(f"Terraform apply failed for {test_path}")
@@ -3,6 +3,8 @@ import shutil
 import logging
 import subprocess
 
+from lilac.utils import get_response_cache
+
 
 class RuleExtractor:
     def __init__(self, query_agent, api_manager):
@@ -32,12 +34,21 @@ class RuleExtractor:
         """
         raise NotImplementedError
 
+    def invalidate_cloud_cache(self):
+        """
+        Drop cached cloud responses once the infrastructure changed.
+        """
+        cache = get_response_cache()
+        if cache:
+            cache.invalidate(self.queryAgent.account)
+
     def cleanup(self, testdir: str, destroy_path: str):
         """
         Delete all .terraform/ .terraform.lock.hcl and .tftate in `testdir`
         """
         # destroy the resource in the last test
         subprocess.run("terraform destroy -auto-approve", cwd=destroy_path, shell=True)
+        self.invalidate_cloud_cache()
 
         for dp, dn, fn in os.walk(testdir):
             for d in dn:
@@ -60,6 +60,7 @@ class GoogleRuleExtractor(RuleExtractor):
                     subprocess.run(
                         "terraform apply -auto-approve", cwd=test_path, shell=True
                     )
+                    self.invalidate_cloud_cache()
                 except subprocess.CalledProcessError:
                     print_error("Terraform apply failed for", test_path)
                     self.logger.error(f"Terraform apply failed for {test_path}")
@@ -1,5 +1,6 @@
 from .print import print_info, print_error, print_cmd_result
 from .config import Config
+from .responseCache import ResponseCache, is_read_cmd, normalize_cmd, get_response_cache
 from .testGenerator import generate_incremental_tests
 
 __all__ = [
@@ -8,4 +9,8 @@ __all__ = [
     "print_cmd_result",
     "generate_incremental_tests",
     "Config",
+    "ResponseCache",
+    "is_read_cmd",
+    "normalize_cmd",
+    "get_response_cache",
 ]
@@ -24,6 +24,141 @@ Config = {
     "select_cli_category_retrieve_k": global_config["select_cli_category_retrieve_k"],
     "query_loop_max_iter": global_config["query_loop_max_iter"],
     "query_loop_max_retry": global_config["query_loop_max_retry"],
+    # lifting parameters
+    "lift_max_concurrency": (
+        global_config["lift_max_concurrency"]
+        if "lift_max_concurrency" in global_config
+        else 1
+    ),
+    # run only the cheapest APIs providing every ID component, others are fallbacks
+    "lift_api_planner": (
+        global_config["lift_api_planner"]
+        if "lift_api_planner" in global_config
+        else True
+    ),
+    "api_cost_path": (
+        global_config["api_cost_path"]
+        if "api_cost_path" in global_config
+        else os.path.join("cache", "api-costs.json")
+    ),
+    # journals of the analyzed responses of each resource group, for --resume
+    "lift_journal_dir": (
+        global_config["lift_journal_dir"]
+        if "lift_journal_dir" in global_config
+        else os.path.join("cache", "journal")
+    ),
+    # seconds between syncs of the journal to disk, a crash repeats at most these
+    "lift_journal_sync_interval": (
+        global_config["lift_journal_sync_interval"]
+        if "lift_journal_sync_interval" in global_config
+        else 5
+    ),
+    # push `-g` and a `--query` projection of the read fields down to az commands
+    "lift_query_pushdown": (
+        global_config["lift_query_pushdown"]
+        if "lift_query_pushdown" in global_config
+        else True
+    ),
+    # parse list outputs item by item from the CLI pipe, keeping only relevant records
+    "lift_stream_responses": (
+        global_config["lift_stream_responses"]
+        if "lift_stream_responses" in global_config
+        else True
+    ),
+    # fetch az list outputs in pages of this many items, 0 to fetch them whole
+    "lift_page_size": (
+        global_config["lift_page_size"] if "lift_page_size" in global_config else 0
+    ),
+    # parallel sharded `terraform plan` of imported output
+    "import_shards": (
+        global_config["import_shards"] if "import_shards" in global_config else 4
+    ),
+    "terraform_plugin_cache": (
+        global_config["terraform_plugin_cache"]
+        if "terraform_plugin_cache" in global_config
+        else os.path.join("cache", "terraform-plugins")
+    ),
+    # state of the previous lift of each resource group, for --incremental
+    "lift_state_dir": (
+        global_config["lift_state_dir"]
+        if "lift_state_dir" in global_config
+        else os.path.join("cache", "lift-state")
+    ),
+    # compiled snapshot of the lifting rules, written by --compile-rules
+    "rule_snapshot_path": (
+        global_config["rule_snapshot_path"]
+        if "rule_snapshot_path" in global_config
+        else os.path.join("cache", "infer-rule.snapshot")
+    ),
+    "lazy_rule_loading": (
+        global_config["lazy_rule_loading"]
+        if "lazy_rule_loading" in global_config
+        else True
+    ),
+    # cloud CLI response cache shared by query and lift phases
+    "cloud_cache_enabled": (
+        global_config["cloud_cache_enabled"]
+        if "cloud_cache_enabled" in global_config
+        else True
+    ),
+    # lifting reads the cloud through the cache too, responses may then be
+    # outdated by changes made outside lilac within their TTL
+    "lift_cloud_cache": (
+        global_config["lift_cloud_cache"]
+        if "lift_cloud_cache" in global_config
+        else False
+    ),
+    "cloud_cache_path": (
+        global_config["cloud_cache_path"]
+        if "cloud_cache_path" in global_config
+        else os.path.join("cache", "cloud-cache.sqlite")
+    ),
+    "cloud_cache_ttl": (
+        global_config["cloud_cache_ttl"]
+        if "cloud_cache_ttl" in global_config
+        else {"default": 300}
+    ),
+    # backend running cloud CLI commands: subprocess or resident
+    "cloud_query_backend": (
+        global_config["cloud_query_backend"]
+        if "cloud_query_backend" in global_config
+        else "subprocess"
+    ),
+    # rate limit of cloud CLI commands per subscription/project and provider namespace
+    "cloud_rate_limit": (
+        global_config["cloud_rate_limit"] if "cloud_rate_limit" in global_config else 25
+    ),
+    "cloud_rate_burst": (
+        global_config["cloud_rate_burst"]
+        if "cloud_rate_burst" in global_config
+        else 250
+    ),
+    # retries of throttled commands, with exponential backoff in seconds
+    "cloud_max_retries": (
+        global_config["cloud_max_retries"]
+        if "cloud_max_retries" in global_config
+        else 5
+    ),
+    "cloud_backoff_base": (
+        global_config["cloud_backoff_base"]
+        if "cloud_backoff_base" in global_config
+        else 1
+    ),
+    "cloud_backoff_max": (
+        global_config["cloud_backoff_max"]
+        if "cloud_backoff_max" in global_config
+        else 60
+    ),
+    "azure_arm_endpoint": (
+        global_config["azure_arm_endpoint"]
+        if "azure_arm_endpoint" in global_config
+        else "https://management.azure.com"
+    ),
+    "azure_access_token": (
+        global_config["azure_access_token"]
+        if "azure_access_token" in global_config
+        else None
+    ),
     # Azure cloud test parameters
     "azure_subscription_id": (
         global_config["azure_subscription_id"]
@@ -33,6 +168,11 @@ Config = {
     "azure_location": (
         global_config["azure_location"] if "azure_location" in global_config else None
     ),
+    "azure_discovery": (
+        global_config["azure_discovery"]
+        if "azure_discovery" in global_config
+        else "resource-list"
+    ),
     # google cloud test parameters
     "google_project": (
         global_config["google_project"] if "google_project" in global_config else None
@@ -0,0 +1,233 @@
+import os
+import time
+import shlex
+import codecs
+import hashlib
+import sqlite3
+import threading
+
+from .config import Config
+
+# bytes of a cached response copied at a time
+CHUNK_SIZE = 1 << 16
+# verbs of cloud CLI commands that only read, e.g. `az vm list`, `gcloud ... describe`
+READ_VERBS = {"list", "show", "get", "describe", "query", "search-all-resources"}
+
+
+def normalize_cmd(full_api: str) -> str:
+    """
+    Normalize a full command line so equivalent invocations share one key:
+    collapse whitespace and sort `--flag value` pairs after the positional part.
+    """
+    try:
+        tokens = shlex.split(full_api)
+    except ValueError:
+        return " ".join(full_api.split())
+    positional, options = [], []
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token.startswith("-"):
+            if i + 1 < len(tokens) and not tokens[i + 1].startswith("-"):
+                options.append((token, tokens[i + 1]))
+                i += 2
+                continue
+            options.append((token, ""))
+        elif options:
+            # positional argument after flags, keep it attached to the last flag
+            options[-1] = (options[-1][0], f"{options[-1][1]} {token}".strip())
+        else:
+            positional.append(token)
+        i += 1
+    parts = positional + [
+        f"{flag} {shlex.quote(val)}" if val else flag for flag, val in sorted(options)
+    ]
+    return " ".join(parts)
+
+
+def is_read_cmd(full_api: str) -> bool:
+    """
+    Whether a cloud CLI command only reads, by the verbs before its first flag.
+    """
+    try:
+        tokens = shlex.split(full_api)
+    except ValueError:
+        return False
+    words = []
+    for token in tokens[1:]:
+        if token.startswith("-"):
+            break
+        words.append(token)
+    return any(word in READ_VERBS for word in words)
+
+
+class ResponseCache:
+    """
+    Persistent cloud CLI response cache backed by sqlite,
+    so that several lilac processes can share the same responses.
+    """
+
+    def __init__(self, path: str, ttl: dict):
+        """
+        @param path: sqlite database file
+        @param ttl: key: command family prefix (e.g. 'az resource list') or 'default',
+            value: time to live in seconds
+        """
+        self.path = path
+        self.ttl = ttl
+        # sqlite connections can not be shared between threads
+        self.local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    account TEXT,
+                    cmd TEXT,
+                    stdout TEXT,
+                    created REAL
+                )"""
+            )
+            self.local.conn = conn
+        return conn
+
+    def get_ttl(self, cmd: str) -> float:
+        """
+        TTL of the longest command family matching `cmd`.
+        """
+        family = max(
+            (k for k in self.ttl if k != "default" and cmd.startswith(k)),
+            key=len,
+            default="default",
+        )
+        return self.ttl.get(family, 0)
+
+    def _key(self, cmd: str, account: str) -> str:
+        return hashlib.sha256(f"{account}\0{cmd}".encode()).hexdigest()
+
+    def get(self, cmd: str, account: str):
+        """
+        Return the cached stdout of `cmd`, or None if missing or expired.
+        """
+        cmd = normalize_cmd(cmd)
+        row = (
+            self._connect()
+            .execute(
+                "SELECT stdout, created FROM responses WHERE key = ?",
+                (self._key(cmd, account),),
+            )
+            .fetchone()
+        )
+        if row is None or time.time() - row[1] > self.get_ttl(cmd):
+            return None
+        # responses written from a file are stored as blobs
+        return row[0].decode() if isinstance(row[0], bytes) else row[0]
+
+    def open(self, cmd: str, account: str):
+        """
+        Return the cached stdout of `cmd` as a text stream read in chunks,
+        or None if missing or expired.
+        """
+        cmd = normalize_cmd(cmd)
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT rowid, created FROM responses WHERE key = ?",
+            (self._key(cmd, account),),
+        ).fetchone()
+        if row is None or time.time() - row[1] > self.get_ttl(cmd):
+            return None
+        return CachedResponse(
+            conn.blobopen("responses", "stdout", row[0], readonly=True)
+        )
+
+    def put(self, cmd: str, account: str, stdout: str):
+        cmd = normalize_cmd(cmd)
+        if self.get_ttl(cmd) <= 0:
+            return
+        self._connect().execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+            (self._key(cmd, account), account, cmd, stdout, time.time()),
+        )
+
+    def put_file(self, cmd: str, account: str, file):
+        """
+        Like `put`, copying the stdout from a binary file in chunks,
+        so that a large response is never in memory at once.
+        """
+        cmd = normalize_cmd(cmd)
+        if self.get_ttl(cmd) <= 0:
+            return
+        size = file.seek(0, os.SEEK_END)
+        file.seek(0)
+        conn = self._connect()
+        # readers only see the response once it is completely written
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rowid = conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, zeroblob(?), ?)",
+                (self._key(cmd, account), account, cmd, size, time.time()),
+            ).lastrowid
+            with conn.blobopen("responses", "stdout", rowid) as blob:
+                while chunk := file.read(CHUNK_SIZE):
+                    blob.write(chunk)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def invalidate(self, account: str):
+        """
+        Drop all cached responses of `account`, e.g. after the infrastructure changed.
+        """
+        self._connect().execute("DELETE FROM responses WHERE account = ?", (account,))
+
+
+class CachedResponse:
+    """
+    Text stream of a cached response, decoded from its sqlite blob in chunks.
+    """
+
+    def __init__(self, blob):
+        self.blob = blob
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+
+    def read(self, size=-1) -> str:
+        while True:
+            data = self.blob.read(size)
+            text = self.decoder.decode(data, final=not data)
+            # a chunk may end inside a multi-byte character
+            if text or not data:
+                return text
+
+    def close(self):
+        self.blob.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """
+    Return the process-wide ResponseCache, or None if caching is disabled.
+    """
+    global _response_cache
+    if not Config["cloud_cache_enabled"]:
+        return None
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache(
+                Config["cloud_cache_path"], Config["cloud_cache_ttl"]
+            )
+    return _response_cache
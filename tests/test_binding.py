@@ -0,0 +1,45 @@
+"""
+Checks of binding every combination of argument values into API calls.
+Run from the repository root with the config files in place, like lilac itself:
+
+    python -m pytest tests
+"""
+
+import pytest
+
+from lilac.inferRule import InferAPIArg
+from lilac.inferWorker import AzureInferWorker
+
+NIC_SHOW = "az network nic ip-config show"
+
+
+@pytest.fixture
+def worker(tmp_path, monkeypatch):
+    (tmp_path / "cache").mkdir()
+    monkeypatch.chdir(tmp_path)
+    return AzureInferWorker("rg")
+
+
+def test_every_combination_is_bound(worker):
+    worker.apiarg_map[InferAPIArg(NIC_SHOW, "nic-name")] = {"n2", "n1"}
+    worker.apiarg_map[InferAPIArg(NIC_SHOW, "name")] = {"c1"}
+    arg_names = {"resource-group", "nic-name", "name"}
+    arg_maps = [
+        {"name": "c1", "nic-name": "n1", "resource-group": "rg"},
+        {"name": "c1", "nic-name": "n2", "resource-group": "rg"},
+    ]
+    assert worker._resolve_args(NIC_SHOW, arg_names) == arg_maps
+    # the values are read, not consumed
+    assert worker._resolve_args(NIC_SHOW, arg_names) == arg_maps
+    assert worker._get_full_api_call(NIC_SHOW, arg_maps[0]).startswith(
+        f"{NIC_SHOW} --name c1 --nic-name n1 --resource-group rg"
+    )
+
+
+def test_missing_arguments_bind_nothing(worker):
+    worker.apiarg_map[InferAPIArg(NIC_SHOW, "nic-name")] = {"n1"}
+    assert worker._resolve_args(NIC_SHOW, {"nic-name", "name"}) == []
+    # the resource group is always known
+    assert worker._resolve_args(NIC_SHOW, {"resource-group"}) == [
+        {"resource-group": "rg"}
+    ]
@@ -0,0 +1,75 @@
+"""
+Checks of discovering top-level Azure resources with Resource Graph queries.
+Run from the repository root with the config files in place, like lilac itself:
+
+    python -m pytest tests
+"""
+
+import json
+
+from lilac.utils import Config
+from lilac.inferWorker import AzureInferWorker
+from lilac.queryBackend import StubARMServer, ResidentBackend, runner
+from lilac.inferWorker.azure import build_graph_query, flatten_properties
+
+SUBSCRIPTION = "sub"
+RESOURCES = [
+    {
+        "id": f"/subscriptions/{SUBSCRIPTION}/resourceGroups/rg{i % 2}"
+        f"/providers/Microsoft.Compute/disks/d{i}",
+        "name": f"d{i}",
+        "type": "Microsoft.Compute/disks",
+        "properties": {"diskSizeGB": i, "encryption": {"type": "platform"}},
+    }
+    for i in range(7)
+]
+
+
+def test_stub_graph_query_pages():
+    with StubARMServer(RESOURCES, SUBSCRIPTION) as server:
+        backend = ResidentBackend(server.endpoint, SUBSCRIPTION, token="stub")
+        query = "Resources | where resourceGroup in~ ('rg1') | order by id asc"
+        ids, skip_token = [], None
+        while True:
+            cmd = f'az graph query -q "{query}" --first 2'
+            if skip_token:
+                cmd += f" --skip-token {skip_token}"
+            page = json.loads(backend.run(cmd).stdout)
+            ids.extend(record["name"] for record in page["data"])
+            skip_token = page["skip_token"]
+            if not skip_token:
+                break
+        assert ids == ["d1", "d3", "d5"]
+        assert len(server.requests) == 2
+
+
+def test_graph_query():
+    assert build_graph_query() == "Resources | order by id asc"
+    assert build_graph_query(["rg0", "rg1"]) == (
+        "Resources | where resourceGroup in~ ('rg0', 'rg1') | order by id asc"
+    )
+
+
+def test_flatten_properties():
+    record = {"id": "d", "properties": {"size": 1, "nested": {"properties": {"a": 2}}}}
+    assert flatten_properties([record]) == [{"id": "d", "size": 1, "nested": {"a": 2}}]
+    # `properties` that is not an object is kept as is
+    assert flatten_properties({"properties": [1]}) == {"properties": [1]}
+
+
+def test_graph_discovery(tmp_path, monkeypatch):
+    (tmp_path / "cache").mkdir()
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setitem(Config, "azure_subscription_id", SUBSCRIPTION)
+    monkeypatch.setitem(Config, "cloud_cache_enabled", False)
+    monkeypatch.setattr("lilac.inferWorker.azure.GRAPH_PAGE_SIZE", 2)
+    with StubARMServer(RESOURCES, SUBSCRIPTION) as server:
+        backend = ResidentBackend(server.endpoint, SUBSCRIPTION, token="stub")
+        monkeypatch.setattr(runner, "get_query_backend", lambda: backend)
+        worker = AzureInferWorker("rg1", discovery="graph", group_names=["rg0", "rg1"])
+        resources = worker._discover_graph_resources()
+        # 7 resources of both groups in pages of 2
+        assert len(server.requests) == 4
+    assert [resource["name"] for resource in resources] == ["d1", "d3", "d5"]
+    assert resources[0]["diskSizeGB"] == 1
+    assert resources[0]["encryption"] == {"type": "platform"}
@@ -0,0 +1,35 @@
+"""
+Checks of streaming import blocks of lifted instances without terraform plan.
+Run from the repository root with the config files in place, like lilac itself:
+
+    python -m pytest tests
+"""
+
+import json
+
+from lilac.inferWorker.base import ImportInstance
+from lilac.inferWorker.importer import ImportBlockWriter
+
+VNET = (
+    "/subscriptions/sub/resourceGroups/rg/providers/Microsoft.Network/virtualNetworks"
+)
+
+
+def test_blocks_are_readable_as_written(tmp_path):
+    tf_path, jsonl_path = tmp_path / "out" / "import.tf", tmp_path / "import.jsonl"
+    writer = ImportBlockWriter(str(tf_path), str(jsonl_path), "provider {}\n")
+    instances = [
+        ImportInstance("azurerm_virtual_network", f"v{i}", f"{VNET}/v{i}")
+        for i in range(2)
+    ]
+    writer.write(instances[:1])
+    # flushed batch by batch, before the writer is closed
+    assert tf_path.read_text().count("import {") == 1
+    writer.write(instances[1:])
+    writer.close()
+    assert writer.count == 2
+    content = tf_path.read_text()
+    assert content.startswith("provider {}\n")
+    assert f'id = "{VNET}/v1"\n    to = azurerm_virtual_network.v1\n' in content
+    with open(jsonl_path) as f:
+        assert [ImportInstance(**json.loads(line)) for line in f] == instances
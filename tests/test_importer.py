@@ -0,0 +1,83 @@
+"""
+Checks of generating the config of imported instances with sharded plans.
+Run from the repository root with the config files in place, like lilac itself:
+
+    python -m pytest tests
+"""
+
+import os
+import stat
+from collections import namedtuple
+
+import pytest
+
+from lilac.inferWorker.importer import (
+    GENERATED_HEADER,
+    plan_shard,
+    is_generated_config_error,
+)
+
+Instance = namedtuple("Instance", ["tftype", "name", "id"])
+INSTANCE = Instance("azurerm_virtual_network", "v1", "/vnets/v1")
+# terraform writes the generated config, then reports the errors of the plan
+FAKE_TERRAFORM = f"""#!/bin/sh
+printf '{GENERATED_HEADER}resource "a" "b" {{}}\\n' > imported.tf
+printf "$FAKE_TF_STDERR" >&2
+exit $FAKE_TF_RETURNCODE
+"""
+CONFIG_ERROR = """
+╷
+│ Error: Conflicting configuration arguments
+│
+│   with azurerm_virtual_network.v1,
+│   on imported.tf line 14:
+│   (source code not available)
+╵
+"""
+IMPORT_ERROR = """
+╷
+│ Error: Cannot import non-existent remote object
+│
+│   with azurerm_virtual_network.v2,
+│   on import.tf line 8:
+╵
+"""
+
+
+def test_generated_config_errors():
+    assert is_generated_config_error(CONFIG_ERROR)
+    assert is_generated_config_error(CONFIG_ERROR * 2)
+    assert not is_generated_config_error(IMPORT_ERROR)
+    assert not is_generated_config_error(CONFIG_ERROR + IMPORT_ERROR)
+    # the plan failed without reporting why
+    assert not is_generated_config_error("")
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    terraform = bin_dir / "terraform"
+    terraform.write_text(FAKE_TERRAFORM)
+    terraform.chmod(terraform.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    os.makedirs(tmp_path / "init" / ".terraform")
+    return tmp_path
+
+
+@pytest.mark.parametrize(
+    "stderr, returncode, planned",
+    [("", 0, True), (CONFIG_ERROR, 1, True), (IMPORT_ERROR, 1, False), ("", 1, False)],
+)
+def test_failed_plans(workspace, monkeypatch, stderr, returncode, planned):
+    monkeypatch.setenv("FAKE_TF_STDERR", stderr)
+    monkeypatch.setenv("FAKE_TF_RETURNCODE", str(returncode))
+    content, result = plan_shard(
+        str(workspace / "shard"),
+        "",
+        [INSTANCE],
+        str(workspace / "plugins"),
+        str(workspace / "init"),
+    )
+    assert result.returncode == returncode
+    assert content == ('resource "a" "b" {}\n' if planned else None)
@@ -0,0 +1,71 @@
+"""
+Checks of journaling the analyzed responses to resume an interrupted lift.
+Run from the repository root with the config files in place, like lilac itself:
+
+    python -m pytest tests
+"""
+
+from lilac.inferWorker.journal import LiftJournal
+
+VNET_LIST = "az network vnet list -g rg"
+SUBNET_LIST = "az network vnet subnet list -g rg --vnet-name v1"
+
+
+def test_resume_replays_completed_calls(tmp_path):
+    path = str(tmp_path / "journal" / "rg.jsonl")
+    journal = LiftJournal(path)
+    journal.append(VNET_LIST, [{"name": "v1"}])
+    journal.append(SUBNET_LIST, [])
+    journal.checkpoint()
+    journal.close()
+
+    journal = LiftJournal(path, resume=True)
+    assert len(journal) == 2
+    # equivalent commands are answered as well
+    assert journal.pop("az network vnet list  -g rg") == [{"name": "v1"}]
+    assert journal.pop(VNET_LIST) is None
+    assert journal.pop(SUBNET_LIST) == []
+    journal.close()
+
+
+def test_resume_after_a_cut_off_line(tmp_path):
+    path = str(tmp_path / "rg.jsonl")
+    journal = LiftJournal(path)
+    journal.append(VNET_LIST, [{"name": "v1"}])
+    journal.close()
+    # the lift was killed while appending
+    with open(path, "a") as f:
+        f.write('{"cmd": "az vm list", "resp')
+
+    journal = LiftJournal(path, resume=True)
+    assert len(journal) == 1
+    journal.append(SUBNET_LIST, [])
+    journal.close()
+    journal = LiftJournal(path, resume=True)
+    assert journal.pop(VNET_LIST) == [{"name": "v1"}]
+    assert journal.pop(SUBNET_LIST) == []
+    assert journal.pop("az vm list") is None
+    journal.close()
+
+
+def test_a_new_lift_starts_over(tmp_path):
+    path = str(tmp_path / "rg.jsonl")
+    journal = LiftJournal(path)
+    journal.append(VNET_LIST, [])
+    journal.close()
+    journal = LiftJournal(path)
+    assert len(journal) == 0
+    journal.close()
+    journal = LiftJournal(path, resume=True)
+    assert journal.pop(VNET_LIST) is None
+    journal.close()
+
+
+def test_checkpoints_sync_at_most_every_interval(tmp_path):
+    journal = LiftJournal(str(tmp_path / "rg.jsonl"), sync_interval=60)
+    journal.append(VNET_LIST, [])
+    journal.checkpoint()
+    assert journal.dirty
+    journal.checkpoint(force=True)
+    assert not journal.dirty
+    journal.close()
@@ -0,0 +1,147 @@
+"""
+Checks of the compiled jsonpaths against jsonpath_ng.
+Run from the repository root with the config files in place, like lilac itself:
+
+    python -m pytest tests
+"""
+
+import random
+
+import pytest
+from jsonpath_ng import parse
+
+from lilac.inferRule.jsonpath import (
+    SchemaExtractor,
+    build_pruner,
+    compile_path,
+    build_projection,
+)
+
+FIELDS = ["a", "b", "id", "c-d", "x_y"]
+SCALARS = [1, "x", None, 2.5, True, "", 0, False]
+
+
+def random_value(rng: random.Random, depth=0):
+    if depth > 3:
+        return rng.choice(SCALARS + [[], {}])
+    r = rng.random()
+    if r < 0.35:
+        return [random_value(rng, depth + 1) for _ in range(rng.randint(0, 3))]
+    if r < 0.7:
+        return {
+            field: random_value(rng, depth + 1)
+            for field in rng.sample(FIELDS, rng.randint(0, 4))
+        }
+    return rng.choice(SCALARS)
+
+
+def random_path(rng: random.Random) -> str:
+    path = "$"
+    for _ in range(rng.randint(0, 4)):
+        path += "[*]" if rng.random() < 0.4 else "." + rng.choice(FIELDS)
+    return path
+
+
+def test_compile_path():
+    assert compile_path("$[*].subnets[*].id") == (None, "subnets", None, "id")
+    assert compile_path("$.a.@b") == ("a", "@b")
+    # outside of the grammar, left to jsonpath_ng
+    assert compile_path("$.tags.where") is None
+    assert compile_path("$..id") is None
+    assert compile_path("id") is None
+
+
+def test_extractor_matches_jsonpath_ng():
+    rng = random.Random(0)
+    for _ in range(500):
+        response = random_value(rng)
+        exprs = list({random_path(rng) for _ in range(5)})
+        matches = SchemaExtractor(exprs).find(response)
+        for expr in exprs:
+            expected = [match.value for match in parse(expr).find(response)]
+            assert matches[expr] == expected, (expr, response)
+
+
+def test_extractor_falls_back_to_jsonpath_ng():
+    response = {"items": [{"id": 1}, {"id": 2, "child": {"id": 3}}]}
+    extractor = SchemaExtractor(["$.items[1].id", "$..id"])
+    assert extractor.fallbacks
+    matches = extractor.find(response)
+    for expr in extractor.exprs:
+        assert matches[expr] == [match.value for match in parse(expr).find(response)]
+
+
+@pytest.mark.parametrize("offset", [0, 5])
+def test_find_records(offset: int):
+    response = [
+        {"id": "vm0", "disks": [{"name": "d0"}, {"name": "d1"}]},
+        {"id": "vm1", "disks": {"name": "d2"}},
+    ]
+    extractor = SchemaExtractor(["$[*].id", "$[*].disks[*].name"])
+    matches = extractor.find_records(response, offset)
+    assert matches["$[*].id"] == [((offset,), "vm0"), ((offset + 1,), "vm1")]
+    # a single object is read as a one-element list
+    assert matches["$[*].disks[*].name"] == [
+        ((offset, 0), "d0"),
+        ((offset, 1), "d1"),
+        ((offset + 1, 0), "d2"),
+    ]
+
+
+def random_list_paths(rng: random.Random) -> list:
+    return list({"$[*]" + random_path(rng)[1:] for _ in range(4)})
+
+
+def find_values(exprs, response) -> dict:
+    # fields missing in a projected record come back as null, and are skipped
+    matches = SchemaExtractor(exprs).find(response)
+    return {
+        expr: [value for value in values if value is not None]
+        for expr, values in matches.items()
+    }
+
+
+def test_projection_keeps_the_read_values():
+    jmespath = pytest.importorskip("jmespath")
+    rng = random.Random(1)
+    for _ in range(500):
+        # az list commands output a list of objects
+        response = [
+            {field: random_value(rng, 1) for field in rng.sample(FIELDS, 3)}
+            for _ in range(rng.randint(0, 3))
+        ]
+        exprs = random_list_paths(rng)
+        projection = build_projection(exprs)
+        if projection is None:
+            continue
+        projected = jmespath.search(projection, response)
+        assert find_values(exprs, projected) == find_values(exprs, response), (
+            projection,
+            response,
+        )
+
+
+def test_projection_keeps_nested_lists_whole():
+    jmespath = pytest.importorskip("jmespath")
+    exprs = ["$[*].id", "$[*].subnets[*].id"]
+    projection = build_projection(exprs)
+    assert projection == '[*].{"id": "id", "subnets": "subnets"}'
+    # a single subnet object is read as a one-element list
+    response = [{"id": "v1", "subnets": {"id": "s1", "name": "n"}, "tags": {}}]
+    projected = jmespath.search(projection, response)
+    assert find_values(exprs, projected) == find_values(exprs, response)
+
+
+def test_pruner_keeps_the_read_values():
+    rng = random.Random(2)
+    for _ in range(500):
+        response = [random_value(rng, 1) for _ in range(rng.randint(0, 3))]
+        exprs = random_list_paths(rng)
+        prune = build_pruner(exprs, ["id"])
+        if prune is None:
+            continue
+        pruned = [prune(record) for record in response]
+        assert find_values(exprs, pruned) == find_values(exprs, response), (
+            exprs,
+            response,
+        )
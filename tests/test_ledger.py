@@ -0,0 +1,59 @@
+"""
+Checks of memoizing the API calls executed in a lifting run.
+Run from the repository root with the config files in place, like lilac itself:
+
+    python -m pytest tests
+"""
+
+import threading
+
+from lilac.inferWorker.ledger import ExecutionLedger
+
+VNET_LIST = "az network vnet list -g rg --query [*].id"
+
+
+def test_equivalent_calls_run_once():
+    ledger = ExecutionLedger()
+    assert ledger.claim(VNET_LIST)
+    assert not ledger.claim("az network vnet list  --query [*].id -g rg")
+    # pending until its response is recorded
+    assert ledger.lookup(VNET_LIST) is None
+    ledger.record(VNET_LIST, [{"id": "v1"}])
+    assert ledger.lookup("az network vnet list --query [*].id -g rg") == [{"id": "v1"}]
+    assert (ledger.hits, ledger.misses, len(ledger)) == (1, 1, 1)
+
+
+def test_failed_calls():
+    ledger = ExecutionLedger()
+    ledger.claim(VNET_LIST)
+    ledger.fail(VNET_LIST)
+    assert not ledger.claim(VNET_LIST)
+    assert ledger.has_failed(VNET_LIST)
+    assert ledger.lookup(VNET_LIST) is None
+
+
+def test_released_calls_run_again():
+    ledger = ExecutionLedger()
+    ledger.claim(VNET_LIST)
+    ledger.fail(VNET_LIST)
+    ledger.release(VNET_LIST)
+    assert not ledger.has_failed(VNET_LIST)
+    assert ledger.claim(VNET_LIST)
+
+
+def test_concurrent_claims():
+    ledger = ExecutionLedger()
+    barrier = threading.Barrier(8)
+    claimed = []
+
+    def claim():
+        barrier.wait()
+        if ledger.claim(VNET_LIST):
+            claimed.append(threading.get_ident())
+
+    threads = [threading.Thread(target=claim) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(claimed) == 1
@@ -0,0 +1,120 @@
+"""
+Checks of joining ID components by the records they came from.
+Run from the repository root with the config files in place, like lilac itself:
+
+    python -m pytest tests
+"""
+
+from lilac.inferRule import InferAPIArg
+from lilac.inferWorker.lineage import Origin, Lineage
+
+LIST_VNETS = "az network vnet list -g rg"
+VNET_NAME = InferAPIArg("az network vnet show", "name")
+SUBNET_VNET_NAME = InferAPIArg("az network vnet subnet list", "vnet-name")
+
+
+def combine(left, right):
+    return f"{left}/{right}"
+
+
+def get_vnet_lineage(vnets: dict) -> Lineage:
+    """
+    Lineage of `vnet show` and `subnet list` called with the names of the VNets
+    in a listed response, as a lift binds them.
+    @param vnets: key: VNet name, value: names of its subnets
+    """
+    lineage = Lineage()
+    for i, vnet in enumerate(vnets):
+        lineage.add_arg(VNET_NAME, vnet, Origin(LIST_VNETS, (i,)))
+        lineage.add_arg(SUBNET_VNET_NAME, vnet, Origin(LIST_VNETS, (i,)))
+    for vnet, subnets in vnets.items():
+        show = f"az network vnet show --name {vnet}"
+        lineage.bind_call(show, {VNET_NAME: vnet})
+        lineage.add_id("base", f"/vnets/{vnet}", Origin(show, ()))
+        subnet_list = f"az network vnet subnet list --vnet-name {vnet}"
+        lineage.bind_call(subnet_list, {SUBNET_VNET_NAME: vnet})
+        for i, subnet in enumerate(subnets):
+            lineage.add_id("child", subnet, Origin(subnet_list, (i,)))
+    return lineage
+
+
+def join_values(lineage: Lineage, left, right) -> set:
+    joined = lineage.join(
+        lineage.get_records(left), lineage.get_records(right), combine
+    )
+    return {value for value, _ in joined}
+
+
+def test_join_nested_records():
+    lineage = Lineage()
+    vms = "az vm list -g rg"
+    for i, vm in enumerate(["vm0", "vm1"]):
+        lineage.add_id("base", vm, Origin(vms, (i,)))
+    for path, disk in [((0, 0), "d0"), ((0, 1), "d1"), ((1, 0), "d2")]:
+        lineage.add_id("child", disk, Origin(vms, path))
+    assert join_values(lineage, "base", "child") == {"vm0/d0", "vm0/d1", "vm1/d2"}
+
+
+def test_join_sibling_calls():
+    lineage = get_vnet_lineage({"v1": ["s1", "s2"], "v2": ["s3"], "v3": []})
+    assert join_values(lineage, "base", "child") == {
+        "/vnets/v1/s1",
+        "/vnets/v1/s2",
+        "/vnets/v2/s3",
+    }
+
+
+def test_join_sibling_calls_again():
+    # values joined from sibling records keep relating to both of them
+    lineage = get_vnet_lineage({"v1": ["s1"], "v2": ["s2"]})
+    joined = lineage.join(
+        lineage.get_records("base"), lineage.get_records("child"), combine
+    )
+    assert {value for value, _ in lineage.join(joined, joined, combine)} == {
+        "/vnets/v1/s1//vnets/v1/s1",
+        "/vnets/v2/s2//vnets/v2/s2",
+    }
+
+
+def test_join_unrelated_calls():
+    lineage = Lineage()
+    for i, name in enumerate(["a", "b"]):
+        lineage.add_id("left", name, Origin("az x list", (i,)))
+    for i, name in enumerate(["c", "d"]):
+        lineage.add_id("right", name, Origin("az y list", (i,)))
+    assert join_values(lineage, "left", "right") == {"a/c", "a/d", "b/c", "b/d"}
+    assert join_values(lineage, "left", "missing") == set()
+
+
+def test_join_records_of_one_list():
+    # items of the same list response are different records
+    lineage = Lineage()
+    for i, (name, tag) in enumerate([("a", "x"), ("b", "y")]):
+        lineage.add_id("left", name, Origin("az x list", (i, 0)))
+        lineage.add_id("right", tag, Origin("az x list", (i, 1)))
+    assert join_values(lineage, "left", "right") == {"a/x", "b/y"}
+
+
+def test_bind_call_keeps_related_origins():
+    lineage = Lineage()
+    vnet = InferAPIArg("az network nic list", "vnet-name")
+    location = InferAPIArg("az network nic list", "location")
+    # a location shared by both VNets, and only the first one's name
+    for i in range(2):
+        lineage.add_arg(location, "westus", Origin(LIST_VNETS, (i,)))
+    lineage.add_arg(vnet, "v1", Origin(LIST_VNETS, (0,)))
+    lineage.bind_call("nic", {vnet: "v1", location: "westus"})
+    assert lineage.call_parents["nic"] == {Origin(LIST_VNETS, (0,))}
+
+
+def test_bind_call_keeps_unrelated_origins():
+    lineage = Lineage()
+    vnet = InferAPIArg("az network nic list", "vnet-name")
+    location = InferAPIArg("az network nic list", "location")
+    lineage.add_arg(vnet, "v1", Origin(LIST_VNETS, (0,)))
+    lineage.add_arg(location, "westus", Origin("az account list-locations", (3,)))
+    lineage.bind_call("nic", {vnet: "v1", location: "westus"})
+    assert lineage.call_parents["nic"] == {
+        Origin(LIST_VNETS, (0,)),
+        Origin("az account list-locations", (3,)),
+    }
@@ -0,0 +1,131 @@
+"""
+Checks of fetching az list outputs page by page.
+Run from the repository root with the config files in place, like lilac itself:
+
+    python -m pytest tests
+"""
+
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from lilac.utils import Config
+from lilac.inferWorker import AzureInferWorker
+from lilac.queryBackend import CloudPage, StubARMServer, ResidentBackend
+from lilac.inferWorker.base import APIResult, InferWorker
+from lilac.inferWorker.journal import LiftJournal, JournalSpool
+
+SUBSCRIPTION = "sub"
+RESOURCES = [
+    {
+        "id": f"/subscriptions/{SUBSCRIPTION}/resourceGroups/rg"
+        f"/providers/Microsoft.Compute/disks/d{i}",
+        "name": f"d{i}",
+        "type": "Microsoft.Compute/disks",
+    }
+    for i in range(7)
+]
+NIC_LIST = "az network nic list"
+
+
+def test_stub_pages_with_next_token():
+    with StubARMServer(RESOURCES, SUBSCRIPTION, page_size=3) as server:
+        backend = ResidentBackend(server.endpoint, SUBSCRIPTION, token="stub")
+        names, token, pages = [], None, 0
+        while True:
+            cmd = "az resource list --max-items 3"
+            if token:
+                cmd += f" --next-token {token}"
+            page = CloudPage(backend.stream(cmd))
+            names.extend(item["name"] for item in page)
+            token, pages = page.next_token, pages + 1
+            if not token:
+                break
+        assert names == [f"d{i}" for i in range(7)]
+        assert pages == 3
+        assert len(server.requests) == 3
+
+
+class RejectingCLI:
+    """
+    az commands rejecting `--max-items`, like the ones not generated by AAZ.
+    """
+
+    def __init__(self):
+        self.cmds = []
+        self.lock = threading.Lock()
+
+    def __call__(self, full_api: str, api=None, stream=False, paged=False):
+        with self.lock:
+            self.cmds.append(full_api)
+        time.sleep(0.01)
+        if "--max-items" in full_api:
+            stderr = "az: error: unrecognized arguments: --max-items 2"
+            return APIResult(2, None, stderr)
+        return APIResult(0, [{"name": full_api.split()[-1]}], "")
+
+
+@pytest.fixture
+def worker(tmp_path, monkeypatch):
+    (tmp_path / "cache").mkdir()
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setitem(Config, "lift_page_size", 2)
+    monkeypatch.setitem(Config, "lift_query_pushdown", False)
+    return AzureInferWorker("rg")
+
+
+def test_paging_is_off_by_default():
+    assert Config["lift_page_size"] == 0
+
+
+def test_only_group_calls_are_paged(worker):
+    full_api = worker._get_full_api_call(NIC_LIST, {"resource-group": "rg"})
+    assert worker._get_page_call(NIC_LIST, full_api).endswith("--max-items 2")
+    # subscription-wide calls are shared with other workers, and kept whole
+    assert worker._get_page_call(NIC_LIST, NIC_LIST) is None
+
+
+def test_rejected_paging_is_probed_once(worker, monkeypatch):
+    cli = RejectingCLI()
+    monkeypatch.setattr(InferWorker, "_run_api_call", cli)
+    page_apis = [
+        worker._get_page_call(
+            NIC_LIST,
+            worker._get_full_api_call(
+                NIC_LIST, {"resource-group": "rg", "vnet-name": f"v{i}"}
+            ),
+        )
+        for i in range(8)
+    ]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(
+            executor.map(
+                lambda page_api: worker._run_api_call(page_api, NIC_LIST, paged=True),
+                page_apis,
+            )
+        )
+    # only the first call fails, the concurrent ones wait for it
+    assert sum("--max-items" in cmd for cmd in cli.cmds) == 1
+    assert len(cli.cmds) == 9
+    assert [result.response for result in results] == [
+        [{"name": f"v{i}"}] for i in range(8)
+    ]
+    assert worker._get_page_call(NIC_LIST, f"{NIC_LIST} --resource-group rg") is None
+
+
+def test_spooled_pages_are_journaled(tmp_path):
+    journal = LiftJournal(str(tmp_path / "journal.jsonl"))
+    spool = JournalSpool(NIC_LIST)
+    pages = [[{"id": 1}, {"id": "ü"}], [], [{"id": None}]]
+    for page in pages:
+        spool.write(page)
+    journal.append_spool(spool)
+    journal.close()
+    with open(tmp_path / "journal.jsonl") as f:
+        assert json.loads(f.readline()) == {
+            "cmd": NIC_LIST,
+            "response": [item for page in pages for item in page],
+        }
@@ -0,0 +1,90 @@
+"""
+Checks of choosing the cheapest APIs providing the ID schemas of the lifted TF types.
+Run from the repository root with the config files in place, like lilac itself:
+
+    python -m pytest tests
+"""
+
+from types import SimpleNamespace
+from collections import namedtuple
+
+import pytest
+
+from lilac.inferRule import InferAPIArg
+from lilac.inferWorker.planner import APIPlanner, APICostModel
+
+Schema = namedtuple("Schema", ["component", "tftype"])
+VNET_ID = Schema("ID", "vnet")
+SUBNET_ID = Schema("ID", "subnet")
+DISK_ID = Schema("ID", "disk")
+DISK_NAME = InferAPIArg("az disk show", "name")
+COSTS = {
+    "az graph query": 10,
+    "az network vnet list": 1,
+    "az network vnet subnet list": 1,
+    "az disk show": 1,
+    "az disk list": 3,
+}
+
+
+class StubRule:
+    """
+    InferRule of APIs given by the ID schemas and the arguments they provide.
+    """
+
+    def __init__(self):
+        self.api_response_map = {
+            api: SimpleNamespace(tftypes_schemas=set(schemas), apiarg_schemas=set(args))
+            for api, schemas, args in [
+                ("az graph query", [VNET_ID, SUBNET_ID], []),
+                ("az network vnet list", [VNET_ID], []),
+                ("az network vnet subnet list", [SUBNET_ID], []),
+                ("az disk show", [DISK_ID], []),
+                ("az disk list", [], [DISK_NAME]),
+            ]
+        }
+        self.tfid_components = {"vnet": {"ID"}, "subnet": {"ID"}, "disk": {"ID"}}
+
+    def get_required_args(self, api: str) -> set:
+        return {"name"} if api == "az disk show" else set()
+
+
+def get_planner() -> APIPlanner:
+    return APIPlanner(StubRule(), COSTS.get, lambda arg: False)
+
+
+def test_cheapest_apis_are_planned():
+    planner = get_planner()
+    assert planner.plan(set(COSTS)) == {
+        "az network vnet list",
+        "az network vnet subnet list",
+        # planned with the API providing its argument
+        "az disk show",
+        "az disk list",
+    }
+    assert get_planner().plan(set(COSTS), {"vnet"}) == {"az network vnet list"}
+
+
+def test_failed_apis_fall_back():
+    planner = get_planner()
+    planner.plan(set(COSTS), {"vnet", "subnet"})
+    assert planner.fallback("az network vnet list") == {"az graph query"}
+    assert planner.fallback("az network vnet list") == set()
+    # nothing else provides the disk names
+    planner = get_planner()
+    planner.plan(set(COSTS), {"disk"})
+    assert planner.fallback("az disk list") == set()
+
+
+def test_cost_model(tmp_path):
+    path = str(tmp_path / "costs.json")
+    model = APICostModel(path)
+    model.observe("az vm list", 1.0, 0)
+    model.observe("az vm list", 2.0, 1 << 20)
+    model.observe_fanout("az vm list", 4)
+    model.save()
+    model = APICostModel(path)
+    # moving averages weighing the newest observation by 0.3
+    assert model.estimate("az vm list") == pytest.approx(4 * (1.3 + 0.3))
+    assert model.estimate("az vm list", fanout=1) == pytest.approx(1.3 + 0.3)
+    assert model.estimate("az disk list") == 2.0
@@ -0,0 +1,148 @@
+"""
+Checks of the resident backend against the local ARM stub.
+Run from the repository root with the config files in place, like lilac itself:
+
+    python -m pytest tests
+"""
+
+import io
+import sys
+import json
+import time
+import types
+import logging
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from lilac.queryBackend import StubARMServer, ResidentBackend, resident
+from lilac.queryBackend.resident import CLIErrorHandler
+
+SUBSCRIPTION = "sub"
+RESOURCES = [
+    {
+        "id": f"/subscriptions/{SUBSCRIPTION}/resourceGroups/rg{i % 2}"
+        f"/providers/Microsoft.Compute/disks/d{i}",
+        "name": f"d{i}",
+        "type": "Microsoft.Compute/disks",
+    }
+    for i in range(7)
+]
+
+
+def test_stub_follows_next_links():
+    with StubARMServer(RESOURCES, SUBSCRIPTION, page_size=2) as server:
+        backend = ResidentBackend(server.endpoint, SUBSCRIPTION, token="stub")
+        items = list(backend.stream("az resource list -g rg0"))
+        assert [item["name"] for item in items] == ["d0", "d2", "d4", "d6"]
+        assert all(item["resourceGroup"] == "rg0" for item in items)
+        # 4 resources in pages of 2
+        assert len(server.requests) == 2
+
+
+def test_resident_reports_arm_errors():
+    with StubARMServer(RESOURCES, SUBSCRIPTION) as server:
+        backend = ResidentBackend(server.endpoint, SUBSCRIPTION, token="stub")
+        result = backend.run("az rest --url /subscriptions/sub/resourceGroups/none/x")
+        assert result.returncode == 1
+        assert "ResourceNotFound" in result.stderr
+        with pytest.raises(subprocess.CalledProcessError):
+            list(backend.stream("az rest --url /subscriptions/sub/x"))
+
+
+def test_cli_errors_are_kept_per_command():
+    handler = CLIErrorHandler()
+    logger = logging.getLogger("cli.test")
+    logger.addHandler(handler)
+    barrier = threading.Barrier(4)
+    errors = {}
+
+    def invoke(i: int):
+        buffer = io.StringIO()
+        handler.local.buffer = buffer
+        barrier.wait()
+        logger.error(f"command {i} failed")
+        barrier.wait()
+        handler.local.buffer = None
+        errors[i] = buffer.getvalue()
+
+    try:
+        threads = [threading.Thread(target=invoke, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        logger.removeHandler(handler)
+    assert errors == {i: f"ERROR: command {i} failed\n" for i in range(4)}
+
+
+class FakeCLI:
+    """
+    In-process Azure CLI counting the commands running at the same time, and
+    configuring the loggers like knack does.
+    """
+
+    def __init__(self):
+        self.running = 0
+        self.max_running = 0
+
+    def invoke(self, args: list, out_file=None) -> int:
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        logging.getLogger().setLevel(logging.DEBUG)
+        time.sleep(0.01)
+        self.running -= 1
+        if args[0] == "fail":
+            logging.getLogger(resident.CLI_LOGGER_NAME).error(f"{args[1]} failed")
+            return 1
+        out_file.write(json.dumps(args) + "\n")
+        return 0
+
+
+@pytest.fixture
+def cli(monkeypatch):
+    cli = FakeCLI()
+    core = types.ModuleType("azure.cli.core")
+    core.get_default_cli = lambda: cli
+    monkeypatch.setitem(sys.modules, "azure", types.ModuleType("azure"))
+    monkeypatch.setitem(sys.modules, "azure.cli", types.ModuleType("azure.cli"))
+    monkeypatch.setitem(sys.modules, "azure.cli.core", core)
+    return cli
+
+
+def test_cli_commands_run_one_at_a_time(cli):
+    backend = ResidentBackend("http://localhost:1", SUBSCRIPTION, token="stub")
+    root_logger = logging.getLogger()
+    level = root_logger.level
+    cmds = [f"az {'fail' if i % 2 else 'vm'} c{i}" for i in range(8)]
+    try:
+        with ThreadPoolExecutor(4) as executor:
+            results = list(executor.map(backend.run, cmds))
+    finally:
+        backend.close()
+    assert cli.max_running == 1
+    assert root_logger.level == level
+    for i, result in enumerate(results):
+        if i % 2:
+            assert result.returncode == 1
+            assert result.stderr == f"ERROR: c{i} failed\n"
+        else:
+            assert result.returncode == 0
+            assert json.loads(result.stdout) == ["vm", f"c{i}"]
+
+
+def test_failed_token_fails_the_command(monkeypatch):
+    def get_access_token(cmd, **kwargs):
+        return subprocess.CompletedProcess(
+            cmd, 1, stdout="", stderr="Please run 'az login' to setup account."
+        )
+
+    monkeypatch.setattr(resident.subprocess, "run", get_access_token)
+    backend = ResidentBackend("http://localhost:1", SUBSCRIPTION)
+    result = backend.run("az group list")
+    assert result.returncode == 1
+    assert "AuthenticationFailed" in result.stderr
+    assert "az login" in result.stderr
@@ -0,0 +1,83 @@
+"""
+Checks of the shared cloud CLI response cache.
+Run from the repository root with the config files in place, like lilac itself:
+
+    python -m pytest tests
+"""
+
+import subprocess
+
+import pytest
+
+from lilac.utils import Config, ResponseCache, is_read_cmd, normalize_cmd, responseCache
+from lilac.queryBackend import runner
+
+
+class EchoBackend:
+    """
+    Query backend printing the command it runs.
+    """
+
+    def __init__(self):
+        self.cmds = []
+
+    def run(self, cmd: str) -> subprocess.CompletedProcess:
+        self.cmds.append(cmd)
+        return subprocess.CompletedProcess(cmd, 0, stdout=f'"{cmd}"', stderr="")
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = ResponseCache(
+        str(tmp_path / "cache.sqlite"), {"default": 300, "az resource list": 60}
+    )
+    monkeypatch.setattr(runner, "get_response_cache", lambda: cache)
+    return cache
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    backend = EchoBackend()
+    monkeypatch.setattr(runner, "get_query_backend", lambda: backend)
+    return backend
+
+
+def test_read_cmds():
+    assert is_read_cmd("az vm list -g rg")
+    assert is_read_cmd("az network vnet subnet show --name s")
+    assert not is_read_cmd("az vm create --name list")
+    assert not is_read_cmd("az group delete -g rg")
+
+
+def test_equivalent_cmds_share_a_key():
+    assert normalize_cmd("az vm  list --b 2 -g rg") == normalize_cmd(
+        "az vm list -g rg --b 2"
+    )
+
+
+def test_responses_expire_by_family(cache, monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr(responseCache.time, "time", lambda: now)
+    cache.put("az resource list -g rg", "sub", "[1]")
+    cache.put("az vm list -g rg", "sub", "[2]")
+    assert cache.get("az resource list  -g rg", "sub") == "[1]"
+    assert cache.get("az vm list -g rg", "other") is None
+    now += 100
+    assert cache.get("az resource list -g rg", "sub") is None
+    assert cache.get("az vm list -g rg", "sub") == "[2]"
+
+
+def test_mutating_cmds_invalidate_the_account(cache, backend):
+    cache.put("az vm list", "other", "[]")
+    for _ in range(2):
+        assert runner.run_cloud_cmd("az vm list", "sub").stdout == '"az vm list"'
+    assert backend.cmds == ["az vm list"]
+    runner.run_cloud_cmd("az vm delete --name a", "sub")
+    assert cache.get("az vm list", "sub") is None
+    assert cache.get("az vm list", "other") == "[]"
+    runner.run_cloud_cmd("az vm list", "sub")
+    assert backend.cmds == ["az vm list", "az vm delete --name a", "az vm list"]
+
+
+def test_lifting_bypasses_the_cache_by_default():
+    assert Config["lift_cloud_cache"] is False
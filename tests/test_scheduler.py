@@ -0,0 +1,94 @@
+"""
+Checks of scheduling API calls by the arguments they wait on.
+Run from the repository root with the config files in place, like lilac itself:
+
+    python -m pytest tests
+"""
+
+from types import SimpleNamespace
+
+from lilac.inferRule import InferAPIArg
+from lilac.inferWorker.scheduler import APIScheduler, APIInvocation
+
+VNET_LIST = "az network vnet list"
+SUBNET_LIST = "az network vnet subnet list"
+NIC_LIST = "az network nic list"
+VNET_NAME = InferAPIArg(SUBNET_LIST, "vnet-name")
+
+
+class StubRule:
+    """
+    InferRule of APIs given by their required arguments and the arguments their
+    responses provide.
+    """
+
+    def __init__(self, args: dict, provides: dict):
+        self.args = args
+        self.api_response_map = {
+            api: SimpleNamespace(apiarg_schemas=set(provided))
+            for api, provided in provides.items()
+        }
+
+    def get_required_args(self, api: str) -> set:
+        return set(self.args.get(api, ()))
+
+
+def get_scheduler(args: dict, provides=None):
+    ready = set()
+    scheduler = APIScheduler(StubRule(args, provides or {}), ready.__contains__)
+    return scheduler, ready
+
+
+def test_apis_wait_on_their_arguments():
+    scheduler, ready = get_scheduler({SUBNET_LIST: ["vnet-name"]})
+    scheduler.submit(SUBNET_LIST)
+    scheduler.submit(VNET_LIST)
+    scheduler.submit(VNET_LIST)
+    assert scheduler.pop() == VNET_LIST
+    assert not scheduler
+    # nothing provided the argument yet
+    scheduler.notify({VNET_NAME})
+    assert not scheduler
+    ready.add(VNET_NAME)
+    scheduler.notify({VNET_NAME})
+    assert scheduler.pop() == SUBNET_LIST
+    assert scheduler.get_starved_apis() == {}
+
+
+def test_invocations_are_bound_once():
+    scheduler, _ = get_scheduler({})
+    invocation = scheduler.bind(SUBNET_LIST, {"vnet-name": "v1", "g": "rg"})
+    assert invocation == APIInvocation(SUBNET_LIST, (("g", "rg"), ("vnet-name", "v1")))
+    assert scheduler.bind(SUBNET_LIST, {"g": "rg", "vnet-name": "v1"}) is None
+    assert scheduler.bind(SUBNET_LIST, {"g": "rg", "vnet-name": "v2"})
+    # released APIs can not run again, their invocations are forgotten
+    scheduler.release({VNET_LIST})
+    assert scheduler.bind(SUBNET_LIST, {"g": "rg", "vnet-name": "v1"})
+
+
+def test_restricted_apis_are_pruned():
+    scheduler, _ = get_scheduler({})
+    scheduler.restrict({VNET_LIST})
+    scheduler.submit(NIC_LIST)
+    assert not scheduler
+    assert scheduler.pruned == {NIC_LIST}
+    scheduler.allow({NIC_LIST})
+    scheduler.submit(NIC_LIST)
+    assert scheduler.pop() == NIC_LIST
+
+
+def test_starved_cycles():
+    nic_arg = InferAPIArg(NIC_LIST, "subnet")
+    scheduler, _ = get_scheduler(
+        {SUBNET_LIST: ["vnet-name"], NIC_LIST: ["subnet"], VNET_LIST: ["x"]},
+        {SUBNET_LIST: [nic_arg], NIC_LIST: [VNET_NAME]},
+    )
+    for api in (SUBNET_LIST, NIC_LIST, VNET_LIST):
+        scheduler.submit(api)
+    assert not scheduler
+    assert scheduler.get_starved_apis() == {
+        SUBNET_LIST: {VNET_NAME},
+        NIC_LIST: {nic_arg},
+        VNET_LIST: {InferAPIArg(VNET_LIST, "x")},
+    }
+    assert scheduler.get_cycles() == [{SUBNET_LIST, NIC_LIST}]
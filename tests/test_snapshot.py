@@ -0,0 +1,152 @@
+"""
+Checks of compiling rule files into a snapshot and loading them back.
+Run from the repository root with the config files in place, like lilac itself:
+
+    python -m pytest tests
+"""
+
+import os
+import json
+
+import pytest
+
+from lilac.inferRule import (
+    InferRule,
+    RuleSnapshot,
+    LazyRuleLoader,
+    AzureResponseInfo,
+    load_fragments,
+    load_infer_rule,
+    merge_fragments,
+    compile_rule_file,
+    write_rule_snapshot,
+)
+from lilac.queryRule import AzureQueryRule
+
+GROUP = "/subscriptions/sub/resourceGroups/rg1"
+VNET = {
+    "id": f"{GROUP}/providers/Microsoft.Network/virtualNetworks/v1",
+    "name": "v1",
+    "resourceGroup": "rg1",
+    "type": "Microsoft.Network/virtualNetworks",
+}
+VNET_LIST = {
+    "cloud_type": "Microsoft.Network/virtualNetworks",
+    "api_call": "az network vnet list",
+    "args": [{"name": "resource-group", "val": "rg1", "schema": []}],
+    "response": json.dumps([VNET]),
+}
+DISK = {
+    "id": f"{GROUP}/providers/Microsoft.Compute/disks/d1",
+    "name": "d1",
+    "resourceGroup": "rg1",
+    "type": "Microsoft.Compute/disks",
+}
+DISK_LIST = {
+    "cloud_type": "Microsoft.Compute/disks",
+    "api_call": "az disk list",
+    "args": [{"name": "resource-group", "val": "rg1", "schema": []}],
+    "response": json.dumps([DISK]),
+}
+
+
+def get_rule(tftype: str, resource: dict, api_call: dict) -> dict:
+    return {
+        "tftype": tftype,
+        "targetID": resource["id"],
+        "IDformat": "x",
+        "IDschema": [
+            {
+                "component": "ID",
+                "schemas": [{"api_call": api_call["api_call"], "schema": "[0].id"}],
+            }
+        ],
+        "api_chain": [[api_call]],
+    }
+
+
+RULES = {
+    "vnet.json": get_rule("azurerm_virtual_network", VNET, VNET_LIST),
+    "disk.json": get_rule("azurerm_managed_disk", DISK, DISK_LIST),
+}
+
+
+def load_fragment(path: str):
+    return compile_rule_file(path, AzureQueryRule.load, AzureResponseInfo)
+
+
+@pytest.fixture
+def rule_files(tmp_path) -> list:
+    paths = []
+    for name, rule in RULES.items():
+        path = str(tmp_path / name)
+        with open(path, "w") as f:
+            json.dump(rule, f)
+        paths.append(path)
+    return paths
+
+
+@pytest.fixture
+def snapshot_path(tmp_path, rule_files) -> str:
+    fragments, stale = load_fragments(rule_files, load_fragment)
+    assert stale == rule_files
+    path = str(tmp_path / "snapshot.bin")
+    write_rule_snapshot(path, fragments, merge_fragments(fragments, AzureResponseInfo))
+    return path
+
+
+def test_snapshot_loads_the_compiled_rules(rule_files, snapshot_path):
+    infer_rule, stale = load_infer_rule(
+        rule_files, load_fragment, AzureResponseInfo, snapshot_path
+    )
+    assert stale == []
+    assert set(infer_rule.api_response_map) == {"az network vnet list", "az disk list"}
+    assert set(infer_rule.tfid_components) == {
+        "azurerm_virtual_network",
+        "azurerm_managed_disk",
+    }
+
+
+def test_snapshot_closes_after_loading(rule_files, snapshot_path):
+    # unpickled objects do not keep the mapped pages exported
+    snapshot = RuleSnapshot(snapshot_path)
+    fragment = snapshot.get_fragment(rule_files[0])
+    snapshot.close()
+    assert set(fragment.api_response_map) == {"az network vnet list"}
+
+
+def test_changed_rule_files_are_read_again(rule_files, snapshot_path):
+    with open(rule_files[1], "a") as f:
+        f.write("\n")
+    infer_rule, stale = load_infer_rule(
+        rule_files, load_fragment, AzureResponseInfo, snapshot_path
+    )
+    assert stale == [rule_files[1]]
+    assert set(infer_rule.api_response_map) == {"az network vnet list", "az disk list"}
+
+
+def test_outdated_snapshots_are_ignored(rule_files, snapshot_path):
+    with open(snapshot_path, "r+b") as f:
+        f.seek(8)
+        f.write(b"\xff")
+    with pytest.raises(ValueError):
+        RuleSnapshot(snapshot_path)
+    infer_rule, stale = load_infer_rule(
+        rule_files, load_fragment, AzureResponseInfo, snapshot_path
+    )
+    assert stale == rule_files
+    assert os.path.exists(snapshot_path)
+
+
+@pytest.mark.parametrize(
+    "tftypes, loaded",
+    [(None, ["vnet.json", "disk.json"]), ({"azurerm_managed_disk"}, ["disk.json"])],
+)
+def test_lazy_loading(rule_files, snapshot_path, tftypes, loaded):
+    loader = LazyRuleLoader(snapshot_path, rule_files, load_fragment)
+    infer_rule = InferRule(AzureResponseInfo)
+    assert loader.load_stale(infer_rule) == []
+    cloud_types = {"Microsoft.Network/virtualNetworks", "Microsoft.Compute/disks"}
+    files = loader.load_cloud_types(infer_rule, cloud_types, tftypes)
+    assert [os.path.basename(path) for path in files] == loaded
+    assert set(infer_rule.tfid_components) == {RULES[name]["tftype"] for name in loaded}
@@ -0,0 +1,101 @@
+"""
+Checks of the persisted state of incremental lifts.
+Run from the repository root with the config files in place, like lilac itself:
+
+    python -m pytest tests
+"""
+
+import pytest
+
+from lilac.inferWorker import AzureInferWorker
+from lilac.inferWorker.base import ImportInstance
+from lilac.inferWorker.state import LiftState, ResponseDigest
+
+VNETS = [{"name": "v1", "etag": "1"}, {"name": "v2", "etag": "1"}]
+LIST = "az network vnet list -g rg"
+SHOW = "az network vnet show -g rg --name v1"
+VNET = (
+    "/subscriptions/sub/resourceGroups/rg/providers/Microsoft.Network/virtualNetworks"
+)
+MATCHES = {"$.id": [((), "/vnets/v1")]}
+
+
+def save_lift(path: str, vnets: list) -> LiftState:
+    state = LiftState(path)
+    state.record(LIST, vnets)
+    state.record(SHOW, {"id": "/vnets/v1"}, MATCHES)
+    state.save([ImportInstance("azurerm_virtual_network", "v1", "/vnets/v1")])
+    return LiftState(path)
+
+
+def test_pages_hash_like_the_whole_response():
+    pages, whole = ResponseDigest(), ResponseDigest()
+    pages.update(VNETS[:1])
+    pages.update(VNETS[1:])
+    whole.update(VNETS)
+    assert pages.get_state() == whole.get_state()
+    assert len(whole.get_state()["records"]) == 2
+
+
+def test_record_pages(tmp_path):
+    state = save_lift(str(tmp_path / "rg.json"), VNETS)
+    assert state.loaded
+    assert state.record(LIST, VNETS[:1], last=False) is None
+    assert state.record(LIST, VNETS[1:]) is True
+    assert state.record(SHOW, {"id": "/vnets/v1", "tags": {}}, MATCHES) is False
+
+
+def test_unchanged_records(tmp_path):
+    state = save_lift(str(tmp_path / "rg.json"), VNETS)
+    # v2 changed and moved first
+    state.record(LIST, [{"name": "v2", "etag": "2"}, VNETS[0]])
+    assert not state.is_unchanged_record(LIST, (0,))
+    assert state.is_unchanged_record(LIST, (1,))
+    # the whole list changed
+    assert not state.is_unchanged_record(LIST, ())
+    # records of calls that did not run in this lift are unknown
+    assert not state.is_unchanged_record("az vm list -g rg", (0,))
+
+
+def test_revalidate(tmp_path):
+    path = str(tmp_path / "rg.json")
+    state = save_lift(path, VNETS)
+    assert state.revalidate(SHOW, ["$.id"]) == MATCHES
+    # values of jsonpaths added since the previous lift were not saved
+    assert state.revalidate(SHOW, ["$.id", "$.name"]) is None
+    # listings are not revalidated
+    assert state.revalidate(LIST, ["$[*].name"]) is None
+    # revalidated calls are kept for the next lift
+    state.save([])
+    assert LiftState(path).revalidate(SHOW, ["$.id"]) == MATCHES
+
+
+def test_names_and_diff(tmp_path):
+    state = save_lift(str(tmp_path / "rg.json"), VNETS)
+    assert state.get_name("azurerm_virtual_network", "/vnets/v1") == "v1"
+    added, removed = state.diff(
+        [ImportInstance("azurerm_virtual_network", "v2", "/vnets/v2")]
+    )
+    assert [instance.id for instance in added] == ["/vnets/v2"]
+    assert removed == [
+        {"tftype": "azurerm_virtual_network", "name": "v1", "id": "/vnets/v1"}
+    ]
+
+
+@pytest.fixture
+def worker(tmp_path, monkeypatch):
+    (tmp_path / "cache").mkdir()
+    monkeypatch.chdir(tmp_path)
+    return AzureInferWorker("rg")
+
+
+def test_instance_names(worker):
+    ids = {f"{VNET}/v1", f"{VNET}/v1.x", f"{VNET}/v1_x", f"{VNET}/1a", f"{VNET}/v2/"}
+    names = worker._get_instance_names("azurerm_virtual_network", ids)
+    assert names[f"{VNET}/v1"] == "v1"
+    assert names[f"{VNET}/1a"] == "_1a"
+    assert names[f"{VNET}/v2/"] == "v2"
+    # names must be unique, a taken one gets a hash of the ID
+    assert names[f"{VNET}/v1.x"] == "v1_x"
+    assert names[f"{VNET}/v1_x"].startswith("v1_x_")
+    assert len(set(names.values())) == len(ids)
@@ -0,0 +1,100 @@
+"""
+Checks of parsing list outputs item by item, and of caching streamed outputs.
+Run from the repository root with the config files in place, like lilac itself:
+
+    python -m pytest tests
+"""
+
+import io
+import json
+import random
+import subprocess
+
+import pytest
+
+from lilac.utils import ResponseCache
+from lilac.queryBackend import runner
+from lilac.queryBackend.stream import iter_json_array
+
+STRINGS = ['a"b\\c]}{[', "", "ü\n", "x" * 100]
+
+
+def random_value(rng: random.Random, depth=0):
+    r = rng.random()
+    if depth > 3 or r < 0.3:
+        return rng.choice(STRINGS + [1, -2.5e3, 12345678901234, True, None, 0.25])
+    if r < 0.6:
+        return [random_value(rng, depth + 1) for _ in range(rng.randint(0, 4))]
+    return {f"k{i}": random_value(rng, depth + 1) for i in range(rng.randint(0, 4))}
+
+
+def test_items_across_chunks():
+    rng = random.Random(0)
+    for _ in range(200):
+        items = [random_value(rng) for _ in range(rng.randint(0, 5))]
+        text = json.dumps(items, indent=rng.choice([None, 2]))
+        for chunk_size in (1, 2, 7, 64):
+            assert list(iter_json_array(io.StringIO(text), chunk_size)) == items
+
+
+@pytest.mark.parametrize(
+    "text, items", [("", []), (" [ ] ", []), ("2.5", [2.5]), ('{"a": 1}', [{"a": 1}])]
+)
+def test_other_outputs(text: str, items: list):
+    assert list(iter_json_array(io.StringIO(text), 2)) == items
+
+
+@pytest.mark.parametrize("text", ["[1,", '[{"a":', "[1 2]"])
+def test_truncated_outputs(text: str):
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.StringIO(text), 2))
+
+
+class ListBackend:
+    """
+    Query backend streaming the same list for every command.
+    """
+
+    def __init__(self, items: list, fail_after=None):
+        self.items = items
+        self.fail_after = fail_after
+        self.calls = 0
+
+    def stream(self, cmd: str):
+        self.calls += 1
+        for i, item in enumerate(self.items):
+            if i == self.fail_after:
+                raise subprocess.CalledProcessError(1, cmd, stderr="failed")
+            yield item
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), {"default": 300})
+    monkeypatch.setattr(runner, "get_response_cache", lambda: cache)
+    return cache
+
+
+def test_streamed_outputs_are_cached(cache, monkeypatch):
+    items = [{"id": f"/r/{i}", "name": "ü" * i} for i in range(1000)]
+    backend = ListBackend(items)
+    monkeypatch.setattr(runner, "get_query_backend", lambda: backend)
+    # written to the cache in small chunks
+    monkeypatch.setattr("lilac.utils.responseCache.CHUNK_SIZE", 7)
+    assert list(runner.stream_cloud_cmd("az vm list", "sub")) == items
+    # read back by streamed and whole commands
+    assert list(runner.stream_cloud_cmd("az vm list", "sub")) == items
+    assert json.loads(runner.run_cloud_cmd("az vm list", "sub").stdout) == items
+    assert backend.calls == 1
+
+
+def test_failed_streams_are_not_cached(cache, monkeypatch):
+    backend = ListBackend([{"id": "a"}, {"id": "b"}], fail_after=1)
+    monkeypatch.setattr(runner, "get_query_backend", lambda: backend)
+    with pytest.raises(subprocess.CalledProcessError):
+        list(runner.stream_cloud_cmd("az vm list", "sub"))
+    assert cache.get("az vm list", "sub") is None
+    # nor are commands that change the infrastructure
+    backend = ListBackend([{"id": "a"}])
+    list(runner.stream_cloud_cmd("az vm create --name a", "sub"))
+    assert cache.get("az vm create --name a", "sub") is None
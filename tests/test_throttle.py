@@ -0,0 +1,116 @@
+"""
+Checks of throttling the query backends against the local ARM stub.
+Run from the repository root with the config files in place, like lilac itself:
+
+    python -m pytest tests
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from lilac.queryBackend import StubARMServer, ResidentBackend, ThrottledBackend
+from lilac.queryBackend.throttle import AdaptiveLimiter, get_throttle_scope
+
+SUBSCRIPTION = "sub"
+RESOURCES = [
+    {
+        "id": f"/subscriptions/{SUBSCRIPTION}/resourceGroups/rg{i % 2}"
+        f"/providers/Microsoft.Compute/disks/d{i}",
+        "name": f"d{i}",
+        "type": "Microsoft.Compute/disks",
+    }
+    for i in range(7)
+]
+
+
+def get_backend(server: StubARMServer, **kwargs) -> ThrottledBackend:
+    options = dict(
+        rate=0,
+        burst=1,
+        max_concurrency=4,
+        max_retries=5,
+        backoff_base=0.01,
+        backoff_max=0.05,
+    )
+    options.update(kwargs)
+    return ThrottledBackend(
+        ResidentBackend(server.endpoint, SUBSCRIPTION, token="stub"), **options
+    )
+
+
+def test_throttled_commands_are_retried():
+    with StubARMServer(
+        RESOURCES, SUBSCRIPTION, throttle_every=3, retry_after=0
+    ) as server:
+        backend = get_backend(server)
+        with ThreadPoolExecutor(4) as executor:
+            results = list(
+                executor.map(
+                    backend.run, [f"az resource list -g rg{i % 2}" for i in range(9)]
+                )
+            )
+        assert all(result.returncode == 0 for result in results)
+        assert server.throttled > 0
+        assert backend.throttled == server.throttled
+
+
+def test_throttled_stream_is_retried_before_items():
+    with StubARMServer(
+        RESOURCES, SUBSCRIPTION, throttle_every=2, retry_after=0
+    ) as server:
+        backend = get_backend(server)
+        backend.run("az group list")
+        # the second request is throttled, the stream starts over
+        items = list(backend.stream("az resource list -g rg1"))
+        assert [item["name"] for item in items] == ["d1", "d3", "d5"]
+        assert backend.throttled == 1
+
+
+def test_retries_give_up():
+    with StubARMServer(RESOURCES, SUBSCRIPTION, throttle_every=1) as server:
+        backend = get_backend(server, max_retries=2)
+        result = backend.run("az resource list")
+        assert result.returncode == 1
+        assert "TooManyRequests" in result.stderr
+        assert server.throttled == 3
+
+
+def test_limiter_aimd():
+    limiter = AdaptiveLimiter(rate=0, burst=1, max_concurrency=8)
+    start = limiter.acquire()
+    limiter.release(start, throttled=True)
+    assert limiter.limit == 4
+    # requests started before the decrease were throttled by the old limit
+    limiter.release(start, throttled=True)
+    assert limiter.limit == 4
+    limiter.release(limiter.acquire(), throttled=True)
+    assert limiter.limit == 2
+    for _ in range(4):
+        limiter.release(limiter.acquire(), throttled=False)
+    assert 3 < limiter.limit <= 4
+    for _ in range(100):
+        limiter.release(limiter.acquire(), throttled=False)
+    assert limiter.limit == 8
+
+
+def test_limiter_pauses_on_retry_after():
+    limiter = AdaptiveLimiter(rate=0, burst=1, max_concurrency=2)
+    limiter.release(limiter.acquire(), throttled=True, retry_after=0.2)
+    start = time.monotonic()
+    limiter.release(limiter.acquire(), throttled=False)
+    assert time.monotonic() - start >= 0.15
+
+
+def test_throttle_scopes():
+    assert get_throttle_scope("az vm list -g rg --subscription s1") == (
+        "s1",
+        "microsoft.compute",
+    )
+    scope = get_throttle_scope(
+        "az rest --url https://x/subscriptions/1/providers/Microsoft.Web/sites"
+    )
+    assert scope[1] == "microsoft.web"
+    assert get_throttle_scope("gcloud beta compute instances list --project=p") == (
+        "p",
+        "gcloud compute",
+    )
@@ -0,0 +1,67 @@
+"""
+Checks of looking up the APIs of a cloud type and of its child types.
+Run from the repository root with the config files in place, like lilac itself:
+
+    python -m pytest tests
+"""
+
+import random
+
+from lilac.inferRule import InferRule, AzureResponseInfo
+from lilac.inferRule.base import CloudTypeIndex
+
+SEGMENTS = ["Microsoft.Network", "virtualNetworks", "subnets", "Disks", "x"]
+
+
+def random_type(rng: random.Random) -> str:
+    return "/".join(rng.choice(SEGMENTS) for _ in range(rng.randint(1, 4)))
+
+
+def scan(types: dict, cloud_type: str, children: bool) -> set:
+    """
+    Values of the cloud type, and of its child types if `children`, by a scan.
+    """
+    key = cloud_type.lower()
+    return {
+        value
+        for other, values in types.items()
+        for value in values
+        if other.lower() == key or children and other.lower().startswith(key + "/")
+    }
+
+
+def test_index_matches_a_scan():
+    rng = random.Random(0)
+    for _ in range(200):
+        index, types = CloudTypeIndex(), {}
+        for i in range(rng.randint(0, 8)):
+            cloud_type = random_type(rng)
+            index.add(cloud_type, f"api{i}")
+            types.setdefault(cloud_type, set()).add(f"api{i}")
+        for _ in range(5):
+            cloud_type = random_type(rng)
+            if rng.random() < 0.5:
+                cloud_type = cloud_type.upper()
+            for children in (True, False):
+                assert index.get(cloud_type, children) == scan(
+                    types, cloud_type, children
+                ), (types, cloud_type)
+
+
+def test_segments_are_not_prefixes():
+    index = CloudTypeIndex()
+    index.add("Microsoft.Network/virtualNetworks", "az network vnet list")
+    assert index.get("microsoft.network/virtualnetworks") == {"az network vnet list"}
+    assert index.get("Microsoft.Network/virtualNetwork") == set()
+    assert index.get("Microsoft.Network/virtualNetworks/subnets") == set()
+
+
+def test_infer_rule_lookup():
+    infer_rule = InferRule(AzureResponseInfo)
+    infer_rule.cloudtype_index.add("Microsoft.Network/virtualNetworks", "vnet list")
+    infer_rule.cloudtype_index.add(
+        "Microsoft.Network/virtualNetworks/subnets", "subnet list"
+    )
+    vnets = "microsoft.network/VIRTUALNETWORKS"
+    assert infer_rule.get_cloudtype_apis(vnets) == {"vnet list", "subnet list"}
+    assert infer_rule.get_cloudtype_apis(vnets, children=False) == {"vnet list"}